@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+
+from chatbot.batch import BatchRunner, completed_ids, open_input, open_output, read_conversations
+from chatbot.openai_handler import OpenAIHandler
+from chatbot.scheduler import PRIORITY_BATCH, RequestScheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer prompts or replay scripted conversations from JSONL, without speech. "
+                    "Input lines are {\"id\": ..., \"prompt\": \"...\"} or {\"id\": ..., \"turns\": [\"...\", ...]}; "
+                    "an interrupted run resumes from its output file."
+    )
+    parser.add_argument("input", help="JSONL input file, or - for stdin")
+    parser.add_argument("output", help="JSONL output file; results are appended as conversations finish")
+    parser.add_argument("--workers", type=int, default=8, help="Conversations run concurrently")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--requests-per-minute", type=int, default=None, help="Account limit to stay under")
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="Account limit to stay under")
+    parser.add_argument("--restart", action="store_true", help="Overwrite the output instead of resuming")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("openai_token")
+    if not api_key:
+        print("Error: OpenAI API key not found in environment variable 'openai_token'.")
+        sys.exit(1)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    skip = completed_ids(args.output)
+    if skip:
+        print(f"Resuming: {len(skip)} conversations already done.")
+
+    # One scheduler for every worker, so together they stay under the account limits
+    scheduler = RequestScheduler(args.requests_per_minute, args.tokens_per_minute)
+    runner = BatchRunner(
+        lambda: OpenAIHandler(api_key=api_key, model=args.model, max_tokens=args.max_tokens, finish_check="none",
+                              scheduler=scheduler, priority=PRIORITY_BATCH),
+        workers=args.workers
+    )
+    with open_input(args.input) as lines, open_output(args.output) as output:
+        try:
+            runner.run(read_conversations(lines), output, skip,
+                       on_result=lambda result: print(f"{result['id']}: {'error' if 'error' in result else 'done'}",
+                                                      file=sys.stderr))
+        except KeyboardInterrupt:
+            print("\nInterrupted; run again with the same output file to resume.")
+    print(f"Completed {runner.completed}, failed {runner.failed}, skipped {runner.skipped}.")
+
+
+if __name__ == "__main__":
+    main()
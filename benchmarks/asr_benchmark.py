@@ -0,0 +1,258 @@
+"""
+Speech recognition benchmark: real-time factor and word error rate per backend.
+
+Every WAV in the corpus goes through the capture path (WavFileSource ->
+AudioCapture -> Segmenter) and is transcribed by each backend. Streaming
+backends transcribe while the audio is captured, as they do live.
+
+The corpus is `asr_corpus/manifest.jsonl` (one {"audio", "text"} per line)
+with 16 kHz 16-bit mono WAV recordings of people reading the text next to it.
+`--record` records the missing ones from the microphone, prompting for each.
+
+`--render` is a smoke test only: it benchmarks TTS renders of the texts
+(written to `rendered/` in the corpus directory and converted to 16 kHz mono)
+instead of the recordings, so the pipeline can be exercised without them. Its
+word error rate measures TTS -> ASR, not real speech, and is labelled so.
+
+    python -m benchmarks.asr_benchmark --record
+    python -m benchmarks.asr_benchmark --backend vosk --vosk-model path/to/model
+    python -m benchmarks.asr_benchmark --render
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import wave
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+# chatbot.speech_recognizer (and the ASR libraries it loads) is imported once
+# the corpus is known to be there, so a missing corpus is reported right away
+from chatbot.capture import SAMPLE_RATE, SAMPLE_WIDTH, AudioCapture, MicrophoneSource, segment_wav
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "asr_corpus")
+# Subdirectory of a corpus holding the TTS renders of --render
+RENDERED_DIR = "rendered"
+# Silence kept around each recorded utterance
+RECORDING_PADDING_SECONDS = 0.3
+
+
+def normalize(text: str) -> List[str]:
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def word_errors(reference: Sequence[str], hypothesis: Sequence[str]) -> int:
+    """Word-level Levenshtein distance (substitutions + deletions + insertions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def load_corpus(corpus_dir: str) -> List[Dict[str, str]]:
+    with open(os.path.join(corpus_dir, "manifest.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def missing_recordings(corpus_dir: str, corpus: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [entry for entry in corpus if not os.path.exists(os.path.join(corpus_dir, entry["audio"]))]
+
+
+def require_recordings(corpus_dir: str, corpus: List[Dict[str, str]]) -> None:
+    """Exit with instructions if recordings are missing."""
+    missing = missing_recordings(corpus_dir, corpus)
+    if missing:
+        names = ", ".join(entry["audio"] for entry in missing)
+        sys.exit(f"{len(missing)} recordings missing from {corpus_dir}: {names}\n"
+                 f"Record them with --record, or run a smoke test on TTS renders with --render.")
+
+
+def require_vosk_model(model_path: str) -> None:
+    """Exit with instructions if the Vosk model directory is missing."""
+    if not os.path.isdir(model_path):
+        sys.exit(f"Vosk model not found at {model_path}: download one from https://alphacephei.com/vosk/models "
+                 f"and pass its directory with --vosk-model.")
+
+
+def write_wav(path: str, audio: bytes, sample_rate: int = SAMPLE_RATE) -> None:
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(audio)
+
+
+def record_corpus(corpus_dir: str, corpus: List[Dict[str, str]]) -> None:
+    """Record the missing corpus files from the microphone, one prompted utterance each."""
+    missing = missing_recordings(corpus_dir, corpus)
+    if not missing:
+        return
+    padding = bytes(int(RECORDING_PADDING_SECONDS * SAMPLE_RATE) * SAMPLE_WIDTH)
+    with AudioCapture(MicrophoneSource()) as capture:
+        for entry in missing:
+            while True:
+                input(f"Press Enter, then say: {entry['text']!r}")
+                utterance = capture.next_utterance(timeout=15)
+                if utterance is not None:
+                    break
+                print("Nothing heard, try again.")
+            write_wav(os.path.join(corpus_dir, entry["audio"]), padding + utterance.audio + padding)
+            print(f"  saved {entry['audio']} ({utterance.duration:.1f}s)")
+
+
+def read_pcm(path: str) -> Tuple[array, int, int]:
+    """16-bit samples, channel count and sample rate of a WAV or AIFF file (pyttsx3 writes AIFF on macOS)."""
+    try:
+        with wave.open(path, "rb") as wav:
+            params = wav.getsampwidth(), wav.getnchannels(), wav.getframerate()
+            data, big_endian = wav.readframes(wav.getnframes()), False
+    except wave.Error:
+        # aifc is deprecated (removed in Python 3.13) but is the only stdlib AIFF reader
+        import aifc
+
+        with aifc.open(path, "rb") as aiff:
+            params = aiff.getsampwidth(), aiff.getnchannels(), aiff.getframerate()
+            data, big_endian = aiff.readframes(aiff.getnframes()), True
+    sample_width, channels, sample_rate = params
+    if sample_width != SAMPLE_WIDTH:
+        raise ValueError(f"{path}: expected 16-bit audio, got {sample_width * 8}-bit")
+    samples = array("h", data)
+    if big_endian != (sys.byteorder == "big"):
+        samples.byteswap()
+    return samples, channels, sample_rate
+
+
+def to_corpus_wav(source_path: str, path: str) -> None:
+    """Convert a rendered file to the corpus format: 16 kHz 16-bit mono WAV."""
+    samples, channels, sample_rate = read_pcm(source_path)
+    if channels > 1:
+        samples = array("h", (sum(samples[i:i + channels]) // channels for i in range(0, len(samples), channels)))
+    if sample_rate != SAMPLE_RATE:
+        # Linear interpolation; fine for speech headed to a 16 kHz recognizer
+        count = len(samples) * SAMPLE_RATE // sample_rate
+        step = sample_rate / SAMPLE_RATE
+        resampled = array("h", bytes(count * SAMPLE_WIDTH))
+        for i in range(count):
+            position = i * step
+            index = int(position)
+            following = samples[min(index + 1, len(samples) - 1)]
+            resampled[i] = int(samples[index] + (following - samples[index]) * (position - index))
+        samples = resampled
+    write_wav(path, samples.tobytes())
+
+
+def render_corpus(corpus_dir: str, corpus: List[Dict[str, str]]) -> str:
+    """
+    Smoke test: speak every text with the TTS engine into the corpus's rendered
+    directory, in the corpus format, and return that directory.
+    """
+    try:
+        import pyttsx3
+        engine = pyttsx3.init()
+    except Exception as e:
+        sys.exit(f"Cannot render the corpus, the TTS engine failed to start: {e}\n"
+                 f"Install a speech engine for pyttsx3 (e.g. espeak-ng on Linux) or record the corpus with --record.")
+
+    rendered_dir = os.path.join(corpus_dir, RENDERED_DIR)
+    os.makedirs(rendered_dir, exist_ok=True)
+    raw_paths = []
+    for entry in corpus:
+        path = os.path.join(rendered_dir, entry["audio"])
+        if not os.path.exists(path):
+            raw_paths.append((f"{path}.raw", path))
+            engine.save_to_file(entry["text"], f"{path}.raw")
+    engine.runAndWait()
+    for raw_path, path in raw_paths:
+        to_corpus_wav(raw_path, path)
+        os.remove(raw_path)
+    return rendered_dir
+
+
+def wav_duration(path: str) -> float:
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def run(backend, corpus_dir: str, corpus: List[Dict[str, str]]) -> Dict[str, float]:
+    from chatbot.speech_recognizer import StreamingTranscriber, transcribe_utterance
+
+    audio_seconds = 0.0
+    processing_seconds = 0.0
+    errors = 0
+    reference_words = 0
+    first_partials: List[float] = []
+
+    for entry in corpus:
+        path = os.path.join(corpus_dir, entry["audio"])
+        listeners = []
+        partial_times: List[float] = []
+        if backend.streaming:
+            listeners.append(StreamingTranscriber(backend, lambda text: partial_times.append(time.perf_counter())))
+
+        start = time.perf_counter()
+        utterances = segment_wav(path, listeners=listeners)
+        texts = [transcribe_utterance(backend, utterance) or "" for utterance in utterances]
+        processing_seconds += time.perf_counter() - start
+        audio_seconds += wav_duration(path)
+        if partial_times:
+            first_partials.append(partial_times[0] - start)
+
+        reference = normalize(entry["text"])
+        hypothesis = normalize(" ".join(texts))
+        errors += word_errors(reference, hypothesis)
+        reference_words += len(reference)
+        print(f"  {entry['audio']}: {' '.join(hypothesis)!r}")
+
+    results = {
+        "files": len(corpus),
+        "audio_seconds": audio_seconds,
+        "rtf": processing_seconds / audio_seconds if audio_seconds else 0.0,
+        "wer": errors / reference_words if reference_words else 0.0,
+    }
+    if first_partials:
+        # Measured from the start of the file, which is read faster than real time here
+        results["mean_first_partial_seconds"] = sum(first_partials) / len(first_partials)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", action="append", choices=["google", "vosk"],
+                        help="Backend to benchmark (repeatable, default: google)")
+    parser.add_argument("--vosk-model", default="model", help="Path to the Vosk model directory")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="Corpus directory containing manifest.jsonl")
+    parser.add_argument("--record", action="store_true", help="Record the missing corpus files from the microphone")
+    parser.add_argument("--render", action="store_true",
+                        help="Smoke test on TTS renders of the texts instead of the recordings (not real speech)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    backends = args.backend or ["google"]
+    if "vosk" in backends:
+        require_vosk_model(args.vosk_model)
+    if args.record:
+        record_corpus(args.corpus, corpus)
+    if args.render:
+        audio_dir, audio = render_corpus(args.corpus, corpus), "rendered by TTS (smoke test, not real speech)"
+    else:
+        require_recordings(args.corpus, corpus)
+        audio_dir, audio = args.corpus, "recorded"
+
+    from chatbot.speech_recognizer import create_asr_backend
+
+    for name in backends:
+        options = {"model_path": args.vosk_model} if name == "vosk" else {}
+        backend = create_asr_backend(name, **options)
+        print(f"{name} ({audio} audio):")
+        results = run(backend, audio_dir, corpus)
+        results["audio"] = audio
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
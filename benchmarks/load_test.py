@@ -0,0 +1,269 @@
+"""
+End-to-end load test against the local mock chat completions server.
+
+Runs `--sessions` concurrent conversations, each with its own OpenAIHandler,
+through the same path as the voice bot: (speech recognition,) streaming reply
+split into sentences and handed to TTS. Each session plays `--turns` turns of
+the script, which mixes questions with a support ticket flow (a function call
+completed by the local slot filler).
+
+Reported: turns/sec, p50/p95/p99 turn latency (user turn to the end of the
+reply) and time to first audio (to the first sentence reaching the audio sink).
+
+Audio is never played:
+  --tts none    (default) the first sentence handed to TTS counts as first audio
+  --tts engine  sentences are rendered by the TTS engine into a null audio sink
+                (one engine per process, so only with --sessions 1)
+Text turns are used by default; --audio feeds the WAVs of the ASR corpus through
+SpeechRecognizer instead (--asr-backend google needs network access).
+
+With --baseline the results are compared against a stored run and the exit
+status is 1 if a latency metric rose, or throughput fell, by more than
+--tolerance. --save-baseline stores the current run.
+
+    python -m benchmarks.load_test --sessions 8 --turns 10
+    python -m benchmarks.load_test --save-baseline benchmarks/baselines/load_test.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from benchmarks.mock_openai import MockOpenAIServer
+from chatbot.openai_handler import OpenAIHandler, ticket_reply
+from chatbot.routing import quantile
+from chatbot.speech_text import SPEECH, SpeechStream
+from chatbot.tools import ToolRegistry
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "load_test.json")
+
+# A conversation: questions, then a ticket with every field given in one turn
+SCRIPT = [
+    "Hi, my laptop will not connect to the office wifi.",
+    "I already restarted it, what else can I try?",
+    "Please open a ticket. I'm Ann Smith, ann.smith@example.com, my laptop is not connecting to the wifi.",
+    "What are the support hours?",
+    "Thanks for the help.",
+]
+
+# Metrics compared against the baseline: name -> True if higher is better
+COMPARED_METRICS = {
+    "turns_per_second": True,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "first_audio_p50": False,
+    "first_audio_p95": False,
+    "first_audio_p99": False,
+}
+
+BENCHMARK_TOOLS = ToolRegistry()
+
+
+@BENCHMARK_TOOLS.tool(description="Creates a support ticket with the provided user details and issue description.",
+                      interactive=True, reply=ticket_reply)
+def CreateTicket(name: str, email: str, issue: str, contact_number: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parameters:
+        name (str): The name of the user.
+        email (str): The user's email address.
+        issue (str): Description of the issue.
+        contact_number (str): The user's contact number (optional).
+    """
+    # Same as the real tool without printing, so the output stays readable under load
+    return {"ticket_id": "12345", "name": name, "email": email, "issue": issue, "status": "Open"}
+
+
+class NullAudioSink:
+    """TTS audio sink that discards the audio and notes when the first sentence would have played."""
+
+    def __init__(self):
+        self.first_audio: Optional[float] = None
+        self.event = threading.Event()
+
+    def __call__(self, path: str) -> None:
+        if self.first_audio is None:
+            self.first_audio = time.perf_counter()
+            self.event.set()
+
+    def reset(self) -> None:
+        self.first_audio = None
+        self.event.clear()
+
+
+class TextSpeaker:
+    """Stands in for TTS with --tts none: the first sentence enqueued counts as first audio."""
+
+    def __init__(self):
+        self.sink = NullAudioSink()
+
+    def enqueue(self, text: str) -> bool:
+        self.sink(text)
+        return True
+
+    def wait_first_audio(self, timeout: float) -> Optional[float]:
+        return self.sink.first_audio
+
+
+class EngineSpeaker:
+    """Real TTS synthesis into a null audio sink."""
+
+    def __init__(self):
+        from chatbot.tts import TTS
+
+        self.sink = NullAudioSink()
+        self.tts = TTS(audio_sink=self.sink)
+
+    def enqueue(self, text: str) -> bool:
+        return self.tts.enqueue(text)
+
+    def wait_first_audio(self, timeout: float) -> Optional[float]:
+        self.sink.event.wait(timeout)
+        self.tts.flush().wait(timeout)
+        return self.sink.first_audio
+
+
+def audio_turns(backend_name: str, vosk_model: Optional[str]):
+    """Turn producers for the ASR corpus: each returns the transcript of one WAV through SpeechRecognizer."""
+    from benchmarks.asr_benchmark import CORPUS_DIR as ASR_CORPUS_DIR, load_corpus
+    from chatbot.capture import AudioCapture, WavFileSource
+    from chatbot.speech_recognizer import SpeechRecognizer, create_asr_backend
+
+    options = {"model_path": vosk_model} if backend_name == "vosk" else {}
+    backend = create_asr_backend(backend_name, **options)
+
+    def make_turn(path: str):
+        def recognize() -> Optional[str]:
+            recognizer = SpeechRecognizer(capture=AudioCapture(WavFileSource(path)), backend=backend)
+            try:
+                return recognizer.listen()
+            finally:
+                recognizer.close()
+        return recognize
+
+    return [make_turn(os.path.join(ASR_CORPUS_DIR, entry["audio"])) for entry in load_corpus(ASR_CORPUS_DIR)]
+
+
+def run_session(url: str, turns: int, speaker_factory, turn_inputs, args) -> List[Dict[str, Any]]:
+    handler = OpenAIHandler(api_key="benchmark", model="gpt-4o-mini", api_url=url, tools=BENCHMARK_TOOLS,
+                            finish_check=args.finish_check, timeout=30)
+    speaker = speaker_factory()
+    results = []
+    for index in range(turns):
+        turn_input = turn_inputs[index % len(turn_inputs)]
+        speaker.sink.reset()
+        started = time.perf_counter()
+        try:
+            text = turn_input() if callable(turn_input) else turn_input
+            if not text:
+                results.append({"error": "nothing recognized"})
+                continue
+            for kind, segment in SpeechStream(handler.generate_response_stream(text)):
+                if kind == SPEECH:
+                    speaker.enqueue(segment)
+            ended = time.perf_counter()
+            first_audio = speaker.wait_first_audio(timeout=30)
+            results.append({
+                "latency": ended - started,
+                "first_audio": first_audio - started if first_audio is not None else None,
+            })
+        except Exception as e:
+            results.append({"error": str(e)})
+    handler.session.close()
+    return results
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    latencies = [result["latency"] for result in results if "latency" in result]
+    first_audio = [result["first_audio"] for result in results if result.get("first_audio") is not None]
+    summary: Dict[str, Any] = {
+        "turns": len(latencies),
+        "errors": sum(1 for result in results if "error" in result),
+        "turns_per_second": len(latencies) / elapsed if elapsed else 0.0,
+    }
+    for name, values in (("latency", latencies), ("first_audio", first_audio)):
+        for q in (50, 95, 99):
+            summary[f"{name}_p{q}"] = quantile(values, q / 100)
+    return summary
+
+
+def compare(summary: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """The metrics that regressed by more than `tolerance` relative to the baseline."""
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        current, previous = summary.get(metric), baseline.get(metric)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{metric}: {previous:.3f} -> {current:.3f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent conversations")
+    parser.add_argument("--turns", type=int, default=10, help="Turns per session")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock server seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--finish-check", default="local", choices=["llm", "local", "none"])
+    parser.add_argument("--tts", default="none", choices=["none", "engine"])
+    parser.add_argument("--audio", action="store_true", help="Recognize the ASR corpus WAVs instead of text turns")
+    parser.add_argument("--asr-backend", default="vosk", choices=["google", "vosk"])
+    parser.add_argument("--vosk-model", default="model")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", nargs="?", const=BASELINE_PATH, help="Compare against a stored run")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    if args.tts == "engine" and args.sessions != 1:
+        parser.error("--tts engine shares one speech engine per process; use --sessions 1")
+    speaker_factory = EngineSpeaker if args.tts == "engine" else TextSpeaker
+    turn_inputs = audio_turns(args.asr_backend, args.vosk_model) if args.audio else SCRIPT
+
+    with MockOpenAIServer(latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+                          rate_limit=args.rate_limit, seed=args.seed) as server:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            sessions = [executor.submit(run_session, server.url, args.turns, speaker_factory, turn_inputs, args)
+                        for _ in range(args.sessions)]
+            results = [result for session in sessions for result in session.result()]
+        elapsed = time.perf_counter() - started
+        server_stats = server.stats()
+
+    summary = summarize(results, elapsed)
+    config = {name: getattr(args, name) for name in ("sessions", "turns", "latency", "jitter", "tokens_per_second",
+                                                     "rate_limit", "finish_check", "tts", "audio")}
+    report = {"config": config, "summary": summary, "server": server_stats}
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Warning: the baseline was recorded with a different configuration: {baseline.get('config')}")
+        regressions = compare(summary, baseline["summary"], args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
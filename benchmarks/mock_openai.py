@@ -0,0 +1,284 @@
+"""
+Local mock of the OpenAI chat completions endpoint, for benchmarks and load tests.
+
+Replies arrive after `--latency` seconds (plus up to `--jitter`), then stream at
+`--tokens-per-second`; `delays` (in code) scripts the latency of the first
+requests instead, in the order they arrive. A `--rate-limit` fraction of
+requests is answered with 429 and a retry-after-ms header. When the last user message matches
+`--function-trigger` and tools are offered, the reply is a call to
+`--function-name` in the format the request used (`tools` or `functions`),
+with empty arguments so the handler fills them from the conversation, or
+`function_arguments` (in code). Streamed, the arguments arrive in fragments
+over several events, as from the real API. Tool results are answered with the
+text reply. Finish checks are answered "no".
+
+    python -m benchmarks.mock_openai --port 8089 --latency 0.3 --rate-limit 0.05
+
+Point a handler at it with api_url="http://127.0.0.1:8089/v1/chat/completions".
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Optional
+
+DEFAULT_REPLY = ("Sure, I can help with that. First, restart the application and sign in again. "
+                 "If the problem persists, clear the cache from the settings page. "
+                 "Let me know if that fixes it.")
+# Characters of streamed function call arguments per event
+ARGUMENT_FRAGMENT_CHARS = 6
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are expected; report anything else
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockOpenAIServer:
+    """A chat completions server on a background thread; `url` is the endpoint to pass as api_url."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.3, jitter: float = 0.1,
+                 tokens_per_second: float = 60.0, rate_limit: float = 0.0, retry_after_ms: int = 100,
+                 function_trigger: Optional[str] = r"\bticket\b", function_name: str = "CreateTicket",
+                 reply: str = DEFAULT_REPLY, seed: Optional[int] = None, delays: Iterable[float] = (),
+                 function_arguments: Optional[Dict[str, Any]] = None):
+        self.latency = latency
+        # Latencies of the next requests, overriding `latency` and `jitter` until used up
+        self.delays = deque(delays)
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit = rate_limit
+        self.retry_after_ms = retry_after_ms
+        self.function_trigger = re.compile(function_trigger, re.IGNORECASE) if function_trigger else None
+        self.function_name = function_name
+        self.function_arguments = json.dumps(function_arguments) if function_arguments else "{}"
+        self.reply = reply
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.function_calls = 0
+        self._ids = itertools.count()
+        self.server = _Server((host, port), self._handler_class())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> "MockOpenAIServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"requests": self.requests, "rate_limited": self.rate_limited,
+                    "function_calls": self.function_calls}
+
+    def _decide(self) -> bool:
+        """Count a request; True if it should be rate limited."""
+        with self.lock:
+            self.requests += 1
+            limited = self.rate_limit > 0 and self.random.random() < self.rate_limit
+            if limited:
+                self.rate_limited += 1
+            return limited
+
+    def _delay(self) -> float:
+        with self.lock:
+            if self.delays:
+                return self.delays.popleft()
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    def _function_call(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The tool to call for this request, or None for a text reply."""
+        if data.get("tool_choice") == "none" or data.get("function_call") == "none" or self.function_trigger is None:
+            return None
+        if "tools" in data:
+            offered = [tool["function"]["name"] for tool in data["tools"]]
+        else:
+            offered = [function["name"] for function in data.get("functions") or []]
+        if not offered:
+            return None
+        messages = data.get("messages") or [{}]
+        if messages[-1].get("role") != "user":
+            # The results of a call: answer them
+            return None
+        last_user = next((m.get("content") or "" for m in reversed(data.get("messages", [])) if m.get("role") == "user"), "")
+        if not self.function_trigger.search(last_user):
+            return None
+        with self.lock:
+            self.function_calls += 1
+        name = self.function_name if self.function_name in offered else offered[0]
+        call = {"name": name, "arguments": self.function_arguments}
+        if "tools" in data:
+            return {"tool_calls": [{"index": 0, "id": f"call_{next(self._ids)}", "type": "function", "function": call}]}
+        return {"function_call": call}
+
+    def _reply_text(self, data: Dict[str, Any]) -> str:
+        if data.get("max_tokens") == 10:
+            # The handler's finish check
+            return "no"
+        return self.reply
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "Invalid JSON"}})
+                    return
+                if mock._decide():
+                    self._send_json(429, {"error": {"message": "Rate limit reached"}},
+                                    {"retry-after-ms": str(mock.retry_after_ms)})
+                    return
+                time.sleep(mock._delay())
+                call = mock._function_call(data)
+                if data.get("stream"):
+                    self._stream(data, call)
+                else:
+                    self._complete(data, call)
+
+            def do_HEAD(self):
+                # Like the real endpoint: no body, connection kept open (used by OpenAIHandler.preconnect)
+                self.send_response(405)
+                self.send_header("Allow", "POST")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                encoded = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def _complete(self, data: Dict[str, Any], call: Optional[Dict[str, Any]]):
+                if call is not None:
+                    message = {"role": "assistant", "content": None}
+                    message.update(call)
+                    for tool_call in message.get("tool_calls", []):
+                        tool_call.pop("index", None)
+                else:
+                    text = mock._reply_text(data)
+                    # Generation time of the whole reply
+                    time.sleep(len(text.split()) / mock.tokens_per_second)
+                    message = {"role": "assistant", "content": text}
+                self._send_json(200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "model": data.get("model"),
+                    "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                    "usage": {"total_tokens": prompt_tokens(data) + 50},
+                })
+
+            def _stream(self, data: Dict[str, Any], call: Optional[Dict[str, Any]]):
+                # Chunked like the real API, so clients see each event as it is sent
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                if call is not None:
+                    self._stream_call(call)
+                else:
+                    words = mock._reply_text(data).split(" ")
+                    for index, word in enumerate(words):
+                        self._event({"content": word if index == 0 else " " + word})
+                        time.sleep(1 / mock.tokens_per_second)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _stream_call(self, call: Dict[str, Any]):
+                """The call with empty arguments first, then the arguments a few characters per event."""
+                if "tool_calls" in call:
+                    tool_call = call["tool_calls"][0]
+                    function = tool_call["function"]
+                    first = {**tool_call, "function": {"name": function["name"], "arguments": ""}}
+                    self._event({"role": "assistant", "content": None, "tool_calls": [first]})
+                    fragment = lambda part: {"tool_calls": [{"index": 0, "function": {"arguments": part}}]}
+                else:
+                    function = call["function_call"]
+                    self._event({"role": "assistant", "content": None,
+                                 "function_call": {"name": function["name"], "arguments": ""}})
+                    fragment = lambda part: {"function_call": {"arguments": part}}
+                arguments = function["arguments"]
+                for start in range(0, len(arguments), ARGUMENT_FRAGMENT_CHARS):
+                    self._event(fragment(arguments[start:start + ARGUMENT_FRAGMENT_CHARS]))
+                    time.sleep(1 / mock.tokens_per_second)
+
+            def _event(self, delta: Dict[str, Any]):
+                chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta}]}
+                self._write_chunk(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def prompt_tokens(data: Dict[str, Any]) -> int:
+    """Rough prompt token count of a request, for the usage field."""
+    return sum(len((m.get("content") or "").split()) for m in data.get("messages", []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--function-trigger", default=r"\bticket\b",
+                        help="Regex on the last user message that makes the reply a function call")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, args.latency, args.jitter, args.tokens_per_second,
+                              args.rate_limit, function_trigger=args.function_trigger)
+    print(f"Mock chat completions at {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == "__main__":
+    main()
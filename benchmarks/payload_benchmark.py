@@ -0,0 +1,101 @@
+"""
+Request payload benchmark: CPU time and allocations per turn on the request path.
+
+A turn appends a user message, trims the history, encodes the chat request,
+appends the reply and encodes the finish check request, as the handler does
+(no network). "baseline" rebuilds the message lists and encodes each request
+from scratch with json.dumps, like the old `requests.post(json=...)` path;
+"incremental" uses the handler's deque-backed history, which encodes every
+message once, and its RequestEncoder, which reuses the bytes of the unchanged
+members (model, tool schemas, parameters).
+
+    python -m benchmarks.payload_benchmark --sizes 10 100 1000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from chatbot.history import ConversationHistory
+from chatbot.openai_handler import OpenAIHandler
+from chatbot.payload import orjson
+from chatbot.session import ConversationState
+
+FINISH_PROMPT = {"role": "user", "content": "Is this conversation complete? Answer with 'yes' or 'no'."}
+
+
+def make_message(role: str, index: int) -> dict:
+    return {"role": role, "content": f"Message {index}: my printer on the third floor shows error {index} "
+                                     f"again, what should I try next?"}
+
+
+def baseline_turn(handler: OpenAIHandler, messages: list, size: int, index: int) -> int:
+    messages.append(make_message("user", index))
+    if len(messages) > size:
+        del messages[:len(messages) - size]
+    data = {"model": handler.model, "messages": list(messages), "max_tokens": handler.max_tokens, "n": 1,
+            "stop": None, "temperature": handler.temperature, "tools": handler.tools.tool_schemas,
+            "tool_choice": "auto"}
+    encoded = len(json.dumps(data).encode("utf-8"))
+    messages.append(make_message("assistant", index))
+    finish = {"model": handler.model, "messages": list(messages) + [FINISH_PROMPT], "max_tokens": 10, "n": 1,
+              "temperature": 0.0, "tools": handler.tools.tool_schemas, "tool_choice": "none"}
+    return encoded + len(json.dumps(finish).encode("utf-8"))
+
+
+def incremental_turn(handler: OpenAIHandler, index: int) -> int:
+    handler.conversation_history.append(make_message("user", index))
+    handler.trim_conversation_history()
+    encoded = len(handler.request_encoder.encode(handler._build_chat_data()))
+    handler.conversation_history.append(make_message("assistant", index))
+    return encoded + len(handler.request_encoder.encode(handler._build_finish_check_data()))
+
+
+def measure(turn, turns: int) -> dict:
+    """CPU time and allocated bytes per turn (allocations are measured in a separate pass)."""
+    start = time.process_time()
+    for index in range(turns):
+        turn(index)
+    cpu = (time.process_time() - start) / turns
+
+    tracemalloc.start()
+    allocated = 0
+    for index in range(turns):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        turn(turns + index)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {"cpu_us": cpu * 1e6, "peak_kib": allocated / turns / 1024}
+
+
+def run(size: int, turns: int) -> dict:
+    handler = OpenAIHandler(api_key="benchmark", finish_check="none")
+    messages = [make_message("user" if i % 2 == 0 else "assistant", i) for i in range(size)]
+    baseline = measure(lambda index: baseline_turn(handler, messages, size, index), turns)
+
+    history = ConversationHistory(max_tokens=10 ** 9, tokenizer=handler.tokenizer, max_messages=size)
+    for message in [make_message("user" if i % 2 == 0 else "assistant", i) for i in range(size)]:
+        history.append(message)
+    handler.state = ConversationState(history)
+    incremental = measure(lambda index: incremental_turn(handler, index), turns)
+    return {"size": size, "baseline": baseline, "incremental": incremental}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="History sizes in messages")
+    parser.add_argument("--turns", type=int, default=200, help="Turns measured per history size")
+    args = parser.parse_args()
+
+    print(f"JSON encoder: {'orjson' if orjson is not None else 'json (standard library)'}")
+    print(f"{'messages':>9} {'baseline us':>12} {'incremental us':>15} {'baseline KiB':>13} {'incremental KiB':>16}")
+    for size in args.sizes:
+        result = run(size, args.turns)
+        baseline, incremental = result["baseline"], result["incremental"]
+        print(f"{size:>9} {baseline['cpu_us']:>12.1f} {incremental['cpu_us']:>15.1f} "
+              f"{baseline['peak_kib']:>13.1f} {incremental['peak_kib']:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Speech text benchmark: throughput of turning markdown replies into speakable text.
+
+Replies of each size are built from a support answer with headings, lists,
+emphasis, links, URLs, emails, amounts and short code blocks (`--shape support`)
+or are one long code block (`--shape code`). "whole" converts the complete
+reply at once; "stream" feeds it in deltas of `--delta-chars` characters, as
+the handler streams it.
+
+"regex" is the previous path: the two regex passes of the old
+`extract_code_and_text` (fenced code only, markup left in the text), after
+SentenceStream when streaming. "normalizer" is SpeechTextNormalizer, which also
+strips markdown and spells out URLs, emails and numbers. SentenceStream
+rescans the text since the last sentence for every delta, which grows
+quadratically inside a code block; keep the sizes small with `--shape code`.
+
+    python -m benchmarks.speech_text_benchmark --sizes 4 64 1024
+    python -m benchmarks.speech_text_benchmark --shape code --sizes 2 8 16
+"""
+import argparse
+import re
+import time
+from typing import Callable, List
+
+from chatbot.speech_text import SpeechStream, normalize_for_speech
+from chatbot.streaming import SentenceStream
+
+SECTION = """## Step {index}: reconnecting to the office wifi
+
+Sure! If your laptop still can't connect, try the following:
+
+1. Restart the router and wait **30 seconds**.
+2. Open [the network settings](https://support.example.com/wifi?step={index}) and select *Forget network*.
+- Clear the DNS cache, e.g. with `ipconfig /flushdns`.
+- If it still fails, email helpdesk@example.com or visit https://www.example.org/status.
+
+> Replacement adapters cost $24.99, about 15% of the laptop's repair budget, and ship in 3-5 days.
+
+```powershell
+netsh wlan show profiles
+netsh wlan delete profile name="Office"
+```
+
+Let me know if that fixes it, or if you'd like me to open a ticket for you.
+
+"""
+
+
+CODE_LINE = "value_{index} = compute(value_{previous}, step={index})\n"
+
+
+def make_reply(size_kib: int, shape: str = "support") -> str:
+    template = SECTION if shape == "support" else CODE_LINE
+    parts = []
+    length = 0
+    while length < size_kib * 1024:
+        part = template.format(index=len(parts) + 1, previous=len(parts))
+        parts.append(part)
+        length += len(part)
+    if shape == "code":
+        return "Here is the script:\n\n```python\n" + "".join(parts) + "```\n\nRun it and let me know how it goes."
+    return "".join(parts)
+
+
+def extract_code_and_text(text):
+    """The regex passes previously used by the voice bot."""
+    code_blocks = re.findall(r'```(.*?)```', text, re.DOTALL)
+    non_code_text = re.sub(r'```(.*?)```', '', text, flags=re.DOTALL).strip()
+    return non_code_text, code_blocks
+
+
+def deltas(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def regex_stream(chunks: List[str]) -> int:
+    return sum(len(extract_code_and_text(sentence)[0]) for sentence in SentenceStream(chunks))
+
+
+def normalizer_stream(chunks: List[str]) -> int:
+    return sum(len(segment) for _, segment in SpeechStream(chunks))
+
+
+def throughput(convert: Callable[[], object], size_bytes: int, min_seconds: float) -> float:
+    """MB/s of `convert`, repeated for at least `min_seconds` of CPU time."""
+    runs = 0
+    start = time.process_time()
+    while True:
+        convert()
+        runs += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_seconds:
+            return size_bytes * runs / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 64, 1024], help="Reply sizes in KiB")
+    parser.add_argument("--shape", default="support", choices=["support", "code"])
+    parser.add_argument("--delta-chars", type=int, default=4, help="Characters per streamed delta")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="CPU time measured per case")
+    args = parser.parse_args()
+
+    print(f"{'KiB':>6} {'regex whole MB/s':>17} {'normalizer whole MB/s':>22} "
+          f"{'regex stream MB/s':>18} {'normalizer stream MB/s':>23}")
+    for size in args.sizes:
+        reply = make_reply(size, args.shape)
+        chunks = deltas(reply, args.delta_chars)
+        size_bytes = len(reply.encode("utf-8"))
+        results = [
+            throughput(lambda: extract_code_and_text(reply), size_bytes, args.min_seconds),
+            throughput(lambda: normalize_for_speech(reply), size_bytes, args.min_seconds),
+            throughput(lambda: regex_stream(chunks), size_bytes, args.min_seconds),
+            throughput(lambda: normalizer_stream(chunks), size_bytes, args.min_seconds),
+        ]
+        print(f"{size:>6} {results[0]:>17.1f} {results[1]:>22.1f} {results[2]:>18.1f} {results[3]:>23.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Startup benchmark: how long the voice bot takes to greet the user and to be ready to listen.
+
+Every run is a fresh Python process going through the voice bot's `start_up`,
+timed from just before the process is spawned, so interpreter startup and the
+imports are included:
+
+  time to greeting  until the greeting is handed to TTS (--tts none) or reaches
+                    the null audio sink (--tts engine)
+  time to ready     until every component is built and the bot can listen
+
+"eager" builds the components one after another, as the bot did before
+(`startup_mode=eager`); "background" builds them on their own threads and
+greets as soon as TTS is up. The API host is the local mock server, which the
+handler pre-connects to in both modes.
+
+"cold" runs start with an empty bytecode cache (a fresh PYTHONPYCACHEPREFIX,
+so the standard library is compiled too) and an empty TTS audio cache. "warm"
+runs share both caches, filled by one run beforehand.
+
+Without audio hardware or the optional dependencies, use the defaults
+(--tts none --asr-backend none); --tts engine needs pyttsx3, --microphone a
+microphone and speech_recognition.
+
+    python -m benchmarks.startup_benchmark --runs 5
+    python -m benchmarks.startup_benchmark --tts engine --asr-backend vosk
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("eager", "background")
+
+
+def run_child(args):
+    """One startup in this process; prints its timings as JSON."""
+    import voice_input_chatbot
+    from chatbot.startup import Startup
+
+    greeted = []
+
+    def sink(path):
+        if not greeted:
+            greeted.append(time.time())
+
+    tts_factory = None
+    if args.tts == "engine":
+        tts_factory = lambda: voice_input_chatbot.create_tts(cache_dir=args.tts_cache_dir, audio_sink=sink)
+
+    started = time.time()
+    startup = Startup(background=args.mode == "background")
+    voice_input_chatbot.start_up(startup, "benchmark", asr_backend=args.asr_backend, tts_factory=tts_factory,
+                                 api_url=args.api_url, open_microphone=args.microphone)
+    if voice_input_chatbot.tts is not None:
+        voice_input_chatbot.tts.flush().wait()
+    # The preconnect may still be running when the bot is ready
+    for warmup in startup.components.values():
+        warmup.done.wait()
+    greeting = greeted[0] if greeted else started + startup.milestones["greeting"]
+    result = {
+        "greeting": greeting - args.spawned,
+        "ready": started + startup.milestones["ready"] - args.spawned,
+        "components": startup.timings()["components"],
+    }
+    print(json.dumps(result))
+
+
+def spawn(args, mode, pycache_dir, tts_cache_dir):
+    command = [sys.executable, "-m", "benchmarks.startup_benchmark", "--child", "--mode", mode,
+               "--tts", args.tts, "--asr-backend", args.asr_backend, "--api-url", args.api_url,
+               "--tts-cache-dir", tts_cache_dir]
+    if args.microphone:
+        command.append("--microphone")
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache_dir)
+    # The bytecode cache is what the cold and warm runs differ in, so it must be written
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    # Neither persisted sessions nor trace exports are part of startup
+    for name in ("session_db", "trace_file", "metrics_port"):
+        env.pop(name, None)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    spawned = time.time()
+    process = subprocess.run(command + ["--spawned", repr(spawned)], cwd=root, env=env,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        sys.exit(f"Startup run failed:\n{process.stderr}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per mode and cache state")
+    parser.add_argument("--tts", default="none", choices=["none", "engine"])
+    parser.add_argument("--asr-backend", default="none", choices=["none", "google", "vosk"])
+    parser.add_argument("--microphone", action="store_true", help="Open the microphone at startup")
+    # Used by the child processes
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--tts-cache-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from benchmarks.mock_openai import MockOpenAIServer
+
+    work_dir = tempfile.mkdtemp(prefix="startup_benchmark_")
+    with MockOpenAIServer() as server:
+        args.api_url = server.url
+        results = {}
+        for cache in ("cold", "warm"):
+            warm_pycache = os.path.join(work_dir, "warm", "pycache")
+            warm_tts = os.path.join(work_dir, "warm", "tts")
+            if cache == "warm":
+                spawn(args, "background", warm_pycache, warm_tts)
+            for mode in MODES:
+                runs = []
+                for run in range(args.runs):
+                    if cache == "cold":
+                        run_dir = os.path.join(work_dir, f"cold-{mode}-{run}")
+                        runs.append(spawn(args, mode, os.path.join(run_dir, "pycache"), os.path.join(run_dir, "tts")))
+                    else:
+                        runs.append(spawn(args, mode, warm_pycache, warm_tts))
+                results[cache, mode] = runs
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'cache':<6} {'mode':<11} {'greeting ms':>12} {'ready ms':>9}  components (ms)")
+    for (cache, mode), runs in results.items():
+        names = runs[0]["components"]
+        components = ", ".join(
+            f"{name} {median([run['components'][name] for run in runs]) * 1000:.0f}" for name in names)
+        print(f"{cache:<6} {mode:<11} {median([run['greeting'] for run in runs]) * 1000:>12.0f} "
+              f"{median([run['ready'] for run in runs]) * 1000:>9.0f}  {components}")
+
+
+if __name__ == "__main__":
+    main()
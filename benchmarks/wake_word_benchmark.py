@@ -0,0 +1,91 @@
+"""
+Wake word benchmark: false-accept and false-reject rates of the calling name gate.
+
+Each WAV in the corpus goes through the capture path with a WakeWordGate
+listening, exactly as in the voice loop. A file counts as accepted if the gate
+admits any of its speech. Files with "contains_name": true should be accepted;
+the rest should not (e.g. side conversations, TV, similar-sounding words).
+
+The corpus is `wake_word_corpus/manifest.jsonl` with 16 kHz 16-bit mono WAV
+recordings next to it; `--record` records the missing ones from the
+microphone. Record them in the rooms the bot is used in, with several
+speakers, for meaningful rates.
+
+`--render` is a smoke test only: TTS renders of the texts (in `rendered/`)
+replace the recordings, so the rates say nothing about real speech.
+
+    python -m benchmarks.wake_word_benchmark --vosk-model path/to/model --record
+    python -m benchmarks.wake_word_benchmark --vosk-model path/to/model
+"""
+import argparse
+import json
+import os
+
+from benchmarks.asr_benchmark import (load_corpus, record_corpus, render_corpus, require_recordings,
+                                      require_vosk_model, wav_duration)
+from chatbot.capture import segment_wav
+from chatbot.wake_word import DEFAULT_CALLING_NAME, KeywordSpotter, WakeWordGate
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wake_word_corpus")
+
+
+def run(spotter_backend, calling_name: str, corpus_dir: str, corpus) -> dict:
+    false_accepts = false_rejects = positives = negatives = 0
+    negative_seconds = 0.0
+
+    for entry in corpus:
+        path = os.path.join(corpus_dir, entry["audio"])
+        gate = WakeWordGate(KeywordSpotter(spotter_backend, calling_name))
+        utterances = segment_wav(path, listeners=[gate])
+        admitted = [gate.admit(utterance) for utterance in utterances]
+        # The calling name on its own arms the gate, which counts as accepting it
+        accepted = any(utterance is not None for utterance in admitted) or gate.is_armed
+
+        if entry["contains_name"]:
+            positives += 1
+            false_rejects += not accepted
+        else:
+            negatives += 1
+            negative_seconds += wav_duration(path)
+            false_accepts += accepted
+        print(f"  {entry['audio']}: {'accepted' if accepted else 'rejected'}")
+
+    return {
+        "positives": positives,
+        "negatives": negatives,
+        "false_reject_rate": false_rejects / positives if positives else 0.0,
+        "false_accept_rate": false_accepts / negatives if negatives else 0.0,
+        "false_accepts_per_hour": false_accepts * 3600 / negative_seconds if negative_seconds else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calling-name", default=DEFAULT_CALLING_NAME)
+    parser.add_argument("--vosk-model", default="model", help="Path to the Vosk model directory")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="Corpus directory containing manifest.jsonl")
+    parser.add_argument("--record", action="store_true", help="Record the missing corpus files from the microphone")
+    parser.add_argument("--render", action="store_true",
+                        help="Smoke test on TTS renders of the texts instead of the recordings (not real speech)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    require_vosk_model(args.vosk_model)
+    if args.record:
+        record_corpus(args.corpus, corpus)
+    if args.render:
+        audio_dir, audio = render_corpus(args.corpus, corpus), "rendered by TTS (smoke test, not real speech)"
+    else:
+        require_recordings(args.corpus, corpus)
+        audio_dir, audio = args.corpus, "recorded"
+
+    from chatbot.speech_recognizer import create_asr_backend
+
+    backend = create_asr_backend("vosk", model_path=args.vosk_model, grammar=[args.calling_name.lower(), "[unk]"])
+    results = run(backend, args.calling_name, audio_dir, corpus)
+    results["audio"] = audio
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
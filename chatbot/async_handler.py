@@ -0,0 +1,415 @@
+import asyncio
+import contextlib
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+
+import aiohttp
+
+from chatbot.openai_handler import OpenAIHandler
+from chatbot.hedging import STREAM, run_hedged_async
+from chatbot.routing import Route
+from chatbot.scheduler import backoff_delay, estimate_request_tokens
+from chatbot.session import ConversationState, SessionStore
+from chatbot.streaming import SSEDecoder, StreamAccumulator
+from chatbot.tools import tool_calls_of
+from chatbot.tracing import TRACER
+
+
+class AsyncOpenAIHandler(OpenAIHandler):
+    """
+    asyncio-native OpenAIHandler that serves many conversations from one event loop.
+
+    Conversation state is kept per session id in a SessionStore and every session
+    shares one pooled aiohttp client. Turns of one session run strictly in order;
+    turns of different sessions run concurrently. The synchronous OpenAIHandler API
+    remains available on the same object for its own default conversation.
+
+    With `max_idle` (seconds), sessions unused for that long are evicted every
+    `eviction_interval` seconds (default: a quarter of `max_idle`) by a task
+    started with the first turn: a PersistentSessionStore saves and unloads
+    them, to be loaded again on their next turn; the in-memory store forgets
+    them. A persistent store's reads and writes run on executor threads so
+    SQLite never blocks the event loop.
+    """
+
+    def __init__(self, *args, max_connections: int = 100, session_store: Optional[SessionStore] = None,
+                 max_idle: Optional[float] = None, eviction_interval: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_connections = max_connections
+        self.sessions = session_store if session_store is not None else SessionStore()
+        if self.sessions.state_factory is None:
+            self.sessions.state_factory = lambda: self.new_state(defer_summary=True)
+        self.max_idle = max_idle
+        self.eviction_interval = eviction_interval or (max_idle / 4 if max_idle else None)
+        self._eviction_task: Optional[asyncio.Task] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncOpenAIHandler":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._eviction_task is not None:
+            self._eviction_task.cancel()
+            self._eviction_task = None
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    def _client(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP client, creating it inside the running event loop on first use."""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+            )
+        return self._http
+
+    @contextlib.contextmanager
+    def _bound(self, state: ConversationState) -> Iterator[ConversationState]:
+        """
+        Run the shared (synchronous) conversation logic against `state`.
+
+        The block must not await: the event loop cannot switch sessions inside it,
+        so the swapped state is never seen by another session.
+        """
+        previous = self.state
+        self.state = state
+        try:
+            yield state
+        finally:
+            self.state = previous
+
+    async def _in_store(self, function: Callable[..., Any], *args) -> Any:
+        """Call a session store method, on an executor thread if it reads or writes storage."""
+        if self.sessions.persistent:
+            return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+        return function(*args)
+
+    async def _get_session(self, session_id: str) -> ConversationState:
+        """The state of `session_id`, loaded from a persistent store off the event loop if needed."""
+        self._start_eviction()
+        if session_id not in self.sessions.sessions and self.sessions.persistent:
+            self.sessions.add(session_id, await self._in_store(self.sessions.load, session_id))
+        return self.sessions.get(session_id)
+
+    async def _save_session(self, session_id: str, state: ConversationState) -> None:
+        if self.sessions.persistent:
+            await self._in_store(self.sessions.save, session_id, state)
+
+    def _start_eviction(self) -> None:
+        if self.max_idle is not None and self._eviction_task is None:
+            self._eviction_task = asyncio.get_running_loop().create_task(self._eviction_loop())
+
+    async def _eviction_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.eviction_interval)
+            try:
+                await self.evict_idle_sessions(self.max_idle)
+            except Exception as e:
+                print(f"Error evicting idle sessions: {e}")
+
+    async def evict_idle_sessions(self, max_idle: float) -> int:
+        """Save and unload sessions unused for `max_idle` seconds; returns how many were evicted."""
+        evicted = 0
+        for session_id in self.sessions.idle_sessions(max_idle):
+            state = self.sessions.sessions.get(session_id)
+            if state is None:
+                continue
+            async with state.lock:
+                await self._save_session(session_id, state)
+                # A turn that fetched the session meanwhile refreshed last_used and keeps it loaded
+                if self.sessions.sessions.get(session_id) is state and state.last_used < time.monotonic() - max_idle:
+                    self.sessions.unload(session_id)
+                    evicted += 1
+        return evicted
+
+    async def generate_response_async(self, session_id: str, prompt: str) -> Tuple[str, bool]:
+        """Asynchronous `generate_response` for the conversation identified by `session_id`."""
+        state = await self._get_session(session_id)
+        async with state.lock:
+            try:
+                return await self._generate_response_async(state, prompt)
+            finally:
+                await self._save_session(session_id, state)
+
+    async def _generate_response_async(self, state: ConversationState, prompt: str) -> Tuple[str, bool]:
+        local_response = self._begin_turn(state, prompt)
+        if local_response is not None:
+            return local_response
+        await self._summarize_if_needed(state)
+
+        with self._bound(state):
+            route = self._route()
+            data = self._build_chat_data(route=route)
+        message = await self._complete_async(data, route)
+        for _ in range(self.max_tool_rounds):
+            with self._bound(state):
+                calls = self._tool_calls_to_run(message)
+            if not calls:
+                break
+            results = await self.tools.execute_async(calls, self._get_tool_executor())
+            with self._bound(state):
+                self._append_tool_results(message, results)
+                if self._interactive_calls(message):
+                    break
+                route = self._route(tool_round=True)
+                data = self._build_chat_data(route=route)
+            message = await self._complete_async(data, route)
+
+        with self._bound(state):
+            return self._handle_assistant_message(message)
+
+    async def _complete_async(self, data: dict, route: Optional[Route] = None) -> dict:
+        """Asynchronous `_complete`."""
+        message = self.response_cache.get(data) if self.response_cache else None
+        if message is None:
+            started = time.monotonic()
+            response_json = await self._make_gpt_request_async(data)
+
+            if not response_json:
+                raise ValueError("No response generated.")
+
+            self._record_route_latency(route, time.monotonic() - started)
+
+            message = response_json.get("choices")[0].get("message")
+            if self.response_cache:
+                self.response_cache.put(data, message)
+        return message
+
+    async def generate_response_stream_async(self, session_id: str, prompt: str) -> AsyncIterator[str]:
+        """
+        Asynchronous `generate_response_stream` for the conversation identified by `session_id`.
+
+        The finished flag is available afterwards through `wait_finished_async`.
+        """
+        state = await self._get_session(session_id)
+        async with state.lock:
+            try:
+                async for delta in self._generate_response_stream_async(state, prompt):
+                    yield delta
+            finally:
+                await self._save_session(session_id, state)
+
+    async def _generate_response_stream_async(self, state: ConversationState, prompt: str) -> AsyncIterator[str]:
+        local_response = self._begin_turn(state, prompt)
+        if local_response is not None:
+            yield local_response[0]
+            return
+        await self._summarize_if_needed(state)
+
+        for round_ in range(self.max_tool_rounds + 1):
+            with self._bound(state):
+                route = self._route(tool_round=round_ > 0)
+                data = self._build_chat_data(stream=True, route=route)
+            message = self.response_cache.get(data) if self.response_cache else None
+            if message is not None:
+                if not tool_calls_of(message) and message.get("content"):
+                    yield message["content"]
+            else:
+                accumulator = StreamAccumulator()
+                started = time.monotonic()
+                first_token = None
+                async for chunk in self._stream_gpt_request_async(data):
+                    delta = accumulator.add_chunk(chunk)
+                    if delta:
+                        if first_token is None:
+                            first_token = time.monotonic() - started
+                        yield delta
+                self._record_route_latency(route, time.monotonic() - started, first_token)
+                message = accumulator.message()
+                if self.response_cache:
+                    self.response_cache.put(data, message)
+
+            with self._bound(state):
+                calls = self._tool_calls_to_run(message) if round_ < self.max_tool_rounds else []
+            if not calls:
+                break
+            results = await self.tools.execute_async(calls, self._get_tool_executor())
+            with self._bound(state):
+                self._append_tool_results(message, results)
+                if self._interactive_calls(message):
+                    break
+
+        with self._bound(state):
+            response_text, _ = self._handle_assistant_message(message)
+        if tool_calls_of(message):
+            yield response_text
+
+    def _begin_turn(self, state: ConversationState, prompt: str) -> Optional[Tuple[str, bool]]:
+        """Record the user message and answer locally from pending tool state if possible."""
+        with self._bound(state):
+            self.conversation_history.append({"role": "user", "content": prompt})
+            self.trim_conversation_history()
+            return self._handle_pending_state(prompt)
+
+    async def _summarize_if_needed(self, state: ConversationState) -> None:
+        history = state.conversation_history
+        if not history.needs_summary:
+            return
+        try:
+            response_json = await self._make_gpt_request_async(
+                self._build_summary_data(history.summary, history.unsummarized)
+            )
+            summary = self._parse_summary(history.summary, response_json)
+        except Exception as e:
+            print(f"Error summarizing conversation history: {e}")
+            summary = history.summary
+        history.apply_summary(summary)
+
+    async def _make_gpt_request_async(self, data: dict) -> Optional[dict]:
+        """Asynchronous `_make_gpt_request` over the shared connection pool."""
+        estimated_tokens = estimate_request_tokens(data) if self.scheduler else 0
+        started = time.perf_counter()
+        for attempt in range(self.retries):
+            if self.scheduler:
+                await self.scheduler.acquire_async(estimated_tokens, self.priority)
+            try:
+                response_json = await self._send_request_async(data)
+                self._record_request_success(estimated_tokens, response_json)
+                TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"), attempts=attempt + 1)
+                return response_json
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                retry_after = self._record_request_failure(e)
+                TRACER.count("llm_request_errors")
+                if attempt < self.retries - 1:
+                    sleep_time = backoff_delay(attempt, retry_after)
+                    print(f"Error: {e}. Retrying in {sleep_time:.1f} seconds...")
+                    await asyncio.sleep(sleep_time)
+                else:
+                    TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"),
+                                  attempts=attempt + 1, error=type(e).__name__)
+                    raise Exception(f"Failed after {self.retries} attempts: {e}")
+        return None
+
+    async def _send_request_async(self, data: dict) -> dict:
+        """Asynchronous `_send_request`; hedges that lose the race are cancelled."""
+        if self.hedge_policy is None:
+            return await self._post_json_async(data)
+        return await run_hedged_async(lambda: self._post_json_async(data), self.hedge_policy,
+                                      admit=self._hedge_admission(data))
+
+    async def _open_stream_async(self, data: dict) -> aiohttp.ClientResponse:
+        if self.hedge_policy is None:
+            return await self._post_stream_async(data)
+        return await run_hedged_async(lambda: self._post_stream_async(data), self.hedge_policy,
+                                      on_discard=lambda response: response.release(), kind=STREAM,
+                                      admit=self._hedge_admission(data))
+
+    async def _post_json_async(self, data: dict) -> dict:
+        async with self._client().post(self.api_url, data=self.request_encoder.encode(data)) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def _post_stream_async(self, data: dict) -> aiohttp.ClientResponse:
+        response = await self._client().post(self.api_url, data=self.request_encoder.encode(data))
+        try:
+            response.raise_for_status()
+        except aiohttp.ClientResponseError:
+            # Give the connection back to the pool
+            response.release()
+            raise
+        return response
+
+    async def _stream_gpt_request_async(self, data: dict) -> AsyncIterator[Dict[str, Any]]:
+        """Asynchronous `_stream_gpt_request`: yield the decoded SSE chunks of a streaming request."""
+        estimated_tokens = estimate_request_tokens(data) if self.scheduler else 0
+        started = time.perf_counter()
+        for attempt in range(self.retries):
+            if self.scheduler:
+                await self.scheduler.acquire_async(estimated_tokens, self.priority)
+            try:
+                response = await self._open_stream_async(data)
+                self._record_request_success(estimated_tokens)
+                TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"),
+                              attempts=attempt + 1, stream=True)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retry_after = self._record_request_failure(e)
+                TRACER.count("llm_request_errors")
+                if attempt < self.retries - 1:
+                    sleep_time = backoff_delay(attempt, retry_after)
+                    print(f"Error: {e}. Retrying in {sleep_time:.1f} seconds...")
+                    await asyncio.sleep(sleep_time)
+                else:
+                    TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"),
+                                  attempts=attempt + 1, error=type(e).__name__)
+                    raise Exception(f"Failed after {self.retries} attempts: {e}")
+
+        decoder = SSEDecoder()
+        first = True
+        async with response:
+            async for line in response.content:
+                payload = decoder.feed_line(line)
+                if decoder.done:
+                    break
+                if payload is not None:
+                    if first:
+                        TRACER.record("llm_first_token", time.perf_counter() - started, model=data.get("model"))
+                        first = False
+                    yield json.loads(payload)
+            else:
+                payload = decoder.flush()
+                if payload is not None:
+                    yield json.loads(payload)
+        TRACER.record("llm_stream", time.perf_counter() - started, model=data.get("model"))
+
+    def _start_finish_check(self) -> bool:
+        """Run the "llm" finish check as a task on the event loop instead of a worker thread."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Called through the synchronous API
+            return super()._start_finish_check()
+        if self.finish_check != "llm":
+            return super()._start_finish_check()
+
+        data = self._build_finish_check_data()
+        self.finish_future = asyncio.ensure_future(self._check_conversation_finished_async(data))
+        self.finish_future.add_done_callback(self._notify_finished)
+        return False
+
+    async def _check_conversation_finished_async(self, data: dict) -> bool:
+        with TRACER.span("finish_check"):
+            response_json = await self._make_gpt_request_async(data)
+        return self._parse_finish_check(response_json)
+
+    async def wait_finished_async(self, session_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the latest finish check of a session and return whether it is complete.
+
+        Failures and timeouts are treated as not finished.
+        """
+        state = self.sessions.sessions.get(session_id)
+        future = state.finish_future if state else None
+        if future is None:
+            return False
+        try:
+            if isinstance(future, asyncio.Future):
+                return bool(await asyncio.wait_for(asyncio.shield(future), timeout))
+            return bool(await asyncio.wait_for(asyncio.wrap_future(future), timeout))
+        except Exception as e:
+            print(f"Finish check failed: {e}")
+            return False
+
+    async def reset_session(self, session_id: str) -> None:
+        """Clear the history and tool state of a session, like `reset_conversation`, after its current turn."""
+        if session_id not in self.sessions.sessions and not await self._in_store(self.sessions.__contains__, session_id):
+            return
+        state = await self._get_session(session_id)
+        async with state.lock:
+            state.reset()
+            await self._save_session(session_id, state)
+
+    async def end_session(self, session_id: str) -> None:
+        """Forget a session entirely, after its current turn."""
+        state = self.sessions.sessions.get(session_id)
+        if state is None:
+            await self._in_store(self.sessions.drop, session_id)
+            return
+        async with state.lock:
+            await self._in_store(self.sessions.drop, session_id)
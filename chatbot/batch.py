@@ -0,0 +1,170 @@
+import json
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO
+
+from chatbot.openai_handler import OpenAIHandler
+
+
+class Conversation:
+    """One line of batch input: an id and the user turns to play in order."""
+    __slots__ = ("id", "turns")
+
+    def __init__(self, id: str, turns: List[str]):
+        self.id = id
+        self.turns = turns
+
+
+def parse_conversation(line: str, line_number: int) -> Optional[Conversation]:
+    """
+    Parse a JSONL input line: {"id": ..., "prompt": "..."} for a single question
+    or {"id": ..., "turns": ["...", "..."]} for a scripted conversation. The id
+    defaults to the line number; blank lines are skipped.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    entry = json.loads(line)
+    if "turns" in entry:
+        turns = [str(turn) for turn in entry["turns"]]
+    elif "prompt" in entry:
+        turns = [str(entry["prompt"])]
+    else:
+        raise ValueError(f"Line {line_number}: expected a 'prompt' or 'turns' field.")
+    return Conversation(str(entry.get("id", line_number)), turns)
+
+
+def read_conversations(lines: Iterable[str]) -> Iterator[Conversation]:
+    """Parse conversations lazily, so large inputs and stdin are never read up front."""
+    for line_number, line in enumerate(lines, start=1):
+        conversation = parse_conversation(line, line_number)
+        if conversation is not None:
+            yield conversation
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids with a successful result in an existing output file (the checkpoint of an interrupted run)."""
+    done: Set[str] = set()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short when the previous run was killed
+                    continue
+                if "error" not in result:
+                    done.add(str(result.get("id")))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+class BatchRunner:
+    """
+    Runs independent conversations concurrently and writes each result as a JSONL line.
+
+    Conversations run on a pool of `workers` threads; each worker builds one
+    handler with `handler_factory` and reuses it (and its HTTP connections),
+    resetting it between conversations. Give the handlers one shared
+    RequestScheduler at PRIORITY_BATCH so requests are admitted within the
+    account's rate limits and a 429 pauses every worker instead of each one
+    retrying on its own. No TTS is involved.
+
+    Results are appended and flushed as soon as a conversation finishes, in
+    completion order, so the output file doubles as the checkpoint: ids already
+    in it without an error are skipped when the run is resumed. On Ctrl+C the
+    conversations not started yet are dropped, and the ones that finished or
+    were running are written before the interrupt is raised again. At most
+    2 * `workers` conversations are read ahead of the ones running.
+    """
+
+    def __init__(self, handler_factory: Callable[[], OpenAIHandler], workers: int = 8):
+        self.handler_factory = handler_factory
+        self.workers = workers
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def _handler(self) -> OpenAIHandler:
+        handler = getattr(self.local, "handler", None)
+        if handler is None:
+            handler = self.local.handler = self.handler_factory()
+        return handler
+
+    def run_conversation(self, conversation: Conversation) -> Dict[str, Any]:
+        handler = self._handler()
+        handler.reset_conversation()
+        result: Dict[str, Any] = {"id": conversation.id, "turns": []}
+        started = time.monotonic()
+        try:
+            for prompt in conversation.turns:
+                response, _ = handler.generate_response(prompt)
+                result["turns"].append({"prompt": prompt, "response": response})
+        except Exception as e:
+            result["error"] = str(e)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    def _write(self, output: TextIO, result: Dict[str, Any]) -> None:
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self.write_lock:
+            # One write per line, so an interrupted run leaves at most one partial line
+            output.write(line)
+            output.flush()
+            if "error" in result:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def run(self, conversations: Iterable[Conversation], output: TextIO, skip: Set[str] = frozenset(),
+            on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        in_flight: Set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            try:
+                for conversation in conversations:
+                    if conversation.id in skip:
+                        self.skipped += 1
+                        continue
+                    if len(in_flight) >= 2 * self.workers:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        self._collect(done, in_flight, output, on_result)
+                    in_flight.add(executor.submit(self.run_conversation, conversation))
+                done, _ = wait(in_flight)
+                self._collect(done, in_flight, output, on_result)
+            except KeyboardInterrupt:
+                # Conversations not started are run again on resume. The executor waits for the running
+                # ones before the block exits anyway, so they are written to the checkpoint with the finished ones.
+                started = [future for future in in_flight if not future.cancel()]
+                done, _ = wait(started)
+                self._collect(done, in_flight, output, on_result)
+                raise
+
+    def _collect(self, futures: Iterable[Future], in_flight: Set[Future], output: TextIO,
+                 on_result: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        for future in futures:
+            result = future.result()
+            self._write(output, result)
+            # Written: not collected again if the run is interrupted
+            in_flight.discard(future)
+            if on_result is not None:
+                on_result(result)
+
+
+def open_input(path: str) -> TextIO:
+    return sys.stdin if path == "-" else open(path, encoding="utf-8")
+
+
+def open_output(path: str) -> TextIO:
+    """Open an output file for appending, ending a line cut short by an interrupted run first."""
+    output = open(path, "a+b")
+    if output.tell() > 0:
+        output.seek(-1, 2)
+        if output.read(1) != b"\n":
+            output.write(b"\n")
+    output.close()
+    return open(path, "a", encoding="utf-8")
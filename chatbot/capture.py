@@ -0,0 +1,398 @@
+import math
+import queue
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from chatbot.tracing import TRACER
+
+try:
+    import webrtcvad
+except ImportError:  # webrtcvad is optional; fall back to the energy detector
+    webrtcvad = None
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+# 30 ms frames are valid for both detectors
+FRAME_MS = 30
+
+
+def frame_energy(frame: bytes) -> float:
+    """Root mean square of a frame of 16-bit samples."""
+    samples = array("h", frame[:len(frame) - len(frame) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+class MicrophoneSource:
+    """
+    The microphone, opened once and read frame by frame.
+
+    Frames are 16-bit mono at SAMPLE_RATE, `FRAME_MS` long. The device stays open
+    until `close`, so nothing is lost between utterances.
+    """
+
+    realtime = True
+
+    def __init__(self, device_index: Optional[int] = None, sample_rate: int = SAMPLE_RATE):
+        import speech_recognition as sr
+
+        self.sample_rate = sample_rate
+        self.sample_width = SAMPLE_WIDTH
+        self.frame_samples = sample_rate * FRAME_MS // 1000
+        self.microphone = sr.Microphone(device_index=device_index, sample_rate=sample_rate,
+                                        chunk_size=self.frame_samples)
+        self.microphone.__enter__()
+
+    def read(self) -> bytes:
+        return self.microphone.stream.read(self.frame_samples)
+
+    def close(self) -> None:
+        self.microphone.__exit__(None, None, None)
+
+
+class WavFileSource:
+    """
+    A WAV file read frame by frame, so recordings go through the same path as the microphone.
+
+    The file must be 16-bit mono. With `realtime`, frames are delivered at the
+    pace they would arrive from a device.
+    """
+
+    def __init__(self, path: str, realtime: bool = False):
+        self.wav = wave.open(path, "rb")
+        if self.wav.getsampwidth() != SAMPLE_WIDTH or self.wav.getnchannels() != 1:
+            self.wav.close()
+            raise ValueError(f"{path}: expected 16-bit mono audio")
+        self.realtime = realtime
+        self.sample_rate = self.wav.getframerate()
+        self.sample_width = SAMPLE_WIDTH
+        self.frame_samples = self.sample_rate * FRAME_MS // 1000
+
+    def read(self) -> bytes:
+        """Return the next frame, or b"" at the end of the file."""
+        frame = self.wav.readframes(self.frame_samples)
+        if self.realtime and frame:
+            time.sleep(FRAME_MS / 1000)
+        return frame
+
+    def close(self) -> None:
+        self.wav.close()
+
+
+class EnergyVAD:
+    """
+    Voice activity detection by frame energy against an adaptive noise floor.
+
+    A frame is speech when its energy exceeds the noise floor by `ratio` (and is
+    at least `min_energy`). The floor follows the energy of non-speech frames
+    with an exponential moving average, so it tracks the room continuously
+    instead of being measured before each utterance.
+    """
+
+    def __init__(self, ratio: float = 3.0, min_energy: float = 300.0, adapt_rate: float = 0.05,
+                 initial_floor: float = 100.0):
+        self.ratio = ratio
+        self.min_energy = min_energy
+        self.adapt_rate = adapt_rate
+        self.noise_floor = initial_floor
+
+    def is_speech(self, frame: bytes, sample_rate: int) -> bool:
+        energy = frame_energy(frame)
+        if energy > max(self.min_energy, self.noise_floor * self.ratio):
+            return True
+        self.noise_floor += self.adapt_rate * (energy - self.noise_floor)
+        return False
+
+
+class WebRTCVAD:
+    """Voice activity detection with the WebRTC detector (requires the webrtcvad package)."""
+
+    def __init__(self, aggressiveness: int = 2):
+        if webrtcvad is None:
+            raise RuntimeError("webrtcvad is not installed")
+        self.vad = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, frame: bytes, sample_rate: int) -> bool:
+        return self.vad.is_speech(frame, sample_rate)
+
+
+def default_vad():
+    return WebRTCVAD() if webrtcvad is not None else EnergyVAD()
+
+
+class Utterance:
+    """One segment of speech cut from the capture stream."""
+
+    __slots__ = ("audio", "sample_rate", "sample_width", "started_at", "ended_at", "transcript", "keyword_end",
+                 "overlaps_playback")
+
+    def __init__(self, audio: bytes, sample_rate: int, sample_width: int, started_at: float, ended_at: float):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        # Seconds from the start of the stream
+        self.started_at = started_at
+        self.ended_at = ended_at
+        # Set by a streaming recognizer that transcribed the utterance while it was spoken
+        self.transcript: Optional[str] = None
+        # Set by a wake word detector: seconds into the utterance where the calling name ended
+        self.keyword_end: Optional[float] = None
+        # Set by an EchoGuard: the bot was speaking while this was captured
+        self.overlaps_playback = False
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / (self.sample_rate * self.sample_width)
+
+    def trim(self, max_seconds: Optional[float]) -> "Utterance":
+        if max_seconds is None or self.duration <= max_seconds:
+            return self
+        audio = self.audio[:int(max_seconds * self.sample_rate) * self.sample_width]
+        trimmed = Utterance(audio, self.sample_rate, self.sample_width, self.started_at, self.started_at + max_seconds)
+        trimmed.overlaps_playback = self.overlaps_playback
+        return trimmed
+
+    def after(self, seconds: float) -> "Utterance":
+        """The part of the utterance that follows its first `seconds`."""
+        offset = min(len(self.audio), int(seconds * self.sample_rate) * self.sample_width)
+        rest = Utterance(self.audio[offset:], self.sample_rate, self.sample_width,
+                         self.started_at + offset / (self.sample_rate * self.sample_width), self.ended_at)
+        rest.overlaps_playback = self.overlaps_playback
+        return rest
+
+    def to_audio_data(self):
+        """The utterance as speech_recognition AudioData, for the recognizers."""
+        import speech_recognition as sr
+
+        return sr.AudioData(self.audio, self.sample_rate, self.sample_width)
+
+
+class Segmenter:
+    """
+    Cuts a stream of frames into utterances.
+
+    Speech starts once `start_ratio` of the frames in the last `pre_roll_ms` are
+    voiced; those frames are kept so the first syllable is not clipped. It ends
+    after `end_silence_ms` of unvoiced frames or at `max_utterance_s`.
+    """
+
+    def __init__(self, vad=None, sample_rate: int = SAMPLE_RATE, sample_width: int = SAMPLE_WIDTH,
+                 pre_roll_ms: int = 300, start_ratio: float = 0.6, end_silence_ms: int = 700,
+                 min_utterance_ms: int = 250, max_utterance_s: float = 30.0):
+        self.vad = vad or default_vad()
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.start_ratio = start_ratio
+        self.pre_roll: Deque[Tuple[bytes, bool]] = deque(maxlen=max(1, pre_roll_ms // FRAME_MS))
+        self.end_silence_frames = max(1, end_silence_ms // FRAME_MS)
+        self.min_utterance_frames = max(1, min_utterance_ms // FRAME_MS)
+        self.max_utterance_frames = int(max_utterance_s * 1000 // FRAME_MS)
+        self.frames: List[bytes] = []
+        self.voiced_frames = 0
+        self.silent_frames = 0
+        self.in_speech = False
+        self.frame_index = 0
+        self.start_index = 0
+
+    def feed(self, frame: bytes) -> Optional[Utterance]:
+        """Consume one frame and return the utterance it completes, if any."""
+        voiced = self.vad.is_speech(frame, self.sample_rate)
+        self.frame_index += 1
+        if not self.in_speech:
+            self.pre_roll.append((frame, voiced))
+            voiced_count = sum(1 for _, is_voiced in self.pre_roll if is_voiced)
+            if len(self.pre_roll) == self.pre_roll.maxlen and voiced_count >= self.start_ratio * self.pre_roll.maxlen:
+                self.in_speech = True
+                self.frames = [buffered for buffered, _ in self.pre_roll]
+                self.voiced_frames = voiced_count
+                self.silent_frames = 0
+                self.start_index = self.frame_index - len(self.frames)
+                self.pre_roll.clear()
+            return None
+
+        self.frames.append(frame)
+        if voiced:
+            self.voiced_frames += 1
+            self.silent_frames = 0
+        else:
+            self.silent_frames += 1
+        if self.silent_frames >= self.end_silence_frames or len(self.frames) >= self.max_utterance_frames:
+            return self._finish()
+        return None
+
+    def flush(self) -> Optional[Utterance]:
+        """Return the utterance in progress at the end of the stream, if any."""
+        return self._finish() if self.in_speech else None
+
+    def _finish(self) -> Optional[Utterance]:
+        frames, voiced = self.frames, self.voiced_frames
+        self.frames = []
+        self.in_speech = False
+        if voiced < self.min_utterance_frames:
+            return None
+        # Drop the trailing silence that ended the utterance
+        if self.silent_frames:
+            frames = frames[:len(frames) - self.silent_frames] or frames
+        started_at = self.start_index * FRAME_MS / 1000
+        return Utterance(b"".join(frames), self.sample_rate, self.sample_width,
+                         started_at, started_at + len(frames) * FRAME_MS / 1000)
+
+
+_END = object()
+
+
+class AudioCapture:
+    """
+    Always-open audio capture on a background thread.
+
+    The source is opened once; a capture thread reads its frames into a ring
+    buffer of the last `ring_seconds` of audio and segments them into utterances
+    with a Segmenter. Speech that starts while the caller is busy (e.g. while a
+    reply is being generated) is queued instead of lost. `next_utterance`
+    returns queued utterances in order.
+
+    Any object with `read()`, `close()`, `sample_rate`, `sample_width` and
+    `realtime` can be the source, so WAV files go through the same path as the
+    microphone.
+
+    Listeners see speech as it is captured, before the utterance is complete:
+    `speech_started(sample_rate)`, `speech_frame(frame)` for every frame of the
+    utterance (including its pre-roll) and `speech_ended(utterance)`, where the
+    utterance is None if it was discarded as too short. They run on the capture
+    thread and must keep up with it.
+    """
+
+    def __init__(self, source, vad=None, ring_seconds: float = 10.0, max_queued: int = 8,
+                 listeners: Iterable = (), **segmenter_options):
+        self.source = source
+        self.listeners = list(listeners)
+        self.segmenter = Segmenter(vad, source.sample_rate, source.sample_width, **segmenter_options)
+        self.ring: Deque[bytes] = deque(maxlen=max(1, int(ring_seconds * 1000 // FRAME_MS)))
+        self.ring_lock = threading.Lock()
+        self.utterances: "queue.Queue" = queue.Queue(maxsize=max_queued)
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._ended = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> "AudioCapture":
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._capture_loop, name="audio-capture", daemon=True)
+            self.thread.start()
+        return self
+
+    def __enter__(self) -> "AudioCapture":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def next_utterance(self, timeout: Optional[float] = None) -> Optional[Utterance]:
+        """Wait for the next utterance; None on timeout or once the source is exhausted."""
+        if self._ended:
+            return None
+        self.start()
+        try:
+            item = self.utterances.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item is _END:
+            self._ended = True
+            return None
+        return item
+
+    def __iter__(self) -> Iterator[Utterance]:
+        while True:
+            utterance = self.next_utterance()
+            if utterance is None:
+                return
+            yield utterance
+
+    def recent_audio(self, seconds: float) -> bytes:
+        """The last `seconds` of captured audio from the ring buffer."""
+        frame_count = max(1, int(seconds * 1000 // FRAME_MS))
+        with self.ring_lock:
+            frames = list(self.ring)[-frame_count:]
+        return b"".join(frames)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.source.close()
+
+    def _put(self, item) -> None:
+        while True:
+            try:
+                self.utterances.put_nowait(item)
+                return
+            except queue.Full:
+                # Nobody is listening: keep the most recent speech
+                try:
+                    self.utterances.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _notify(self, frame: Optional[bytes], was_in_speech: bool, utterance: Optional[Utterance]) -> None:
+        try:
+            self._dispatch(frame, was_in_speech, utterance)
+        except Exception as e:
+            # A failing listener must not stop the capture
+            print(f"Error in capture listener: {e}")
+
+    def _dispatch(self, frame: Optional[bytes], was_in_speech: bool, utterance: Optional[Utterance]) -> None:
+        if not was_in_speech:
+            if self.segmenter.in_speech:
+                # Speech just started: replay the pre-roll the segmenter kept
+                for listener in self.listeners:
+                    listener.speech_started(self.source.sample_rate)
+                    for buffered in self.segmenter.frames:
+                        listener.speech_frame(buffered)
+            return
+        if frame is not None:
+            for listener in self.listeners:
+                listener.speech_frame(frame)
+        if not self.segmenter.in_speech:
+            for listener in self.listeners:
+                listener.speech_ended(utterance)
+
+    def _capture_loop(self) -> None:
+        try:
+            while not self._stop.is_set():
+                frame = self.source.read()
+                if not frame:
+                    break
+                with self.ring_lock:
+                    self.ring.append(frame)
+                was_in_speech = self.segmenter.in_speech
+                utterance = self.segmenter.feed(frame)
+                if self.listeners:
+                    self._notify(frame, was_in_speech, utterance)
+                if utterance is not None:
+                    if TRACER.enabled:
+                        TRACER.record("capture", utterance.duration)
+                        TRACER.record("endpointing", self.segmenter.silent_frames * FRAME_MS / 1000)
+                    self._put(utterance)
+            was_in_speech = self.segmenter.in_speech
+            utterance = self.segmenter.flush()
+            if self.listeners and was_in_speech:
+                self._notify(None, True, utterance)
+            if utterance is not None:
+                self._put(utterance)
+        except Exception as e:
+            print(f"Error capturing audio: {e}")
+        finally:
+            self._put(_END)
+
+
+def segment_wav(path: str, vad=None, listeners: Iterable = (), **segmenter_options) -> List[Utterance]:
+    """Cut a WAV file into utterances through the capture path."""
+    with AudioCapture(WavFileSource(path), vad, max_queued=1 << 16, listeners=listeners,
+                      **segmenter_options) as capture:
+        return list(capture)
@@ -0,0 +1,52 @@
+import re
+
+WORD_REGEX = re.compile(r"[a-z0-9']+")
+
+
+class EchoGuard:
+    """
+    Tells the user's speech apart from the bot's own voice picked up by the microphone.
+
+    As an AudioCapture listener, the guard marks utterances captured while TTS
+    was playing, or within `tail_seconds` after it stopped (room reverb and
+    device latency), with `overlaps_playback`. Such an utterance is only
+    allowed to interrupt the bot if it is addressed to it (a WakeWordGate
+    heard the calling name) or if `is_echo` finds its transcript unlike what
+    the bot just said: at least `min_new_words` of its words were not spoken
+    by the bot.
+
+    `echoes` counts the utterances discarded as echo.
+    """
+
+    def __init__(self, tts, tail_seconds: float = 0.6, min_new_words: float = 0.5):
+        self.tts = tts
+        self.tail_seconds = tail_seconds
+        self.min_new_words = min_new_words
+        self.overlaps = False
+        self.echoes = 0
+
+    # AudioCapture listener interface
+
+    def speech_started(self, sample_rate: int) -> None:
+        self.overlaps = self.tts.is_playing(self.tail_seconds)
+
+    def speech_frame(self, frame: bytes) -> None:
+        if not self.overlaps:
+            self.overlaps = self.tts.is_playing()
+
+    def speech_ended(self, utterance) -> None:
+        if utterance is not None:
+            utterance.overlaps_playback = self.overlaps
+        self.overlaps = False
+
+    def is_echo(self, utterance, transcript: str) -> bool:
+        """Whether `transcript` of `utterance` is the bot hearing itself rather than the user."""
+        if not utterance.overlaps_playback:
+            return False
+        words = WORD_REGEX.findall(transcript.lower())
+        spoken = set(WORD_REGEX.findall(self.tts.recent_text.lower()))
+        new_words = sum(1 for word in words if word not in spoken)
+        if words and new_words >= self.min_new_words * len(words):
+            return False
+        self.echoes += 1
+        return True
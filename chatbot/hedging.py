@@ -0,0 +1,249 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Kinds of request, each with its own latency window: a streaming request is timed to its
+# response headers, which arrive well before a whole non-streaming reply
+COMPLETE = "complete"
+STREAM = "stream"
+
+
+class AttemptTiming(NamedTuple):
+    request_id: int
+    attempt: int
+    hedged: bool
+    # Seconds after the request started that this attempt was sent
+    sent_at: float
+    latency: Optional[float]
+    # "won", "lost", "error" or "cancelled"
+    outcome: str
+    # COMPLETE or STREAM
+    kind: str = COMPLETE
+
+
+class HedgePolicy:
+    """
+    When and how often to hedge a slow request.
+
+    A hedge (a duplicate of the request) is sent once the first attempt has been
+    outstanding longer than the `quantile` of recently observed latencies of the
+    same kind of request (never sooner than `min_delay`, `default_delay` until
+    `min_samples` have been seen). Streaming and non-streaming requests are kept
+    in separate windows of `window` latencies, so fast stream openings do not
+    hedge every complete reply and slow replies do not delay hedging streams.
+    At most `max_hedges` extra attempts are sent per request and hedges may not
+    exceed `budget_ratio` of all requests, so a slow upstream is not flooded.
+    `refused` counts hedges the budget allowed but the caller's admission check
+    (e.g. the RequestScheduler's rate limits) did not.
+    """
+
+    def __init__(self, quantile: float = 0.9, min_delay: float = 0.2, default_delay: float = 1.0,
+                 max_hedges: int = 1, budget_ratio: float = 0.1, min_samples: int = 20,
+                 window: int = 200, timing_history: int = 1000):
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.max_hedges = max_hedges
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.window = window
+        # Request kind -> recent latencies
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.timings: Deque[AttemptTiming] = deque(maxlen=timing_history)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.refused = 0
+        self.lock = threading.Lock()
+        self._request_ids = itertools.count()
+
+    def delay(self, kind: str = COMPLETE) -> float:
+        """Seconds to wait for an attempt of a `kind` request before sending a hedge."""
+        with self.lock:
+            latencies = self.latencies.get(kind, ())
+            if len(latencies) < self.min_samples:
+                return self.default_delay
+            ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(self.quantile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    def start_request(self) -> int:
+        with self.lock:
+            self.requests += 1
+        return next(self._request_ids)
+
+    def try_hedge(self) -> bool:
+        """Take one hedge from the budget, if any is left."""
+        with self.lock:
+            # Allow one hedge up front so the budget does not block the very first slow request
+            if self.hedges + 1 > self.budget_ratio * self.requests + 1:
+                return False
+            self.hedges += 1
+            return True
+
+    def refuse_hedge(self) -> None:
+        """Give back a hedge taken with `try_hedge` that was not admitted, so it is never sent."""
+        with self.lock:
+            self.hedges -= 1
+            self.refused += 1
+
+    def record(self, timing: AttemptTiming) -> None:
+        with self.lock:
+            self.timings.append(timing)
+            if timing.latency is not None and timing.outcome in ("won", "lost"):
+                if timing.kind not in self.latencies:
+                    self.latencies[timing.kind] = deque(maxlen=self.window)
+                self.latencies[timing.kind].append(timing.latency)
+            if timing.hedged and timing.outcome == "won":
+                self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedges_refused": self.refused,
+                "hedge_rate": self.hedges / self.requests if self.requests else 0.0
+            }
+
+
+def _admit_hedge(policy: HedgePolicy, attempts: int, admit: Optional[Callable[[], bool]]) -> bool:
+    """Whether another attempt may be sent: within the policy's limits and, if given, admitted by `admit`."""
+    if attempts > policy.max_hedges or not policy.try_hedge():
+        return False
+    if admit is not None and not admit():
+        policy.refuse_hedge()
+        return False
+    return True
+
+
+def run_hedged(send: Callable[[], T], policy: HedgePolicy, executor: Executor,
+               on_discard: Optional[Callable[[T], None]] = None, kind: str = COMPLETE,
+               admit: Optional[Callable[[], bool]] = None) -> T:
+    """
+    Call `send` and, if it is slower than the policy's deadline, call it again in
+    parallel; return whichever attempt succeeds first.
+
+    Attempts that lose the race run to completion in the background (a blocking
+    call cannot be cancelled); `on_discard` receives their results, for example to
+    close a streaming response. `kind` picks the latency window the deadline comes
+    from and the attempts are recorded in. `admit` is asked before each hedge
+    (the first attempt is the caller's to admit) and the hedge is skipped if it
+    returns False, e.g. a RequestScheduler's `try_acquire`, so hedges stay within
+    the account's rate limits. If every attempt fails, the first error is raised.
+    """
+    request_id = policy.start_request()
+    started = time.monotonic()
+    attempts: List[Future] = []
+    sent_at: Dict[Future, float] = {}
+    winner: List[Future] = []
+    lock = threading.Lock()
+
+    def claim(future: Future) -> bool:
+        """Make `future` the winner unless another attempt already is; True if it is the winner."""
+        with lock:
+            if not winner:
+                winner.append(future)
+            return winner[0] is future
+
+    def finished(future: Future, attempt: int) -> None:
+        latency = time.monotonic() - started - sent_at[future]
+        if future.exception() is not None:
+            outcome = "error"
+        else:
+            outcome = "won" if claim(future) else "lost"
+        policy.record(AttemptTiming(request_id, attempt, attempt > 0, sent_at[future], latency, outcome, kind))
+        if outcome == "lost" and on_discard is not None:
+            on_discard(future.result())
+
+    def launch() -> Future:
+        attempt = len(attempts)
+        future = executor.submit(send)
+        sent_at[future] = time.monotonic() - started
+        attempts.append(future)
+        future.add_done_callback(lambda f: finished(f, attempt))
+        return future
+
+    pending = {launch()}
+    deadline: Optional[float] = policy.delay(kind)
+    first_error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, timeout=deadline, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                claim(future)
+                return winner[0].result()
+            first_error = first_error or future.exception()
+        if not done:
+            if _admit_hedge(policy, len(attempts), admit):
+                pending.add(launch())
+            else:
+                # Out of hedges: wait for the outstanding attempts
+                deadline = None
+    raise first_error
+
+
+async def run_hedged_async(send: Callable[[], Awaitable[T]], policy: HedgePolicy,
+                           on_discard: Optional[Callable[[T], Any]] = None, kind: str = COMPLETE,
+                           admit: Optional[Callable[[], bool]] = None) -> T:
+    """
+    Asynchronous `run_hedged`. Attempts still running when one succeeds are
+    cancelled; `on_discard` receives the results of attempts that succeeded in the
+    same instant as the winner.
+    """
+    request_id = policy.start_request()
+    started = time.monotonic()
+    attempts: List[asyncio.Future] = []
+    sent_at: Dict[asyncio.Future, float] = {}
+
+    def record(task: asyncio.Future, outcome: str) -> None:
+        latency = None if outcome == "cancelled" else time.monotonic() - started - sent_at[task]
+        attempt = attempts.index(task)
+        policy.record(AttemptTiming(request_id, attempt, attempt > 0, sent_at[task], latency, outcome, kind))
+
+    def launch() -> asyncio.Future:
+        task = asyncio.ensure_future(send())
+        sent_at[task] = time.monotonic() - started
+        attempts.append(task)
+        return task
+
+    pending = {launch()}
+    deadline: Optional[float] = policy.delay(kind)
+    first_error: Optional[BaseException] = None
+    winner: Optional[asyncio.Future] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    record(task, "error")
+                    first_error = first_error or task.exception()
+                elif winner is None:
+                    winner = task
+                    record(task, "won")
+                else:
+                    record(task, "lost")
+                    if on_discard is not None:
+                        discarded = on_discard(task.result())
+                        if asyncio.iscoroutine(discarded):
+                            await discarded
+            if winner is not None:
+                return winner.result()
+            if not done:
+                if _admit_hedge(policy, len(attempts), admit):
+                    pending.add(launch())
+                else:
+                    deadline = None
+        raise first_error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+                record(task, "cancelled")
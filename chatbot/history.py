@@ -0,0 +1,247 @@
+import json
+import re
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from chatbot.payload import dumps
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to an estimate
+    tiktoken = None
+
+# Fixed per-message overhead of the chat format (role, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+WORD_REGEX = re.compile(r"\w+|[^\w\s]")
+
+
+def approximate_token_count(text: str) -> int:
+    """Estimate the token count of `text` without a model-specific tokenizer."""
+    if not text:
+        return 0
+    # BPE tokenizers average roughly four characters per token for English text,
+    # but never produce fewer tokens than there are words and punctuation marks.
+    return max(len(WORD_REGEX.findall(text)), (len(text) + 3) // 4)
+
+
+def get_tokenizer(model: str) -> Callable[[str], int]:
+    """Return a token counting function for `model`, using tiktoken when it is installed."""
+    if tiktoken is None:
+        return approximate_token_count
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text or ""))
+
+
+class ConversationHistory:
+    """
+    Conversation messages managed by token budget.
+
+    Each message's token count is computed once when it is added. When the total
+    exceeds `max_tokens`, the oldest turns are evicted (a turn starts at a user
+    message, so function call exchanges are never split). Evicted turns are folded
+    into a rolling summary message, which is only regenerated once the evicted text
+    since the last summary exceeds `summary_threshold_tokens`.
+
+    With `defer_summary`, evicted turns are collected but `summarizer` is not called;
+    the owner checks `needs_summary` and passes the new summary to `apply_summary`
+    (used by the async handler, which must not block the event loop). Otherwise
+    the summarizer runs inside `trim`, so a summarizer that calls the model (as
+    OpenAIHandler's does) holds up the turn that triggered it for one request.
+
+    Messages are kept in deques, so evicting from the front does not shift the
+    rest, and each one is JSON encoded once when it is added. The encodings are
+    also appended, each followed by a comma, to a running buffer; evicted
+    messages are cut off its front (CPython only moves the buffer's start
+    pointer), so `encoded_messages` gets a request's messages with one copy of
+    that buffer instead of joining every message again. Messages must therefore
+    not be modified after they are appended.
+
+    Every message appended gets the next sequence number; `first_seq` is the
+    number of the oldest one still held, so a store can persist the messages
+    added since its last save and drop the ones evicted (see
+    PersistentSessionStore).
+    """
+    __slots__ = ("max_tokens", "tokenizer", "summarizer", "summary_threshold_tokens", "max_messages",
+                 "defer_summary", "messages", "token_counts", "encoded", "total_tokens", "first_seq", "summary",
+                 "summary_tokens", "summary_encoded", "_encoded_items", "_encoded_messages", "unsummarized",
+                 "unsummarized_tokens")
+
+    def __init__(self, max_tokens: int = 2000, tokenizer: Optional[Callable[[str], int]] = None,
+                 summarizer: Optional[Callable[[Optional[str], List[Dict[str, Any]]], str]] = None,
+                 summary_threshold_tokens: int = 500, max_messages: Optional[int] = None,
+                 defer_summary: bool = False):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer or approximate_token_count
+        self.summarizer = summarizer
+        self.summary_threshold_tokens = summary_threshold_tokens
+        self.max_messages = max_messages
+        self.defer_summary = defer_summary
+        self.messages: Deque[Dict[str, Any]] = deque()
+        self.token_counts: Deque[int] = deque()
+        self.encoded: Deque[bytes] = deque()
+        self.total_tokens = 0
+        # Sequence number of messages[0]
+        self.first_seq = 0
+        self.summary: Optional[str] = None
+        self.summary_tokens = 0
+        self.summary_encoded: Optional[bytes] = None
+        # Each encoded message followed by a comma, kept up to date as messages are added and evicted
+        self._encoded_items = bytearray()
+        # JSON array of the request messages, rebuilt after the history changes
+        self._encoded_messages: Optional[bytes] = None
+        # Evicted messages that are not yet part of the summary
+        self.unsummarized: List[Dict[str, Any]] = []
+        self.unsummarized_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def count_tokens(self, message: Dict[str, Any]) -> int:
+        tokens = MESSAGE_TOKEN_OVERHEAD + self.tokenizer(message.get("content") or "")
+        function_call = message.get("function_call")
+        if function_call:
+            tokens += self.tokenizer(function_call.get("name", "")) + self.tokenizer(function_call.get("arguments", ""))
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function") or {}
+            tokens += self.tokenizer(function.get("name", "")) + self.tokenizer(function.get("arguments", ""))
+        return tokens
+
+    def append(self, message: Dict[str, Any]) -> None:
+        tokens = self.count_tokens(message)
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        encoded = dumps(message)
+        self.encoded.append(encoded)
+        self._encoded_items += encoded + b","
+        self.total_tokens += tokens
+        self._encoded_messages = None
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence number of the next message appended."""
+        return self.first_seq + len(self.messages)
+
+    def clear(self) -> None:
+        # Sequence numbers keep counting, so stored messages of the cleared conversation are never reused
+        self.first_seq = self.next_seq
+        self.messages.clear()
+        self.token_counts.clear()
+        self.encoded.clear()
+        self._encoded_items = bytearray()
+        self.total_tokens = 0
+        self.summary = None
+        self.summary_tokens = 0
+        self.summary_encoded = None
+        self._encoded_messages = None
+        self.unsummarized = []
+        self.unsummarized_tokens = 0
+
+    @property
+    def payload_tokens(self) -> int:
+        """Token count of the messages sent with a request, including the summary."""
+        return self.total_tokens + self.summary_tokens
+
+    def to_messages(self) -> List[Dict[str, Any]]:
+        """Return the messages to send with a request, starting with the summary if there is one."""
+        messages = list(self.messages)
+        if self.summary:
+            messages.insert(0, self.summary_message())
+        return messages
+
+    def encoded_messages(self) -> bytes:
+        """The messages of `to_messages` as a JSON array, copied from the running encoding."""
+        if self._encoded_messages is None:
+            head = [b"[", self.summary_encoded, b","] if self.summary_encoded is not None else [b"["]
+            if self._encoded_items:
+                # Without the last comma; the view must be released before the buffer can change again
+                with memoryview(self._encoded_items) as view, view[:-1] as items:
+                    self._encoded_messages = b"".join(head + [items, b"]"])
+            else:
+                self._encoded_messages = b"".join(head[:2] + [b"]"])
+        return self._encoded_messages
+
+    def summary_message(self) -> Dict[str, Any]:
+        return {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+
+    def trim(self) -> None:
+        """Evict the oldest turns until the history fits the token and message budgets."""
+        while len(self.messages) > 1 and (
+            self.payload_tokens > self.max_tokens
+            or (self.max_messages is not None and len(self.messages) > self.max_messages)
+        ):
+            # Evict up to the next user message so a turn is dropped as a whole
+            end = 1
+            while end < len(self.messages) - 1 and self.messages[end].get("role") != "user":
+                end += 1
+            self._evict(end)
+
+        if self.summarizer and not self.defer_summary and self.needs_summary:
+            self._summarize()
+
+    @property
+    def needs_summary(self) -> bool:
+        """Whether enough evicted text has accumulated to regenerate the summary."""
+        return self.unsummarized_tokens >= self.summary_threshold_tokens
+
+    def _evict(self, count: int) -> None:
+        evicted = [self.messages.popleft() for _ in range(count)]
+        evicted_tokens = sum(self.token_counts.popleft() for _ in range(count))
+        # Each evicted message and the comma after it
+        evicted_bytes = sum(len(self.encoded.popleft()) + 1 for _ in range(count))
+        # Deleting a prefix of a bytearray moves its start instead of the remaining bytes
+        del self._encoded_items[:evicted_bytes]
+        self.total_tokens -= evicted_tokens
+        self.first_seq += count
+        self._encoded_messages = None
+        if self.summarizer or self.defer_summary:
+            self.unsummarized.extend(evicted)
+            self.unsummarized_tokens += evicted_tokens
+
+    def _summarize(self) -> None:
+        try:
+            summary = self.summarizer(self.summary, self.unsummarized)
+        except Exception as e:
+            # Keep the previous summary and drop the evicted turns so memory stays bounded
+            print(f"Error summarizing conversation history: {e}")
+            summary = self.summary
+        self.apply_summary(summary)
+
+    def apply_summary(self, summary: Optional[str]) -> None:
+        """Replace the rolling summary with one that covers all evicted turns."""
+        self.summary = summary
+        self.summary_tokens = self.count_tokens(self.summary_message()) if summary else 0
+        self.summary_encoded = dumps(self.summary_message()) if summary else None
+        self._encoded_messages = None
+        self.unsummarized = []
+        self.unsummarized_tokens = 0
+
+    def restore(self, first_seq: int, rows: Iterable[Tuple[int, int, bytes]], summary: Optional[str]) -> None:
+        """
+        Replace the contents with stored messages: (sequence number, token count,
+        JSON) rows in order, where rows before `first_seq` are evicted messages not
+        yet folded into `summary`. Nothing is re-encoded or re-counted.
+        """
+        self.clear()
+        self.apply_summary(summary)
+        self.first_seq = first_seq
+        for seq, tokens, encoded in rows:
+            message = json.loads(encoded)
+            if seq < first_seq:
+                self.unsummarized.append(message)
+                self.unsummarized_tokens += tokens
+            else:
+                self.messages.append(message)
+                self.token_counts.append(tokens)
+                self.encoded.append(encoded)
+                self._encoded_items += encoded + b","
+                self.total_tokens += tokens
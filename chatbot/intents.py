@@ -0,0 +1,284 @@
+import datetime
+import difflib
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from chatbot.tracing import TRACER
+
+# Contractions and fillers are normalized away before matching, so patterns only
+# have to cover the core phrasing ("what's the time please" -> "what is the time").
+CONTRACTIONS = {"what's": "what is", "whats": "what is", "it's": "it is", "that's": "that is",
+                "let's": "let us", "i'd": "i would", "can't": "cannot", "don't": "do not"}
+CONTRACTION_REGEX = re.compile(r"\b(?:" + "|".join(re.escape(word) for word in CONTRACTIONS) + r")(?=\s|$)")
+PUNCTUATION_REGEX = re.compile(r"[^\w\s%']+|'(?!\w)|(?<!\w)'")
+LEADING_FILLER_REGEX = re.compile(
+    r"^(?:(?:hey|ok|okay|um|uh|so|please|(?:can|could|would|will) you(?: please)?|tell me|do you know|"
+    r"i want to know|i would like to know)\s+)+"
+)
+TRAILING_FILLER_REGEX = re.compile(r"(?:\s+(?:please|thanks|thank you|now|right now))+$")
+GROUP_NAME_REGEX = re.compile(r"\(\?P<(\w+)>")
+
+# Utterances longer than this are never fuzzy matched; they are real questions
+FUZZY_MAX_WORDS = 6
+
+
+def normalize(text: str) -> str:
+    """Lowercase, expand contractions and drop punctuation and filler words."""
+    text = text.lower().replace("’", "'")
+    text = CONTRACTION_REGEX.sub(lambda match: CONTRACTIONS[match.group(0)], text)
+    text = " ".join(PUNCTUATION_REGEX.sub(" ", text).split())
+    text = LEADING_FILLER_REGEX.sub("", text)
+    return TRAILING_FILLER_REGEX.sub("", text)
+
+
+class Intent:
+    """
+    A request that can be answered locally.
+
+    `patterns` are regular expressions over normalized text and must match the
+    whole utterance; named groups become slots. `examples` are canonical phrasings
+    used for fuzzy matching (near misses like "what time it is"). The handler is
+    called with the IntentMatch and the router's context and returns the reply
+    to speak ("" for none).
+
+    While a tool flow is waiting for an answer (the context's `in_tool_flow`),
+    intents with `during_tool_flow=False` are not matched and the utterance goes
+    to the flow instead ("cancel" or "bye" mid-ticket must not end the session).
+    """
+
+    def __init__(self, name: str, patterns: Iterable[str], handler: Callable[["IntentMatch", Any], str],
+                 examples: Iterable[str] = (), during_tool_flow: bool = True):
+        self.name = name
+        self.patterns = list(patterns)
+        self.handler = handler
+        self.examples = list(examples)
+        self.during_tool_flow = during_tool_flow
+
+
+class IntentMatch:
+    __slots__ = ("intent", "text", "slots", "fuzzy")
+
+    def __init__(self, intent: Intent, text: str, slots: Dict[str, str], fuzzy: bool = False):
+        self.intent = intent
+        self.text = text
+        self.slots = slots
+        self.fuzzy = fuzzy
+
+    @property
+    def name(self) -> str:
+        return self.intent.name
+
+
+class IntentRouter:
+    """
+    Answers common requests locally instead of sending them to the model.
+
+    Every registered intent is compiled into a single regular expression
+    alternation, so routing an utterance is one match over normalized text
+    whatever the number of intents. Short utterances that match nothing are
+    compared against the intents' examples with difflib as a fallback.
+
+    Handlers are pluggable: `register` an Intent, or use the `intent` decorator.
+    """
+
+    def __init__(self, intents: Iterable[Intent] = (), fuzzy_cutoff: float = 0.85):
+        self.intents: List[Intent] = []
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.matcher: Optional["re.Pattern"] = None
+        self.examples: Dict[str, Intent] = {}
+        for intent in intents:
+            self.register(intent)
+
+    def register(self, intent: Intent) -> Intent:
+        # Replaces an intent of the same name, so default handlers can be overridden
+        self.intents = [existing for existing in self.intents if existing.name != intent.name]
+        self.intents.append(intent)
+        self._compile()
+        return intent
+
+    def intent(self, name: str, patterns: Iterable[str], examples: Iterable[str] = ()):
+        """Decorator registering the decorated function as the handler of a new intent."""
+        def decorator(handler):
+            self.register(Intent(name, patterns, handler, examples))
+            return handler
+        return decorator
+
+    def _compile(self) -> None:
+        alternatives = []
+        for index, intent in enumerate(self.intents):
+            if not intent.patterns:
+                continue
+            # Slot groups are prefixed with the intent index so slot names can repeat across intents
+            patterns = [GROUP_NAME_REGEX.sub(f"(?P<i{index}_\\1>", pattern) for pattern in intent.patterns]
+            alternatives.append(f"(?P<i{index}>" + "|".join(f"(?:{pattern})" for pattern in patterns) + ")")
+        self.matcher = re.compile("|".join(alternatives)) if alternatives else None
+        self.examples = {normalize(example): intent for intent in self.intents for example in intent.examples}
+
+    def _match_exact(self, normalized: str) -> Optional[IntentMatch]:
+        found = self.matcher.fullmatch(normalized) if self.matcher is not None else None
+        if found is None:
+            return None
+        # The intent's group closes last, so it is the last group matched
+        index = int(found.lastgroup[1:])
+        prefix = f"i{index}_"
+        slots = {name[len(prefix):]: value for name, value in found.groupdict().items()
+                 if value is not None and name.startswith(prefix)}
+        return IntentMatch(self.intents[index], normalized, slots)
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        """Return the intent `text` asks for, or None if it should go to the model."""
+        normalized = normalize(text)
+        if not normalized:
+            return None
+        match = self._match_exact(normalized)
+        if match is not None:
+            return match
+
+        if self.examples and len(normalized.split()) <= FUZZY_MAX_WORDS:
+            close = difflib.get_close_matches(normalized, self.examples, n=1, cutoff=self.fuzzy_cutoff)
+            if close:
+                # Match the example itself to recover its slots
+                example = self._match_exact(close[0])
+                intent = self.examples[close[0]]
+                slots = example.slots if example is not None and example.intent is intent else {}
+                return IntentMatch(intent, normalized, slots, fuzzy=True)
+        return None
+
+    def handle(self, text: str, context: Any = None) -> Optional[str]:
+        """Answer `text` locally: the reply to give, or None if no intent matched."""
+        with TRACER.span("intent") as span:
+            match = self.match(text)
+            if match is not None and not match.intent.during_tool_flow and getattr(context, "in_tool_flow", False):
+                # The utterance answers the tool flow's question
+                match = None
+            span.set(intent=match.name if match else None)
+        if match is None:
+            return None
+        return match.intent.handler(match, context)
+
+
+class AssistantContext:
+    """What the default intent handlers act on; the entry points keep `last_answer` up to date."""
+
+    def __init__(self, chatbot=None, tts=None):
+        self.chatbot = chatbot
+        self.tts = tts
+        self.last_answer: Optional[str] = None
+        # Set by the exit intent; the entry point ends the session
+        self.should_exit = False
+
+    @property
+    def in_tool_flow(self) -> bool:
+        return self.chatbot is not None and self.chatbot.in_tool_flow
+
+
+VOLUME_STEP = 0.1
+RATE_STEP = 25
+DEFAULT_RATE = 150
+
+
+def tell_time(match: IntentMatch, context: AssistantContext) -> str:
+    return f"The current time is {datetime.datetime.now().strftime('%I:%M %p')}"
+
+
+def tell_date(match: IntentMatch, context: AssistantContext) -> str:
+    return f"Today is {datetime.datetime.now().strftime('%A, %B %d, %Y')}"
+
+
+def reset_conversation(match: IntentMatch, context: AssistantContext) -> str:
+    if context.chatbot is not None:
+        context.chatbot.reset_conversation()
+    if context.tts is not None:
+        context.tts.cancel()
+    context.last_answer = None
+    return "Conversation cleared."
+
+
+def stop_speaking(match: IntentMatch, context: AssistantContext) -> str:
+    if context.tts is not None:
+        context.tts.cancel()
+    return ""
+
+
+def exit_session(match: IntentMatch, context: AssistantContext) -> str:
+    context.should_exit = True
+    return ""
+
+
+def repeat_last_answer(match: IntentMatch, context: AssistantContext) -> str:
+    return context.last_answer or "I haven't said anything yet."
+
+
+def change_volume(match: IntentMatch, context: AssistantContext) -> str:
+    if context.tts is None:
+        return ""
+    if "level" in match.slots:
+        volume = int(match.slots["level"]) / 100
+    elif "down" in match.slots:
+        volume = context.tts.volume - VOLUME_STEP
+    else:
+        volume = context.tts.volume + VOLUME_STEP
+    context.tts.configure(volume=volume)
+    return f"Volume set to {round(context.tts.volume * 100)} percent."
+
+
+def change_rate(match: IntentMatch, context: AssistantContext) -> str:
+    if context.tts is None:
+        return ""
+    if "normal" in match.slots:
+        rate = DEFAULT_RATE
+    elif "slower" in match.slots:
+        rate = max(RATE_STEP, context.tts.rate - RATE_STEP)
+    else:
+        rate = context.tts.rate + RATE_STEP
+    context.tts.configure(rate=rate)
+    return "Okay."
+
+
+DEFAULT_INTENTS = [
+    Intent("time", [
+        r"what (?:is )?(?:the )?time(?: is it)?",
+        r"what time is it",
+        r"what time it is",
+        r"(?:the )?(?:current )?time",
+    ], tell_time, examples=["what time is it", "what is the time"]),
+    Intent("date", [
+        r"what (?:is )?(?:the |today(?:s|'s) )?date(?: today)?",
+        r"what date is it(?: today)?",
+        r"what day is (?:it|today)",
+        r"(?:today(?:s|'s) )?date",
+    ], tell_date, examples=["what date is it", "what is the date", "what day is it"]),
+    Intent("reset", [
+        r"new (?:chat|conversation)",
+        r"(?:start (?:a )?new|reset(?: the)?|clear(?: the)?|start over)(?: (?:chat|conversation|history))?",
+    ], reset_conversation, examples=["new chat", "new conversation", "clear conversation"]),
+    Intent("stop", [
+        r"stop(?: (?:talking|speaking))?",
+        r"(?:be )?quiet|shut up|silence|never mind|nevermind|cancel",
+    ], stop_speaking, examples=["stop talking"], during_tool_flow=False),
+    Intent("exit", [
+        r"exit|quit|goodbye|bye|good bye",
+    ], exit_session, during_tool_flow=False),
+    Intent("repeat", [
+        r"(?:repeat|say) (?:that|it)(?: again)?",
+        r"repeat(?: (?:the )?last (?:answer|response))?",
+        r"what did you (?:just )?say",
+        r"come again|pardon|sorry what",
+    ], repeat_last_answer, examples=["repeat that", "say that again", "what did you say"]),
+    Intent("volume", [
+        r"(?:set )?(?:the )?volume (?:to )?(?P<level>\d{1,3})(?: ?%| percent)?",
+        r"(?P<up>louder|speak up|volume up|turn (?:it |the volume )?up|turn up the volume|increase the volume)",
+        r"(?P<down>quieter|softer|volume down|turn (?:it |the volume )?down|turn down the volume"
+        r"|(?:decrease|lower) the volume)",
+    ], change_volume, examples=["volume up", "volume down", "louder", "quieter"]),
+    Intent("rate", [
+        r"(?P<faster>(?:speak|talk|go) (?:faster|quicker)|speed up)",
+        r"(?P<slower>(?:speak|talk|go) slower|slow down)",
+        r"(?P<normal>(?:speak|talk) (?:at )?normal(?:ly| speed)?|normal speed)",
+    ], change_rate, examples=["speak faster", "speak slower", "slow down", "speed up"]),
+]
+
+
+def default_router() -> IntentRouter:
+    """A router with the built-in intents: time, date, reset, stop, exit, repeat, volume and rate."""
+    return IntentRouter(DEFAULT_INTENTS)
@@ -1,12 +1,74 @@
+import contextvars
 import os
 import time
 import requests
-from typing import Dict, Callable, Any, Optional, Tuple
-import json
+from typing import Dict, Callable, Any, Generator, List, Optional, Tuple
 import re
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from chatbot.hedging import STREAM, HedgePolicy, run_hedged
+from chatbot.history import ConversationHistory, get_tokenizer
+from chatbot.payload import ChatRequest, RequestEncoder, dumps
+from chatbot.response_cache import ResponseCache
+from chatbot.routing import Route, RoutingPolicy
+from chatbot.scheduler import PRIORITY_INTERACTIVE, RequestScheduler, backoff_delay, estimate_request_tokens, parse_retry_after
+from chatbot.session import ConversationState, SessionStore
+from chatbot.slots import SlotFiller, is_valid_email, normalize_email
+from chatbot.streaming import StreamAccumulator, iter_sse_json
+from chatbot.tools import ToolCall, ToolRegistry, ToolResult, encode_tool_result, tool_calls_of, tool_result_messages
+from chatbot.tracing import TRACER
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# How the handler decides whether a conversation is finished:
+#   "llm"   - ask the model in the background while the reply is being spoken
+#   "local" - match closing remarks locally, no extra API call
+#   "none"  - never report the conversation as finished
+FINISH_CHECK_MODES = ("llm", "local", "none")
+
+# When an email collected for a tool call is read back for confirmation:
+#   "always" - every time
+#   "spoken" - only if the user did not write it out verbatim (e.g. "john at example dot com")
+#   "never"  - never
+EMAIL_CONFIRM_MODES = ("always", "spoken", "never")
+
+# How tools are offered to the model:
+#   "tools"     - the `tools` parameter; the model may make several calls at once (`tool_calls`)
+#   "functions" - the legacy `functions` parameter; one `function_call` per reply
+TOOL_FORMATS = ("tools", "functions")
+
+# Tools available to every handler unless another registry is passed
+TOOLS = ToolRegistry()
+
+FINISH_CHECK_PROMPT = {"role": "user", "content": "Is this conversation complete? Answer with 'yes' or 'no'."}
+FINISH_CHECK_PROMPT_ENCODED = dumps(FINISH_CHECK_PROMPT)
+
+# Prompts spoken verbatim during tool flows
+EMAIL_RETRY_PROMPT = "It seems like the email is incorrect. Please provide a new email address."
+MISSING_FIELD_PROMPT = "Please provide the following information to proceed:\n- {field_description}"
+
+# Result sent to the model for an interactive tool call made alongside other calls; the call itself
+# runs once the user has provided and confirmed its arguments
+DEFERRED_TOOL_RESULT = "Pending: the details are being collected from the user. The result follows once it has run."
+
+# Closing remarks recognised by the local finish check
+CLOSING_REMARK_REGEX = re.compile(
+    r"^(?:(?:ok(?:ay)?|great|perfect|cool|alright|no),?\s+)?"
+    r"(?:thanks?(?: you)?(?: so much| very much)?(?:,? that'?s (?:all|it))?|that'?s (?:all|it)(?: for now)?|"
+    r"(?:good)?bye(?: bye)?|see you|nothing else|no thanks?(?: you)?|i'?m (?:all set|done|good))"
+    r"(?:,?\s+(?:thanks?(?: you)?|(?:good)?bye))*[.!]*$",
+    re.IGNORECASE
+)
 
 class OpenAIHandler:
-    def __init__(self, api_key=None, model="gpt-3.5-turbo", max_history=10, max_tokens=300, temperature=0.5, retries=3, timeout=10):
+    def __init__(self, api_key=None, model="gpt-3.5-turbo", max_history=None, max_tokens=300, temperature=0.5, retries=3, timeout=10, api_url=OPENAI_CHAT_URL,
+                 finish_check="llm", on_finished: Optional[Callable[[bool], None]] = None,
+                 max_history_tokens=2000, summary_threshold_tokens=500, tokenizer: Optional[Callable[[str], int]] = None,
+                 response_cache: Optional[ResponseCache] = None, scheduler: Optional[RequestScheduler] = None,
+                 priority=PRIORITY_INTERACTIVE, hedge_policy: Optional[HedgePolicy] = None, confirm_email="spoken",
+                 tools: Optional[ToolRegistry] = None, tool_format="tools", max_tool_rounds=3,
+                 routing_policy: Optional[RoutingPolicy] = None, session_store: Optional[SessionStore] = None,
+                 session_id="default"):
         self.api_key = api_key or os.environ.get("openai_token")
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Please set the 'openai_token' environment variable.")
@@ -16,115 +78,298 @@ class OpenAIHandler:
         self.temperature = temperature
         self.retries = retries
         self.timeout = timeout
-        self.conversation_history = []
+        self.api_url = api_url
+        # Optional cache in front of the chat completion request
+        self.response_cache = response_cache
+        # Optional admission control shared with other handlers on the same account
+        self.scheduler = scheduler
+        self.priority = priority
+        # Opt-in hedging: send a duplicate request when the first one is slower than usual
+        self.hedge_policy = hedge_policy
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        # Opt-in routing: pick the model and max_tokens of each turn instead of `model` and `max_tokens`
+        self.routing_policy = routing_policy
+        if finish_check not in FINISH_CHECK_MODES:
+            raise ValueError(f"Invalid finish_check '{finish_check}'. Expected one of {FINISH_CHECK_MODES}.")
+        self.finish_check = finish_check
+        if confirm_email not in EMAIL_CONFIRM_MODES:
+            raise ValueError(f"Invalid confirm_email '{confirm_email}'. Expected one of {EMAIL_CONFIRM_MODES}.")
+        self.confirm_email = confirm_email
+        if tool_format not in TOOL_FORMATS:
+            raise ValueError(f"Invalid tool_format '{tool_format}'. Expected one of {TOOL_FORMATS}.")
+        self.tool_format = tool_format
+        # Follow-up requests allowed per turn for tool results
+        self.max_tool_rounds = max_tool_rounds
+        self.on_finished = on_finished
+        self._finish_executor: Optional[ThreadPoolExecutor] = None
+        self.max_history_tokens = max_history_tokens
+        self.summary_threshold_tokens = summary_threshold_tokens
+        self.tokenizer = tokenizer or get_tokenizer(model)
+        # History, pending function calls and confirmation steps of the conversation, kept in
+        # `session_store` under `session_id` when one is given (saved after every turn)
+        self.session_store = session_store
+        self.session_id = session_id
+        if session_store is not None:
+            if session_store.state_factory is None:
+                session_store.state_factory = self.new_state
+            self.state = session_store.get(session_id)
+        else:
+            self.state = self.new_state()
         self.session = requests.Session()
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        # Request bodies are encoded here, reusing the bytes of unchanged members
+        self.request_encoder = RequestEncoder()
         
-        # Define available functions
-        self.functions = [
-            {
-                "name": "CreateTicket",
-                "description": "Creates a support ticket with the provided user details and issue description.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "name": {
-                            "type": "string",
-                            "description": "The name of the user."
-                        },
-                        "email": {
-                            "type": "string",
-                            "description": "The user's email address."
-                        },
-                        "issue": {
-                            "type": "string",
-                            "description": "Description of the issue."
-                        },
-                        "contact_number": {
-                            "type": "string",
-                            "description": "The user's contact number (optional)."
-                        }
-                    },
-                    "required": ["name", "email", "issue"]
-                }
-            }
-        ]
-        
-        # Map function names to actual Python functions
-        self.function_map: Dict[str, Callable[..., Any]] = {
-            "CreateTicket": CreateTicket
-        }
-        
-        # To keep track of incomplete function calls
-        self.pending_function_calls: Dict[str, Dict[str, Any]] = {}
-        
-        # To keep track of confirmation steps
-        self.confirmation_steps: Dict[str, Dict[str, Any]] = {}
-        
+        # Tools the model may call, indexed by name with their schemas built once
+        self.tools = tools if tools is not None else TOOLS
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
+        # Slot fillers for the functions' parameters, built on first use
+        self._slot_fillers: Dict[str, SlotFiller] = {}
+
+    def new_state(self, defer_summary: bool = False) -> ConversationState:
+        """Create an empty conversation state configured with this handler's history budget."""
+        # History is bounded by token budget (and optionally message count); evicted
+        # turns are folded into a rolling summary
+        return ConversationState(ConversationHistory(
+            max_tokens=self.max_history_tokens,
+            tokenizer=self.tokenizer,
+            summarizer=self._summarize_history,
+            summary_threshold_tokens=self.summary_threshold_tokens,
+            max_messages=self.max_history,
+            defer_summary=defer_summary
+        ))
+
+    @property
+    def functions(self) -> List[Dict[str, Any]]:
+        """Function definitions of the registered tools (legacy `functions` format)."""
+        return self.tools.functions
+
+    @property
+    def conversation_history(self) -> ConversationHistory:
+        return self.state.conversation_history
+
+    @property
+    def pending_function_calls(self) -> Dict[str, Dict[str, Any]]:
+        return self.state.pending_function_calls
+
+    @pending_function_calls.setter
+    def pending_function_calls(self, value: Dict[str, Dict[str, Any]]) -> None:
+        self.state.pending_function_calls = value
+
+    @property
+    def confirmation_steps(self) -> Dict[str, Dict[str, Any]]:
+        return self.state.confirmation_steps
+
+    @confirmation_steps.setter
+    def confirmation_steps(self, value: Dict[str, Dict[str, Any]]) -> None:
+        self.state.confirmation_steps = value
+
+    @property
+    def in_tool_flow(self) -> bool:
+        """Whether the next user message answers a tool flow's question (a missing field or a confirmation)."""
+        return bool(self.pending_function_calls or self.confirmation_steps)
+
+    @property
+    def finish_future(self) -> Optional[Future]:
+        """Result of the latest finish check; resolved later when the check runs in the background."""
+        return self.state.finish_future
+
+    @finish_future.setter
+    def finish_future(self, value: Optional[Future]) -> None:
+        self.state.finish_future = value
+
+    def preconnect(self) -> bool:
+        """
+        Open a connection to the API host before the first request, so the first turn
+        does not wait for DNS, TCP and TLS setup. Returns False if the host is unreachable.
+        """
+        try:
+            # Any response leaves the connection open in the session's pool
+            self.session.head(self.api_url, timeout=self.timeout).close()
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"Error connecting to {self.api_url}: {e}")
+            return False
+
     def generate_response(self, prompt: str) -> Tuple[str, bool]:
+        try:
+            return self._generate_response(prompt)
+        finally:
+            self._save_state()
+
+    def _generate_response(self, prompt: str) -> Tuple[str, bool]:
         # Add user input to conversation history
         self.conversation_history.append({"role": "user", "content": prompt})
         self.trim_conversation_history()
 
+        local_response = self._handle_pending_state(prompt)
+        if local_response is not None:
+            return local_response
+
+        route = self._route()
+        message = self._complete(self._build_chat_data(route=route), route)
+        for _ in range(self.max_tool_rounds):
+            calls = self._tool_calls_to_run(message)
+            if not calls:
+                break
+            # Run the calls concurrently and send all results back in one follow-up request
+            self._append_tool_results(message, self.tools.execute(calls, self._get_tool_executor()))
+            if self._interactive_calls(message):
+                # The user is asked for the interactive call's details first
+                break
+            route = self._route(tool_round=True)
+            message = self._complete(self._build_chat_data(route=route), route)
+        return self._handle_assistant_message(message)
+
+    def _complete(self, data: dict, route: Optional[Route] = None) -> dict:
+        """Return the assistant message for a chat request, from the cache when possible."""
+        message = self.response_cache.get(data) if self.response_cache else None
+        if message is None:
+            started = time.monotonic()
+            response_json = self._make_gpt_request(data)
+
+            if not response_json:
+                raise ValueError("No response generated.")
+
+            self._record_route_latency(route, time.monotonic() - started)
+            message = response_json.get("choices")[0].get("message")
+            if self.response_cache:
+                self.response_cache.put(data, message)
+        return message
+
+    def _route(self, tool_round: bool = False) -> Optional[Route]:
+        """The route of the next request under the routing policy (None without one)."""
+        if self.routing_policy is None:
+            return None
+        return self.routing_policy.route(self._last_user_message(), tool_round)
+
+    def _record_route_latency(self, route: Optional[Route], latency: float, first_token: Optional[float] = None) -> None:
+        if route is not None and self.routing_policy is not None:
+            self.routing_policy.record(route.name, latency, first_token)
+
+    def _is_interactive(self, call: ToolCall) -> bool:
+        tool = self.tools.get(call.name)
+        return tool is not None and tool.interactive
+
+    def _tool_calls_to_run(self, message: dict) -> List[ToolCall]:
+        """
+        The tool calls in `message` to run right away and report back to the model:
+        all but the interactive ones, which go through the slot-filling flow in
+        `_handle_assistant_message` instead.
+        """
+        return [call for call in tool_calls_of(message) if not self._is_interactive(call)]
+
+    def _interactive_calls(self, message: dict) -> List[ToolCall]:
+        return [call for call in tool_calls_of(message) if self._is_interactive(call)]
+
+    def _append_tool_results(self, message: dict, results: List[ToolResult]) -> None:
+        # Every call needs a result; interactive calls made alongside get a placeholder
+        results = results + [ToolResult(call, DEFERRED_TOOL_RESULT) for call in self._interactive_calls(message)]
+        for history_message in tool_result_messages(message, results):
+            self.conversation_history.append(history_message)
+
+    def _get_tool_executor(self) -> ThreadPoolExecutor:
+        if self._tool_executor is None:
+            self._tool_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+        return self._tool_executor
+
+    def generate_response_stream(self, prompt: str) -> Generator[str, None, bool]:
+        """
+        Stream the reply to `prompt` as text deltas.
+
+        Yields the text as it arrives from the API and returns the conversation
+        finished flag when exhausted (wrap it in `SentenceStream` or `SpeechStream`
+        to get complete sentences and the flag). Replies that are produced locally, such as
+        confirmation prompts, are yielded as a single chunk.
+        """
+        try:
+            return (yield from self._generate_response_stream(prompt))
+        finally:
+            self._save_state()
+
+    def _generate_response_stream(self, prompt: str) -> Generator[str, None, bool]:
+        self.conversation_history.append({"role": "user", "content": prompt})
+        self.trim_conversation_history()
+
+        local_response = self._handle_pending_state(prompt)
+        if local_response is not None:
+            response_text, finished = local_response
+            yield response_text
+            return finished
+
+        for round_ in range(self.max_tool_rounds + 1):
+            route = self._route(tool_round=round_ > 0)
+            data = self._build_chat_data(stream=True, route=route)
+            message = self.response_cache.get(data) if self.response_cache else None
+            if message is not None:
+                if not tool_calls_of(message) and message.get("content"):
+                    yield message["content"]
+            else:
+                accumulator = StreamAccumulator()
+                started = time.monotonic()
+                first_token = None
+                for chunk in self._stream_gpt_request(data):
+                    delta = accumulator.add_chunk(chunk)
+                    if delta:
+                        if first_token is None:
+                            first_token = time.monotonic() - started
+                        yield delta
+                self._record_route_latency(route, time.monotonic() - started, first_token)
+                message = accumulator.message()
+                if self.response_cache:
+                    self.response_cache.put(data, message)
+
+            calls = self._tool_calls_to_run(message) if round_ < self.max_tool_rounds else []
+            if not calls:
+                break
+            # Run the calls concurrently, then stream the follow-up reply that uses their results
+            self._append_tool_results(message, self.tools.execute(calls, self._get_tool_executor()))
+            if self._interactive_calls(message):
+                break
+
+        response_text, finished = self._handle_assistant_message(message)
+        if tool_calls_of(message):
+            # Function call replies are composed locally once the arguments are complete.
+            yield response_text
+        return finished
+
+    def _handle_pending_state(self, prompt: str) -> Optional[Tuple[str, bool]]:
+        """Answer from the pending confirmation / missing field state, if any, without calling the API."""
         # Handle pending confirmations first
         if self.confirmation_steps:
             for func_name, confirm_info in list(self.confirmation_steps.items()):
                 if confirm_info.get("awaiting_confirmation"):
-                    user_response = prompt.strip().lower()
                     current_email = confirm_info.get("email_being_confirmed", "")
-                    
-                    # Extract email and additional info from the user response
-                    new_email, additional_info = self.extract_email_and_additional_info(user_response)
-                    
+
+                    # Pick up a corrected email, and any other field, from the same reply
+                    values = self._get_slot_filler(func_name).extract(prompt)
+                    new_email = values.pop("email", None)
+                    confirm_info["args"].update(values)
+
                     if new_email and new_email != current_email:
                         # User provided a new email, update the args
                         confirm_info["args"]["email"] = new_email
                         confirm_info["email_being_confirmed"] = new_email
-                        # Optionally, handle additional_info if needed
-                        if additional_info and "contact_number" in additional_info:
-                            confirm_info["args"]["contact_number"] = additional_info["contact_number"]
-                        
                         prompt_confirm = f"You provided a new email: **{new_email}**. Is this correct? (yes/no)"
                         self.conversation_history.append({"role": "assistant", "content": prompt_confirm})
                         return prompt_confirm, False
                     else:
                         # Interpret the response as confirmation or denial
-                        is_confirmed = self.interpret_confirmation(user_response)
+                        is_confirmed = self.interpret_confirmation(prompt.strip().lower())
                         if is_confirmed is True:
-                            # Proceed with ticket creation using the confirmed email
-                            function_args = confirm_info["args"]
-                            function = self.function_map.get(func_name)
-                            if function:
-                                try:
-                                    function_response = function(**function_args)
-                                    ticket_id = function_response.get("ticket_id")
-                                    if ticket_id:
-                                        assistant_message = f"Ticket created successfully with ID: {ticket_id}. Is there anything else I can help with?"
-                                    else:
-                                        assistant_message = f"I was unable to create the ticket due to {function_response.get('error', 'an error')}. Please provide the information again."
-                                    self.conversation_history.append({"role": "assistant", "content": assistant_message})
-                                    # Reset states after successful creation
-                                    self.reset_conversation()
-                                    finished = self._check_conversation_finished()
-                                    return assistant_message, finished
-                                except Exception as e:
-                                    error_message = f"An error occurred while creating the ticket: {e}"
-                                    self.conversation_history.append({"role": "assistant", "content": error_message})
-                                    return error_message, False
-                            else:
-                                error_message = f"Function '{func_name}' is not implemented."
-                                self.conversation_history.append({"role": "assistant", "content": error_message})
-                                return error_message, False
+                            del self.confirmation_steps[func_name]
+                            return self._execute_function_call(func_name, confirm_info["args"])
                         elif is_confirmed is False:
                             # User said "no", so prompt for a new email
-                            prompt_retry = "It seems like the email is incorrect. Please provide a new email address."
+                            prompt_retry = EMAIL_RETRY_PROMPT
                             self.conversation_history.append({"role": "assistant", "content": prompt_retry})
-                            # Reset confirmation step to expect a new email
-                            self.confirmation_steps[func_name]["awaiting_confirmation"] = False
-                            self.pending_function_calls[func_name] = confirm_info
+                            # Expect a new email as a missing field
+                            del self.confirmation_steps[func_name]
+                            confirm_info["args"].pop("email", None)
+                            self.pending_function_calls[func_name] = {"args": confirm_info["args"], "missing_fields": ["email"]}
                             return prompt_retry, False
                         else:
                             # Unable to interpret, prompt again
@@ -132,89 +377,158 @@ class OpenAIHandler:
                             self.conversation_history.append({"role": "assistant", "content": prompt_retry})
                             return prompt_retry, False
 
-        # If there is a pending function call, handle missing fields
+        # If there is a pending function call, fill its missing fields from the reply
         if self.pending_function_calls:
             function_name, pending_info = next(iter(self.pending_function_calls.items()))
-            missing_fields = pending_info.get("missing_fields", [])
-            if missing_fields:
-                # Prompt the user for the first missing field
-                next_field = missing_fields[0]
-                field_description = self.get_field_description(function_name, next_field)
-                prompt_missing = f"Please provide the following information to proceed:\n- {field_description}"
-                self.conversation_history.append({"role": "assistant", "content": prompt_missing})
-                return prompt_missing, False
-
-        # Prepare data with function definitions for GPT-3
-        data = {
-            "model": self.model,
-            "messages": self.conversation_history,
-            "max_tokens": self.max_tokens,
-            "n": 1,
-            "stop": None,
-            "temperature": self.temperature,
-            "functions": self.functions,  # Include function definitions
-            "function_call": "auto"  # Let the model decide when to call a function
-        }
+            values = self._get_slot_filler(function_name).extract(prompt, expected=pending_info.get("missing_fields", []))
+            pending_info["args"].update(values)
+            return self._continue_function_call(function_name, pending_info["args"])
 
-        response_json = self._make_gpt_request(data)
+        return None
 
-        if not response_json:
-            raise ValueError("No response generated.")
+    def _get_slot_filler(self, function_name: str) -> SlotFiller:
+        slot_filler = self._slot_fillers.get(function_name)
+        if slot_filler is None:
+            tool = self.tools.get(function_name)
+            slot_filler = self._slot_fillers[function_name] = SlotFiller(tool.properties if tool else {})
+        return slot_filler
 
-        message = response_json.get("choices")[0].get("message")
-        
-        if message.get("function_call"):
-            # Extract function name and arguments
-            function_name = message["function_call"]["name"]
-            function_args = json.loads(message["function_call"].get("arguments", "{}"))
-            
-            # Validate required fields
-            function_definition = next((f for f in self.functions if f["name"] == function_name), None)
-            if function_definition:
-                required_fields = function_definition["parameters"].get("required", [])
-                missing_fields = [field for field in required_fields if field not in function_args or not function_args[field]]
-                
-                if missing_fields:
-                    # Store the pending function call with missing fields
-                    self.pending_function_calls[function_name] = {
-                        "args": function_args,
-                        "missing_fields": missing_fields
-                    }
-                    # Prompt the user to provide missing information
-                    missing = ', '.join(missing_fields)
-                    prompt_missing = f"To create a ticket, I need the following information: {missing}. Please provide them."
-                    self.conversation_history.append({"role": "assistant", "content": prompt_missing})
-                    return prompt_missing, False
-                else:
-                    # All required fields are present, but check if email needs confirmation
-                    email = function_args.get("email", "")
-                    if self.is_valid_email(email):
-                        # Ask for confirmation of the email
-                        prompt_confirm = f"Please confirm if the email **{email}** is correct or provide a new email."
-                        self.conversation_history.append({"role": "assistant", "content": prompt_confirm})
-                        # Set confirmation state
-                        self.confirmation_steps[function_name] = {
-                            "args": function_args,
-                            "awaiting_confirmation": True,
-                            "email_being_confirmed": email
-                        }
-                        return prompt_confirm, False
-                    else:
-                        # Invalid email format, prompt user to re-enter
-                        prompt_invalid = f"The email address **{email}** seems invalid. Please provide a valid email address."
-                        self.conversation_history.append({"role": "assistant", "content": prompt_invalid})
-                        # Update pending function call to require email again
-                        self.pending_function_calls[function_name]["missing_fields"].append("email")
-                        return prompt_invalid, False
+    def _continue_function_call(self, function_name: str, function_args: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Move a function call forward with the arguments gathered so far.
+
+        Asks for every missing required field in one prompt, confirms the email if
+        needed, and runs the function once nothing is left to ask.
+        """
+        tool = self.tools.get(function_name)
+        if tool is None:
+            self.pending_function_calls.pop(function_name, None)
+            error_message = f"Function definition for '{function_name}' not found."
+            self.conversation_history.append({"role": "assistant", "content": error_message})
+            return error_message, False
+
+        notice = ""
+        email = function_args.get("email")
+        if email:
+            if self.is_valid_email(email):
+                function_args["email"] = normalize_email(email)
             else:
-                error_message = f"Function definition for '{function_name}' not found."
+                # Invalid email format, ask for it again with the other missing fields
+                notice = f"The email address **{email}** seems invalid. "
+                del function_args["email"]
+
+        missing_fields = [field for field in tool.required if not function_args.get(field)]
+        if missing_fields:
+            # Store the pending function call with missing fields
+            self.pending_function_calls[function_name] = {
+                "args": function_args,
+                "missing_fields": missing_fields
+            }
+            field_descriptions = "\n- ".join(self.get_field_description(function_name, field) for field in missing_fields)
+            prompt_missing = notice + MISSING_FIELD_PROMPT.format(field_description=field_descriptions)
+            self.conversation_history.append({"role": "assistant", "content": prompt_missing})
+            return prompt_missing, False
+
+        self.pending_function_calls.pop(function_name, None)
+        email = function_args.get("email", "")
+        if email and self._email_needs_confirmation(email):
+            # Ask for confirmation of the email
+            prompt_confirm = f"Please confirm if the email **{email}** is correct or provide a new email."
+            self.conversation_history.append({"role": "assistant", "content": prompt_confirm})
+            # Set confirmation state
+            self.confirmation_steps[function_name] = {
+                "args": function_args,
+                "awaiting_confirmation": True,
+                "email_being_confirmed": email
+            }
+            return prompt_confirm, False
+        return self._execute_function_call(function_name, function_args)
+
+    def _email_needs_confirmation(self, email: str) -> bool:
+        if self.confirm_email == "always":
+            return True
+        if self.confirm_email == "never":
+            return False
+        # "spoken": only emails the user did not write out verbatim, e.g. "john at example dot com"
+        return not any(
+            message.get("role") == "user" and not SlotFiller.email_was_spoken(email, message.get("content") or "")
+            for message in self.conversation_history
+        )
+
+    def _execute_function_call(self, function_name: str, function_args: Dict[str, Any]) -> Tuple[str, bool]:
+        """Run a function call whose arguments are complete and confirmed, and report the result."""
+        function = self.tools.get(function_name)
+        if function:
+            try:
+                function_response = function(**function_args)
+                if function.reply is not None:
+                    assistant_message = function.reply(function_response)
+                else:
+                    assistant_message = encode_tool_result(function_response)
+                self.conversation_history.append({"role": "assistant", "content": assistant_message})
+                # Start the finish check on the completed exchange
+                finished = self._start_finish_check()
+                if function.interactive:
+                    # An interactive flow such as a ticket ends the conversation: start over.
+                    # Other tools only add their result, mid-conversation.
+                    self.reset_conversation()
+                return assistant_message, finished
+            except Exception as e:
+                error_message = f"An error occurred while running {function_name}: {e}"
                 self.conversation_history.append({"role": "assistant", "content": error_message})
                 return error_message, False
+        else:
+            error_message = f"Function '{function_name}' is not implemented."
+            self.conversation_history.append({"role": "assistant", "content": error_message})
+            return error_message, False
+
+    def _build_chat_data(self, stream: bool = False, route: Optional[Route] = None) -> dict:
+        """Prepare the chat completion request with function definitions, on `route` if given."""
+        history = self.conversation_history
+        data = ChatRequest({
+            "model": route.model if route else self.model,
+            "messages": history.to_messages(),
+            "max_tokens": route.max_tokens if route else self.max_tokens,
+            "n": 1,
+            "stop": None,
+            "temperature": self.temperature
+        }, encoded_messages=history.encoded_messages())
+        # Let the model decide when to call a tool
+        self._add_tools(data, "auto")
+        if stream:
+            data["stream"] = True
+        return data
+
+    def _add_tools(self, data: dict, choice: str) -> None:
+        """Offer the registered tools in the configured format; `choice` is "auto" or "none"."""
+        if not self.tools:
+            return
+        if self.tool_format == "tools":
+            data["tools"] = self.tools.tool_schemas
+            data["tool_choice"] = choice
+        else:
+            data["functions"] = self.tools.functions
+            data["function_call"] = choice
+
+    def _handle_assistant_message(self, message: dict) -> Tuple[str, bool]:
+        """Turn an assistant message (plain reply or function call) into the reply for the user."""
+        calls = tool_calls_of(message)
+        if calls:
+            # Interactive tools collect and confirm their arguments with the user first
+            call = next((c for c in calls if self.tools.get(c.name) and self.tools.get(c.name).interactive), calls[0])
+            function_name = call.name
+            function_args = call.parsed_arguments()
+            # Fill in fields the model left out from what the user just said
+            values = self._get_slot_filler(function_name).extract(self._last_user_message())
+            for field, value in values.items():
+                if not function_args.get(field):
+                    function_args[field] = value
+            return self._continue_function_call(function_name, function_args)
         else:
             # Regular response from GPT
-            response_text = message.get("content", "")
+            response_text = message.get("content") or ""
             self.conversation_history.append({"role": "assistant", "content": response_text})
-            finished = self._check_conversation_finished()
+            finished = self._start_finish_check()
             return response_text, finished
 
     def interpret_confirmation(self, user_response: str) -> Optional[bool]:
@@ -240,57 +554,279 @@ class OpenAIHandler:
 
     def _make_gpt_request(self, data: dict) -> Optional[dict]:
         """Helper method to make a GPT request and return the response JSON."""
+        estimated_tokens = estimate_request_tokens(data) if self.scheduler else 0
+        started = time.perf_counter()
         for attempt in range(self.retries):
+            if self.scheduler:
+                self.scheduler.acquire(estimated_tokens, self.priority)
             try:
-                response = self.session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=self.headers,
-                    json=data,
-                    timeout=self.timeout
-                )
-                response.raise_for_status()
-                response_json = response.json()
+                response_json = self._send_request(data)
+                self._record_request_success(estimated_tokens, response_json)
+                TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"), attempts=attempt + 1)
                 return response_json
             except (requests.exceptions.RequestException, ValueError) as e:
+                retry_after = self._record_request_failure(e)
+                TRACER.count("llm_request_errors")
                 if attempt < self.retries - 1:
-                    sleep_time = 2 ** attempt
-                    print(f"Error: {e}. Retrying in {sleep_time} seconds...")
+                    sleep_time = backoff_delay(attempt, retry_after)
+                    print(f"Error: {e}. Retrying in {sleep_time:.1f} seconds...")
                     time.sleep(sleep_time)
                 else:
+                    TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"),
+                                  attempts=attempt + 1, error=type(e).__name__)
                     raise Exception(f"Failed after {self.retries} attempts: {e}")
         return None
 
-    def _check_conversation_finished(self) -> bool:
+    def _send_request(self, data: dict) -> dict:
+        """POST `data` and return the decoded response, hedging slow attempts when enabled."""
+        if self.hedge_policy is None:
+            return self._post_json(data)
+        return run_hedged(lambda: self._post_json(data), self.hedge_policy, self._get_hedge_executor(),
+                          admit=self._hedge_admission(data))
+
+    def _open_stream(self, data: dict) -> requests.Response:
+        """POST a streaming request and return the response once its headers arrive, hedging when enabled."""
+        if self.hedge_policy is None:
+            return self._post_stream(data)
+        return run_hedged(lambda: self._post_stream(data), self.hedge_policy, self._get_hedge_executor(),
+                          on_discard=lambda response: response.close(), kind=STREAM,
+                          admit=self._hedge_admission(data))
+
+    def _post_json(self, data: dict) -> dict:
+        response = self.session.post(
+            self.api_url,
+            headers=self.headers,
+            data=self.request_encoder.encode(data),
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _post_stream(self, data: dict) -> requests.Response:
+        response = self.session.post(
+            self.api_url,
+            headers=self.headers,
+            data=self.request_encoder.encode(data),
+            timeout=self.timeout,
+            stream=True
+        )
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def _hedge_admission(self, data: dict) -> Optional[Callable[[], bool]]:
+        """Admission check for hedges of `data`: hedges are sent only while the scheduler has room right away."""
+        if self.scheduler is None:
+            return None
+        estimated_tokens = estimate_request_tokens(data)
+        return lambda: self.scheduler.try_acquire(estimated_tokens, self.priority)
+
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=2 * (self.hedge_policy.max_hedges + 1),
+                                                      thread_name_prefix="hedged-request")
+        return self._hedge_executor
+
+    def _record_request_success(self, estimated_tokens: int, response_json: Optional[dict] = None) -> None:
+        if self.scheduler:
+            usage = (response_json or {}).get("usage") or {}
+            self.scheduler.record_success(estimated_tokens, usage.get("total_tokens"))
+
+    def _record_request_failure(self, error: Exception) -> Optional[float]:
+        """Report a failed request to the scheduler and return the server's retry hint, if any."""
+        response = getattr(error, "response", None)
+        if response is not None:
+            status_code, headers = response.status_code, response.headers
+        else:
+            # aiohttp errors carry the status and headers themselves
+            status_code, headers = getattr(error, "status", None), getattr(error, "headers", None)
+        retry_after = parse_retry_after(headers)
+        if self.scheduler:
+            self.scheduler.record_failure(status_code, retry_after)
+        return retry_after
+
+    def _stream_gpt_request(self, data: dict) -> Generator[Dict[str, Any], None, None]:
+        """
+        Helper method to make a streaming GPT request and yield the decoded SSE chunks.
+
+        Connection failures are retried like `_make_gpt_request`; once the stream has
+        started, errors are raised to the caller since partial output was already used.
+        """
+        estimated_tokens = estimate_request_tokens(data) if self.scheduler else 0
+        started = time.perf_counter()
+        for attempt in range(self.retries):
+            if self.scheduler:
+                self.scheduler.acquire(estimated_tokens, self.priority)
+            try:
+                response = self._open_stream(data)
+                self._record_request_success(estimated_tokens)
+                TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"),
+                              attempts=attempt + 1, stream=True)
+                break
+            except requests.exceptions.RequestException as e:
+                retry_after = self._record_request_failure(e)
+                TRACER.count("llm_request_errors")
+                if attempt < self.retries - 1:
+                    sleep_time = backoff_delay(attempt, retry_after)
+                    print(f"Error: {e}. Retrying in {sleep_time:.1f} seconds...")
+                    time.sleep(sleep_time)
+                else:
+                    TRACER.record("llm_request", time.perf_counter() - started, model=data.get("model"),
+                                  attempts=attempt + 1, error=type(e).__name__)
+                    raise Exception(f"Failed after {self.retries} attempts: {e}")
+
+        with response:
+            # chunk_size=None hands lines over as soon as they arrive instead of buffering
+            chunks = iter_sse_json(response.iter_lines(chunk_size=None, decode_unicode=True))
+            if not TRACER.enabled:
+                yield from chunks
+                return
+            first = True
+            for chunk in chunks:
+                if first:
+                    TRACER.record("llm_first_token", time.perf_counter() - started, model=data.get("model"))
+                    first = False
+                yield chunk
+            TRACER.record("llm_stream", time.perf_counter() - started, model=data.get("model"))
+
+    def _start_finish_check(self) -> bool:
+        """
+        Start the configured finish check for the current conversation.
+
+        Returns the finished flag when it is known right away ("local" and "none").
+        In "llm" mode the check runs in the background and False is returned; the
+        result arrives through `finish_future`, `wait_finished` and `on_finished`.
+        """
+        if self.finish_check == "llm":
+            if self._finish_executor is None:
+                self._finish_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="finish-check")
+            # Build the request now so later turns do not change what is checked
+            data = self._build_finish_check_data()
+            # Run in a copy of this context so the check is traced with the turn that started it
+            self.finish_future = self._finish_executor.submit(
+                contextvars.copy_context().run, self._run_finish_check, data
+            )
+            self.finish_future.add_done_callback(self._notify_finished)
+            return False
+
+        finished = self.finish_check == "local" and self._local_conversation_finished()
+        self.finish_future = Future()
+        self.finish_future.set_result(finished)
+        self._notify_finished(self.finish_future)
+        return finished
+
+    def _notify_finished(self, future: Future) -> None:
+        if self.on_finished is None or future.cancelled() or future.exception() is not None:
+            return
+        if future.result():
+            self.on_finished(True)
+
+    def wait_finished(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the latest finish check and return whether the conversation is complete.
+
+        Failures and timeouts are treated as not finished.
+        """
+        future = self.finish_future
+        if future is None:
+            return False
+        try:
+            return bool(future.result(timeout=timeout))
+        except Exception as e:
+            print(f"Finish check failed: {e}")
+            return False
+
+    def _last_user_message(self) -> str:
+        for message in reversed(self.conversation_history):
+            if message.get("role") == "user":
+                return message.get("content") or ""
+        return ""
+
+    def _local_conversation_finished(self) -> bool:
+        """Cheap local check: the conversation is finished when the user's last message is a closing remark."""
+        return CLOSING_REMARK_REGEX.match(self._last_user_message().strip()) is not None
+
+    def _check_conversation_finished(self, history: Optional[list] = None) -> bool:
         """Helper method to check if the conversation is concluded."""
-        finish_prompt = "Is this conversation complete? Answer with 'yes' or 'no'."
-        check_data = {
+        return self._run_finish_check(self._build_finish_check_data(history))
+
+    def _run_finish_check(self, data: dict) -> bool:
+        with TRACER.span("finish_check"):
+            return self._parse_finish_check(self._make_gpt_request(data))
+
+    def _build_finish_check_data(self, history: Optional[list] = None) -> dict:
+        """The finish check request for `history` (the current conversation by default)."""
+        if history is None:
+            # Reuse the history's encoded messages and append the prompt without re-encoding them
+            messages = self.conversation_history.to_messages()
+            body = self.conversation_history.encoded_messages()
+            encoded_messages = body[:-1] + (b"," if len(body) > 2 else b"") + FINISH_CHECK_PROMPT_ENCODED + b"]"
+        else:
+            messages = list(history)
+            encoded_messages = None
+        messages.append(FINISH_CHECK_PROMPT)
+        data = ChatRequest({
             "model": self.model,
-            "messages": self.conversation_history + [{"role": "user", "content": finish_prompt}],
+            "messages": messages,
             "max_tokens": 10,
             "n": 1,
-            "temperature": 0.0,
-            "functions": self.functions,
-            "function_call": "none"
-        }
+            "temperature": 0.0
+        }, encoded_messages=encoded_messages)
+        self._add_tools(data, "none")
+        return data
 
-        response_json = self._make_gpt_request(check_data)
+    @staticmethod
+    def _parse_finish_check(response_json: Optional[dict]) -> bool:
         if not response_json:
             return False
 
         message = response_json.get("choices")[0].get("message", {})
-        response_text = message.get("content", "").strip().lower()
+        response_text = (message.get("content") or "").strip().lower()
         if response_text in ["yes", "yes."]:
             return True
         return False
 
     def trim_conversation_history(self) -> None:
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        self.conversation_history.trim()
+
+    def _summarize_history(self, summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        """Fold evicted messages into the rolling conversation summary."""
+        response_json = self._make_gpt_request(self._build_summary_data(summary, messages))
+        return self._parse_summary(summary, response_json)
+
+    def _build_summary_data(self, summary: Optional[str], messages: List[Dict[str, Any]]) -> dict:
+        transcript = "\n".join(
+            f"{message['role']}: {message.get('content') or ''}" for message in messages
+        )
+        previous = f"Current summary: {summary}\n\n" if summary else ""
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "Summarize the conversation in a few short sentences. Keep names, contact details and open issues."},
+                {"role": "user", "content": f"{previous}New messages:\n{transcript}"}
+            ],
+            "max_tokens": 150,
+            "n": 1,
+            "temperature": 0.0
+        }
+
+    @staticmethod
+    def _parse_summary(summary: Optional[str], response_json: Optional[dict]) -> str:
+        if not response_json:
+            return summary or ""
+        message = response_json.get("choices")[0].get("message", {})
+        return (message.get("content") or "").strip()
 
     def reset_conversation(self) -> None:
-        self.conversation_history = []
-        self.pending_function_calls = {}
-        self.confirmation_steps = {}
+        self.state.reset()
+        self._save_state()
+
+    def _save_state(self) -> None:
+        if self.session_store is not None:
+            self.session_store.save(self.session_id, self.state)
 
     def handle_user_input(self, user_input: str) -> Tuple[str, bool]:
         """
@@ -302,22 +838,27 @@ class OpenAIHandler:
 
     def get_field_description(self, function_name: str, field_name: str) -> str:
         """Retrieve the description of a specific field from the function definition."""
-        function_definition = next((f for f in self.functions if f["name"] == function_name), None)
-        if function_definition:
-            properties = function_definition["parameters"].get("properties", {})
-            field = properties.get(field_name, {})
+        tool = self.tools.get(function_name)
+        if tool:
+            field = tool.properties.get(field_name, {})
             description = field.get("description", field_name)
             return f"{field_name.replace('_', ' ').capitalize()}: {description}"
         return field_name
 
+    def fixed_prompts(self) -> List[str]:
+        """Prompts this handler speaks verbatim, e.g. for prewarming the TTS audio cache."""
+        prompts = [EMAIL_RETRY_PROMPT]
+        for tool in self.tools:
+            if not tool.interactive:
+                continue
+            for field_name in tool.properties:
+                field_description = self.get_field_description(tool.name, field_name)
+                prompts.append(MISSING_FIELD_PROMPT.format(field_description=field_description))
+        return prompts
+
     def is_valid_email(self, email: str) -> bool:
-        """Enhanced regex-based email validation to handle variations like 'at' or 'that'."""
-        # Normalize common variations
-        email_normalized = re.sub(r'\bat\b|\bthat\b', '@', email, flags=re.IGNORECASE)
-        email_normalized = re.sub(r'\s+', '', email_normalized)  # Remove any whitespace
-        # Simple regex to validate email
-        regex = r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$'
-        return re.match(regex, email_normalized) is not None
+        """Regex-based email validation that also accepts spoken forms like 'john at example dot com'."""
+        return is_valid_email(email)
 
     def extract_email_and_additional_info(self, user_response: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
         """
@@ -325,27 +866,21 @@ class OpenAIHandler:
 
         Returns a tuple of (new_email, additional_info_dict)
         """
-        # Normalize common variations
-        response_normalized = re.sub(r'\bat\b|\bthat\b', '@', user_response, flags=re.IGNORECASE)
-        response_normalized = re.sub(r'\s+', '', response_normalized)  # Remove any whitespace
-
-        # Regex to find email addresses
-        email_regex = r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}'
-        emails = re.findall(email_regex, response_normalized)
-        new_email = emails[-1] if emails else None
-
-        # Extract contact number if present (simple pattern)
-        phone_regex = r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
-        phones = re.findall(phone_regex, user_response)
-        contact_number = phones[-1] if phones else None
+        values = SlotFiller(["email", "contact_number"]).extract(user_response)
+        new_email = values.pop("email", None)
+        return new_email, values or None
 
-        additional_info = {}
-        if contact_number:
-            additional_info['contact_number'] = contact_number
+def ticket_reply(ticket: Dict[str, Any]) -> str:
+    """The reply for the user once CreateTicket has run."""
+    ticket_id = ticket.get("ticket_id")
+    if ticket_id:
+        return f"Ticket created successfully with ID: {ticket_id}. Is there anything else I can help with?"
+    return f"I was unable to create the ticket due to {ticket.get('error', 'an error')}. Please provide the information again."
 
-        return new_email, additional_info if additional_info else None
 
-def CreateTicket(name: str, email: str, issue: str, contact_number: str = None) -> Dict[str, Any]:
+@TOOLS.tool(description="Creates a support ticket with the provided user details and issue description.", interactive=True,
+            reply=ticket_reply)
+def CreateTicket(name: str, email: str, issue: str, contact_number: Optional[str] = None) -> Dict[str, Any]:
     """
     Creates a support ticket with the provided details.
 
@@ -353,13 +888,13 @@ def CreateTicket(name: str, email: str, issue: str, contact_number: str = None)
         name (str): The name of the user.
         email (str): The user's email address.
         issue (str): Description of the issue.
-        contact_number (str, optional): The user's contact number.
+        contact_number (str, optional): The user's contact number (optional).
 
     Returns:
         dict: A dictionary containing ticket details or an error message.
     """
     # Validate the email format
-    if not OpenAIHandler().is_valid_email(email):
+    if not is_valid_email(email):
         return {"error": "Invalid email format"}
 
     # Simulate ticket creation process (integrate with a real ticketing system)
@@ -0,0 +1,69 @@
+import json
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library encoder
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Encode `value` as compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_array(items) -> bytes:
+    """Join already encoded JSON values into a JSON array."""
+    return b"[" + b",".join(items) + b"]"
+
+
+class ChatRequest(dict):
+    """
+    A chat completion request whose messages are also available pre-encoded.
+
+    It is an ordinary dict (the cache, scheduler and hedging read it as before);
+    `encoded_messages` holds the same messages as a JSON array, assembled from
+    bytes the conversation history encoded once per message.
+    """
+    __slots__ = ("encoded_messages",)
+
+    def __init__(self, *args, encoded_messages: Optional[bytes] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoded_messages = encoded_messages
+
+
+class RequestEncoder:
+    """
+    Encodes chat requests to the bytes that are POSTed.
+
+    The encoded form of every other member ("model", "tools", "temperature", ...)
+    is kept and reused while the value is unchanged: lists and dicts are compared
+    by identity (the tool registry hands out the same schema list until a tool is
+    registered), scalars by value. Messages come pre-encoded from the history when
+    the request is a ChatRequest, so a turn only encodes what is new.
+    """
+
+    def __init__(self):
+        # Member name -> (value, encoded `"name":value`)
+        self._members: Dict[str, Tuple[Any, bytes]] = {}
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        encoded_messages = getattr(data, "encoded_messages", None)
+        members = []
+        for name, value in data.items():
+            if name == "messages":
+                members.append(b'"messages":' + (encoded_messages if encoded_messages is not None else dumps(value)))
+                continue
+            cached = self._members.get(name)
+            if cached is None or not self._same(cached[0], value):
+                cached = self._members[name] = (value, dumps(name) + b":" + dumps(value))
+            members.append(cached[1])
+        return b"{" + b",".join(members) + b"}"
+
+    @staticmethod
+    def _same(cached: Any, value: Any) -> bool:
+        if isinstance(value, (list, dict)):
+            return cached is value
+        return type(cached) is type(value) and cached == value
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# What to do with requests that are not deterministic (temperature above 0):
+#   "bypass" - neither look up nor store
+#   "cache"  - cache like any other reply
+CACHE_POLICIES = ("bypass", "cache")
+
+NORMALIZE_PUNCTUATION_REGEX = re.compile(r"[^\w\s@.]|(?<!\w)\.|\.(?!\w)")
+NORMALIZE_WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a message for cache lookups: lower case, no punctuation, single spaces."""
+    text = NORMALIZE_PUNCTUATION_REGEX.sub(" ", text.lower())
+    return NORMALIZE_WHITESPACE_REGEX.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """
+    Cache of chat completion replies keyed on model, temperature, function schema
+    and the most recent `context_messages` messages.
+
+    Replies are looked up by an exact key first and then by a key built from the
+    normalized context, so "What are your hours?" and "what are your hours" share
+    an entry. Entries live in an in-memory LRU with a TTL and, when `path` is set,
+    in an SQLite database that survives restarts.
+
+    Replies that call a function or tool are never cached: replaying one would run
+    the tool again, and a cached reply must not have side effects.
+
+    Only requests with temperature 0 are cached unless `temperature_policy` is
+    "cache". OpenAIHandler's default temperature is 0.5, so with both defaults the
+    cache serves nothing; use temperature=0 or temperature_policy="cache".
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = 3600, path: Optional[str] = None,
+                 context_messages: int = 4, temperature_policy: str = "bypass"):
+        if temperature_policy not in CACHE_POLICIES:
+            raise ValueError(f"Invalid temperature_policy '{temperature_policy}'. Expected one of {CACHE_POLICIES}.")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.context_messages = context_messages
+        self.temperature_policy = temperature_policy
+        self.entries: "OrderedDict[str, Tuple[Optional[float], Dict[str, Any]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.bypassed = 0
+        self.evictions = 0
+        # id() and digest of the last function schema, replaced together so concurrent lookups see a matching pair
+        self._functions_digest: Tuple[Optional[int], str] = (None, "")
+        self.db: Optional[sqlite3.Connection] = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, message TEXT NOT NULL, expires_at REAL)"
+            )
+            self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self.db.commit()
+
+    def is_cacheable(self, data: Dict[str, Any]) -> bool:
+        """Whether a request may be served from or stored in the cache under the temperature policy."""
+        if data.get("temperature", 0) > 0:
+            return self.temperature_policy == "cache"
+        return True
+
+    def keys(self, data: Dict[str, Any]) -> Tuple[str, str]:
+        """Return the exact and normalized cache keys of a chat completion request."""
+        functions = data.get("tools", data.get("functions"))
+        functions_digest = ""
+        if functions is not None:
+            functions_id, functions_digest = self._functions_digest
+            if id(functions) != functions_id:
+                # The schema rarely changes, so only re-hash it when a different list is passed
+                functions_digest = hashlib.sha256(json.dumps(functions, sort_keys=True).encode("utf-8")).hexdigest()
+                self._functions_digest = (id(functions), functions_digest)
+
+        context = data.get("messages", [])[-self.context_messages:]
+        prefix = [data.get("model"), data.get("temperature"), data.get("max_tokens"), functions_digest]
+        exact = [[m.get("role"), m.get("content") or "", self._calls(m)] for m in context]
+        normalized = [[m.get("role"), normalize_text(m.get("content") or ""), self._calls(m)] for m in context]
+        return self._digest(prefix + ["exact", exact]), self._digest(prefix + ["normalized", normalized])
+
+    @staticmethod
+    def _calls(message: Dict[str, Any]) -> str:
+        """The function calls an assistant message made or the call a tool message answers, serialized."""
+        calls = message.get("tool_calls") or message.get("function_call") or message.get("tool_call_id")
+        return json.dumps(calls, sort_keys=True) if calls else ""
+
+    @staticmethod
+    def _calls_function(message: Dict[str, Any]) -> bool:
+        return bool(message.get("function_call") or message.get("tool_calls"))
+
+    @staticmethod
+    def _digest(value: List[Any]) -> str:
+        return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the cached assistant message for a request, or None."""
+        if not self.is_cacheable(data):
+            with self.lock:
+                self.bypassed += 1
+            return None
+        now = time.time()
+        for key in self.keys(data):
+            message = self._get_entry(key, now)
+            # Databases written before function calls were excluded may still hold some
+            if message is not None and not self._calls_function(message):
+                with self.lock:
+                    self.hits += 1
+                return dict(message)
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, data: Dict[str, Any], message: Dict[str, Any]) -> None:
+        """Store the assistant message returned for a request, subject to the cache policies."""
+        if not self.is_cacheable(data):
+            return
+        if self._calls_function(message):
+            return
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        cached = {"role": "assistant", "content": message.get("content")}
+        for key in self.keys(data):
+            self._set_entry(key, cached, expires_at)
+        if self.db is not None:
+            with self.lock:
+                self.db.commit()
+
+    def _get_entry(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, message = entry
+                if expires_at is None or expires_at > now:
+                    self.entries.move_to_end(key)
+                    return message
+                del self.entries[key]
+
+            if self.db is None:
+                return None
+            row = self.db.execute(
+                "SELECT message, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+            message = json.loads(row[0])
+            self._remember(key, message, row[1])
+            self.disk_hits += 1
+            return message
+
+    def _set_entry(self, key: str, message: Dict[str, Any], expires_at: Optional[float]) -> None:
+        with self.lock:
+            self._remember(key, message, expires_at)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, message, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(message), expires_at)
+                )
+
+    def _remember(self, key: str, message: Dict[str, Any], expires_at: Optional[float]) -> None:
+        self.entries[key] = (expires_at, message)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,163 @@
+import re
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, NamedTuple, Optional
+
+# Turn classes, from the cheapest to the most demanding
+ROUTES = ("brief", "tool", "standard", "complex")
+
+# Acknowledgements, greetings and small talk that need a short reply at most
+BRIEF_REGEX = re.compile(
+    r"^(?:(?:yes|yeah|yep|no|nope|ok(?:ay)?|sure|thanks|thank you|cool|great|got it|perfect|alright|"
+    r"hi|hello|hey|good (?:morning|afternoon|evening)|how are you|nice|fine|correct|right)\b[\s,.!?]*)+$",
+    re.IGNORECASE
+)
+# Words that mark a troubleshooting or multi-step question
+COMPLEX_REGEX = re.compile(
+    r"\b(?:why|how (?:do|can|should|would)|explain|troubleshoot|step[- ]by[- ]step|compare|difference|"
+    r"error|not working|doesn't work|keeps|crash(?:es|ing)?|configure|install|set up|fix)\b",
+    re.IGNORECASE
+)
+
+
+class RouteTier(NamedTuple):
+    model: str
+    max_tokens: int
+    # Seconds the reply should take; used to fall back to `fallback` when exceeded
+    latency_target: float
+    # Route to use instead while this one misses its latency target
+    fallback: Optional[str] = None
+
+
+class Route(NamedTuple):
+    name: str
+    model: str
+    max_tokens: int
+
+
+class RouteStats:
+    """Recent latencies of one route (seconds to the first token and to the whole reply)."""
+
+    def __init__(self, window: int):
+        self.first_token: Deque[float] = deque(maxlen=window)
+        self.total: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.fallbacks = 0
+
+
+def quantile(values: Iterable[float], q: float) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RoutingPolicy:
+    """
+    Picks the model and output budget of each turn.
+
+    Turns are classified locally, without an API call: acknowledgements and
+    small talk are "brief", follow-up requests carrying tool results are "tool",
+    long or troubleshooting questions are "complex" and everything else is
+    "standard". Each route maps to a RouteTier.
+
+    The latency of every request is recorded per route. Once a route has
+    `min_samples` observations and its `quantile` latency exceeds the tier's
+    target, turns fall back to the tier's `fallback` route; every `probe_every`-th
+    turn still takes the route itself so it can be seen to recover. `stats`
+    reports the observations so tiers and targets can be tuned.
+    """
+
+    def __init__(self, tiers: Dict[str, RouteTier], brief_max_words: int = 6, complex_min_words: int = 30,
+                 quantile: float = 0.9, min_samples: int = 20, window: int = 200, probe_every: int = 10):
+        missing = [route for route in ROUTES if route not in tiers]
+        if missing:
+            raise ValueError(f"Missing route tiers: {missing}. Expected tiers for {ROUTES}.")
+        self.tiers = dict(tiers)
+        self.brief_max_words = brief_max_words
+        self.complex_min_words = complex_min_words
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+        self.route_stats: Dict[str, RouteStats] = {route: RouteStats(window) for route in self.tiers}
+        self.lock = threading.Lock()
+
+    def classify(self, prompt: str, tool_round: bool = False) -> str:
+        """The route of a turn from its text, and whether it sends tool results back to the model."""
+        if tool_round:
+            return "tool"
+        text = (prompt or "").strip()
+        words = len(text.split())
+        if words <= self.brief_max_words and BRIEF_REGEX.match(text):
+            return "brief"
+        if words >= self.complex_min_words or COMPLEX_REGEX.search(text):
+            return "complex"
+        return "standard"
+
+    def route(self, prompt: str, tool_round: bool = False) -> Route:
+        name = self.classify(prompt, tool_round)
+        with self.lock:
+            stats = self.route_stats[name]
+            stats.requests += 1
+            probe = stats.requests % self.probe_every == 0
+            # Follow fallbacks while the route misses its target (at most once per route, so cycles end)
+            seen = {name}
+            while not probe and self._over_target(name):
+                fallback = self.tiers[name].fallback
+                if fallback is None or fallback in seen:
+                    break
+                self.route_stats[name].fallbacks += 1
+                name = fallback
+                seen.add(name)
+        tier = self.tiers[name]
+        return Route(name, tier.model, tier.max_tokens)
+
+    def _over_target(self, name: str) -> bool:
+        latencies = self.route_stats[name].total
+        if len(latencies) < self.min_samples:
+            return False
+        return quantile(latencies, self.quantile) > self.tiers[name].latency_target
+
+    def record(self, route: str, latency: float, first_token: Optional[float] = None) -> None:
+        """Record the latency of a request sent on `route` (cache hits should not be recorded)."""
+        with self.lock:
+            stats = self.route_stats[route]
+            stats.total.append(latency)
+            if first_token is not None:
+                stats.first_token.append(first_token)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """Per route: tier, request and fallback counts, and p50/p95 latencies."""
+        with self.lock:
+            report = {}
+            for name, stats in self.route_stats.items():
+                tier = self.tiers[name]
+                report[name] = {
+                    "model": tier.model,
+                    "max_tokens": tier.max_tokens,
+                    "latency_target": tier.latency_target,
+                    "requests": stats.requests,
+                    "fallbacks": stats.fallbacks,
+                    "samples": len(stats.total),
+                    "p50": quantile(stats.total, 0.5),
+                    "p95": quantile(stats.total, 0.95),
+                    "first_token_p50": quantile(stats.first_token, 0.5),
+                    "first_token_p95": quantile(stats.first_token, 0.95),
+                }
+            return report
+
+
+def default_routing_policy(model: str = "gpt-4o-mini", fast_model: str = "gpt-4o-mini",
+                           max_tokens: int = 300) -> RoutingPolicy:
+    """
+    Brief and tool turns go to `fast_model` with small budgets; standard and
+    complex turns go to `model`, complex ones with twice the budget. Standard
+    and complex turns that miss their target fall back one step towards the
+    faster tiers.
+    """
+    return RoutingPolicy({
+        "brief": RouteTier(fast_model, 60, 1.0),
+        "tool": RouteTier(fast_model, 150, 1.5),
+        "standard": RouteTier(model, max_tokens, 2.5, fallback="tool"),
+        "complex": RouteTier(model, 2 * max_tokens, 5.0, fallback="standard"),
+    })
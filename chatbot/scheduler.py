@@ -0,0 +1,329 @@
+import asyncio
+import email.utils
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Longest time a waiter sleeps before re-checking the queue
+MAX_POLL_INTERVAL = 0.05
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is refused because the upstream is considered unhealthy."""
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Return the server's retry hint in seconds from `retry-after-ms` or `Retry-After` headers."""
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None, base: float = 1.0, max_delay: float = 30.0) -> float:
+    """
+    Delay before retry number `attempt` (0-based).
+
+    Uses full-jitter exponential backoff so workers that failed together do not
+    retry together. A server hint is honored as the minimum delay, with a little
+    jitter on top.
+    """
+    if retry_after is not None:
+        return min(max_delay, retry_after) + random.uniform(0, min(1.0, base))
+    return random.uniform(0, min(max_delay, base * 2 ** attempt))
+
+
+def estimate_request_tokens(data: Dict[str, Any]) -> int:
+    """Rough token cost of a chat request (prompt estimate plus the output budget) for TPM admission."""
+    characters = 0
+    for message in data.get("messages", []):
+        characters += len(message.get("content") or "")
+        function_call = message.get("function_call")
+        if function_call:
+            characters += len(function_call.get("arguments", ""))
+        for tool_call in message.get("tool_calls") or []:
+            characters += len((tool_call.get("function") or {}).get("arguments", ""))
+    return characters // 4 + 4 * len(data.get("messages", [])) + (data.get("max_tokens") or 0)
+
+
+class TokenBucket:
+    """Token bucket holding up to `capacity` tokens and refilling `capacity` tokens per `period` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are available now)."""
+        self._refill(now)
+        # Requests larger than the whole bucket are admitted once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests after `failure_threshold` consecutive upstream failures.
+
+    After `reset_timeout` seconds a single trial request is let through; its
+    success closes the circuit again, its failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RequestScheduler:
+    """
+    Admission control shared by every handler that talks to the same API account.
+
+    Requests wait in a priority queue until the requests-per-minute and
+    tokens-per-minute buckets admit them, so interactive turns
+    (PRIORITY_INTERACTIVE) go ahead of batch work (PRIORITY_BATCH). A 429 with a
+    retry hint pauses admission for everybody instead of letting each worker find
+    out on its own, and a circuit breaker fails fast while the upstream is down.
+    Works from threads (`acquire`) and from asyncio code (`acquire_async`).
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, metrics_window: float = 60.0):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.circuit_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics_window = metrics_window
+        self.condition = threading.Condition()
+        self.queue: List[Tuple[int, int]] = []
+        self.sequence = itertools.count()
+        self.paused_until = 0.0
+
+        # Metrics
+        self.admitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self.recent: Deque[Tuple[float, int]] = deque()
+
+    def acquire(self, estimated_tokens: int = 0, priority: int = PRIORITY_INTERACTIVE) -> int:
+        """
+        Block until the request may be sent and return the tokens charged for it.
+
+        Raises CircuitOpenError when the circuit breaker refuses the request.
+        """
+        ticket = self._enqueue(priority)
+        enqueued_at = time.monotonic()
+        with self.condition:
+            try:
+                while True:
+                    wait = self._try_admit(ticket, estimated_tokens, enqueued_at)
+                    if wait <= 0:
+                        return estimated_tokens
+                    self.condition.wait(min(wait, MAX_POLL_INTERVAL))
+            except BaseException:
+                self._dequeue(ticket)
+                raise
+
+    def try_acquire(self, estimated_tokens: int = 0, priority: int = PRIORITY_INTERACTIVE) -> bool:
+        """
+        Admit a request only if it can be sent right away: nothing is queued ahead
+        of it, the circuit is closed and the buckets have room. Never waits; for
+        optional requests such as hedges.
+        """
+        ticket = self._enqueue(priority)
+        with self.condition:
+            try:
+                if self._try_admit(ticket, estimated_tokens, time.monotonic()) <= 0:
+                    return True
+            except CircuitOpenError:
+                pass
+            self._dequeue(ticket)
+            return False
+
+    async def acquire_async(self, estimated_tokens: int = 0, priority: int = PRIORITY_INTERACTIVE) -> int:
+        """Asynchronous `acquire` that sleeps on the event loop while waiting."""
+        ticket = self._enqueue(priority)
+        enqueued_at = time.monotonic()
+        try:
+            while True:
+                with self.condition:
+                    wait = self._try_admit(ticket, estimated_tokens, enqueued_at)
+                if wait <= 0:
+                    return estimated_tokens
+                await asyncio.sleep(min(wait, MAX_POLL_INTERVAL))
+        except BaseException:
+            with self.condition:
+                self._dequeue(ticket)
+            raise
+
+    def _enqueue(self, priority: int) -> Tuple[int, int]:
+        ticket = (priority, next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+        return ticket
+
+    def _dequeue(self, ticket: Tuple[int, int]) -> None:
+        if ticket in self.queue:
+            self.queue.remove(ticket)
+            heapq.heapify(self.queue)
+            self.condition.notify_all()
+
+    def _try_admit(self, ticket: Tuple[int, int], estimated_tokens: int, enqueued_at: float) -> float:
+        """Admit `ticket` if it is at the head of the queue and the buckets allow it; otherwise return the wait."""
+        now = time.monotonic()
+        if self.queue[0] != ticket:
+            return MAX_POLL_INTERVAL
+        if not self.circuit_breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError("Upstream is unavailable; not sending request while the circuit is open.")
+        wait = self.paused_until - now
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.wait_time(estimated_tokens, now))
+        if wait > 0:
+            if self.circuit_breaker.trial_in_flight:
+                # Give the half-open trial back until the request is really sent
+                self.circuit_breaker.trial_in_flight = False
+            return wait
+
+        heapq.heappop(self.queue)
+        if self.request_bucket:
+            self.request_bucket.consume(1)
+        if self.token_bucket:
+            self.token_bucket.consume(estimated_tokens)
+        delay = now - enqueued_at
+        self.admitted += 1
+        self.queue_delay_total += delay
+        self.queue_delay_max = max(self.queue_delay_max, delay)
+        self.condition.notify_all()
+        return 0.0
+
+    def record_success(self, estimated_tokens: int = 0, used_tokens: Optional[int] = None) -> None:
+        """Report a successful request; `used_tokens` (from the response usage) corrects the TPM estimate."""
+        with self.condition:
+            self.circuit_breaker.record_success()
+            self.completed += 1
+            tokens = estimated_tokens if used_tokens is None else used_tokens
+            if self.token_bucket and used_tokens is not None:
+                if used_tokens < estimated_tokens:
+                    self.token_bucket.refund(estimated_tokens - used_tokens)
+                else:
+                    self.token_bucket.consume(used_tokens - estimated_tokens)
+            now = time.monotonic()
+            self.recent.append((now, tokens))
+            self._prune_recent(now)
+
+    def record_failure(self, status_code: Optional[int] = None, retry_after: Optional[float] = None) -> None:
+        """
+        Report a failed request.
+
+        Rate limiting (429) pauses admission for the server's hint and does not count
+        against upstream health; connection errors and 5xx responses do.
+        """
+        with self.condition:
+            self.failed += 1
+            if status_code == 429:
+                self.throttled += 1
+                self.circuit_breaker.trial_in_flight = False
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            elif status_code is None or status_code >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.trial_in_flight = False
+            self.condition.notify_all()
+
+    def _prune_recent(self, now: float) -> None:
+        while self.recent and self.recent[0][0] < now - self.metrics_window:
+            self.recent.popleft()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            now = time.monotonic()
+            self._prune_recent(now)
+            window_minutes = self.metrics_window / 60
+            return {
+                "admitted": self.admitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+                "queued": len(self.queue),
+                "queue_delay_avg": self.queue_delay_total / self.admitted if self.admitted else 0.0,
+                "queue_delay_max": self.queue_delay_max,
+                "requests_per_minute": len(self.recent) / window_minutes,
+                "tokens_per_minute": sum(tokens for _, tokens in self.recent) / window_minutes,
+                "circuit": self.circuit_breaker.state
+            }
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from chatbot.history import ConversationHistory
+from chatbot.payload import dumps
+
+
+class ConversationState:
+    """
+    Everything that belongs to one conversation: the message history and the
+    state of tool flows in progress (pending function calls and confirmations).
+
+    OpenAIHandler keeps one of these for its own conversation; the async handler
+    keeps one per session id in a SessionStore.
+    """
+    __slots__ = ("conversation_history", "pending_function_calls", "confirmation_steps", "finish_future",
+                 "last_used", "saved_seq", "_lock")
+
+    def __init__(self, conversation_history: ConversationHistory):
+        self.conversation_history = conversation_history
+        # To keep track of incomplete function calls
+        self.pending_function_calls: Dict[str, Dict[str, Any]] = {}
+        # To keep track of confirmation steps
+        self.confirmation_steps: Dict[str, Dict[str, Any]] = {}
+        # Result of the latest finish check
+        self.finish_future: Optional[Any] = None
+        self.last_used = time.monotonic()
+        # Sequence number of the first history message not yet persisted by the store
+        self.saved_seq = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """Lock that serializes the turns of this conversation (created on first use inside the event loop)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def reset(self) -> None:
+        self.conversation_history.clear()
+        self.pending_function_calls = {}
+        self.confirmation_steps = {}
+
+
+class SessionStore:
+    """
+    In-memory store of conversation states keyed by session id.
+
+    Without a `state_factory`, the handler the store is given to fills in its own.
+    """
+
+    # Whether `load` and `save` read and write storage (and should run off the event loop)
+    persistent = False
+
+    def __init__(self, state_factory: Optional[Callable[[], ConversationState]] = None):
+        self.state_factory = state_factory
+        self.sessions: Dict[str, ConversationState] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.sessions)
+
+    def get(self, session_id: str) -> ConversationState:
+        """Return the state of `session_id`, creating it on first use."""
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = self.state_factory()
+        state.last_used = time.monotonic()
+        return state
+
+    def save(self, session_id: str, state: ConversationState) -> None:
+        """Called by the handlers at the end of each turn; nothing to do in memory."""
+
+    def drop(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+    def idle_sessions(self, max_idle: float) -> list:
+        """Ids of sessions that have not been used for `max_idle` seconds and are not mid-turn."""
+        cutoff = time.monotonic() - max_idle
+        return [
+            session_id for session_id, state in self.sessions.items()
+            if state.last_used < cutoff and not (state._lock is not None and state._lock.locked())
+        ]
+
+    def load(self, session_id: str) -> ConversationState:
+        """A new state for `session_id`, not registered in the store; see `add`."""
+        return self.state_factory()
+
+    def add(self, session_id: str, state: ConversationState) -> ConversationState:
+        """Register a state from `load`, unless the session was registered meanwhile; returns the registered state."""
+        return self.sessions.setdefault(session_id, state)
+
+    def unload(self, session_id: str) -> None:
+        """Remove a session from memory (and from the store, if it keeps nothing elsewhere)."""
+        self.sessions.pop(session_id, None)
+
+    def evict_idle(self, max_idle: float) -> int:
+        """Drop sessions that have not been used for `max_idle` seconds and are not mid-turn."""
+        idle = self.idle_sessions(max_idle)
+        for session_id in idle:
+            self.unload(session_id)
+        return len(idle)
+
+
+class PersistentSessionStore(SessionStore):
+    """
+    SessionStore backed by SQLite in WAL mode, so conversations and tool flows in
+    progress survive a crash or restart.
+
+    `save` writes only what changed since the previous save: one row per new
+    history message, holding the JSON the history already encoded for requests
+    and its token count, and the session row with the summary and the pending
+    function call / confirmation state. Rows of messages folded into the summary
+    or cleared are deleted. A turn is one small transaction.
+
+    Sessions are loaded lazily by `get` with one indexed query (the session row
+    joined with its messages, read in primary key order). `evict_idle` unloads
+    idle sessions from memory only; they are loaded again on their next turn.
+    AsyncOpenAIHandler does the loading, saving and unloading on executor
+    threads (the connection is shared under `lock`) and evicts idle sessions
+    periodically.
+    """
+
+    persistent = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            start_seq INTEGER NOT NULL,  -- oldest stored message: evicted but not yet in the summary
+            first_seq INTEGER NOT NULL,  -- oldest message in the history
+            summary TEXT,
+            tool_state BLOB,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS messages (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            tokens INTEGER NOT NULL,
+            message BLOB NOT NULL,
+            PRIMARY KEY (session_id, seq)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str, state_factory: Optional[Callable[[], ConversationState]] = None):
+        super().__init__(state_factory)
+        self.path = path
+        # Shared by the handler threads; every use holds `lock`
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode a commit survives a crash of the process without an fsync per turn
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        self.lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        if session_id in self.sessions:
+            return True
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def get(self, session_id: str) -> ConversationState:
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = self.load(session_id)
+        state.last_used = time.monotonic()
+        return state
+
+    def load(self, session_id: str) -> ConversationState:
+        """Read the stored state of `session_id` (an empty one if there is none), without registering it."""
+        state = self.state_factory()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT s.first_seq, s.summary, s.tool_state, m.seq, m.tokens, m.message FROM sessions s "
+                "LEFT JOIN messages m ON m.session_id = s.session_id AND m.seq >= s.start_seq "
+                "WHERE s.session_id = ? ORDER BY m.seq", (session_id,)).fetchall()
+        if not rows:
+            return state
+        first_seq, summary, tool_state = rows[0][:3]
+        state.conversation_history.restore(
+            first_seq, [row[3:] for row in rows if row[3] is not None], summary)
+        if tool_state is not None:
+            tool_state = json.loads(tool_state)
+            state.pending_function_calls = tool_state["pending_function_calls"]
+            state.confirmation_steps = tool_state["confirmation_steps"]
+        state.saved_seq = state.conversation_history.next_seq
+        return state
+
+    def save(self, session_id: str, state: ConversationState) -> None:
+        history = state.conversation_history
+        start_seq = history.first_seq - len(history.unsummarized)
+        new_rows = []
+        for seq in range(max(state.saved_seq, start_seq), history.next_seq):
+            if seq < history.first_seq:
+                # Appended and evicted within the same turn
+                message = history.unsummarized[seq - start_seq]
+                new_rows.append((session_id, seq, history.count_tokens(message), dumps(message)))
+            else:
+                index = seq - history.first_seq
+                new_rows.append((session_id, seq, history.token_counts[index], history.encoded[index]))
+        tool_state = None
+        if state.pending_function_calls or state.confirmation_steps:
+            tool_state = dumps({"pending_function_calls": state.pending_function_calls,
+                                "confirmation_steps": state.confirmation_steps})
+        with self.lock:
+            connection = self.connection
+            connection.execute("BEGIN")
+            try:
+                if start_seq > 0:
+                    connection.execute("DELETE FROM messages WHERE session_id = ? AND seq < ?", (session_id, start_seq))
+                connection.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)", new_rows)
+                connection.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+                                   (session_id, start_seq, history.first_seq, history.summary, tool_state, time.time()))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        state.saved_seq = history.next_seq
+
+    def drop(self, session_id: str) -> None:
+        super().drop(session_id)
+        with self.lock:
+            connection = self.connection
+            connection.execute("BEGIN")
+            connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            connection.execute("COMMIT")
+
+    def evict_idle(self, max_idle: float) -> int:
+        """Unload sessions idle for `max_idle` seconds from memory; their stored state is kept."""
+        idle = self.idle_sessions(max_idle)
+        for session_id in idle:
+            self.save(session_id, self.sessions.pop(session_id))
+        return len(idle)
+
+    def close(self) -> None:
+        for session_id, state in list(self.sessions.items()):
+            self.save(session_id, state)
+        with self.lock:
+            self.connection.close()
+
+
+def session_store_from_environment() -> Optional[PersistentSessionStore]:
+    """A PersistentSessionStore at the `session_db` environment variable's path, or None without it."""
+    path = os.environ.get("session_db")
+    return PersistentSessionStore(path) if path else None
@@ -0,0 +1,168 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Everything below is compiled once at import; SlotFiller.extract makes a single
+# finditer pass over the utterance with SLOT_REGEX.
+
+DIGIT_WORDS = {"zero": "0", "oh": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+               "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9"}
+_DIGIT = r"(?:\d|" + "|".join(DIGIT_WORDS) + r")"
+_WORD = r"[a-z0-9%+-]+"
+# An address starts at a word boundary with a letter or digit, not inside a word or after a symbol,
+# and not at the object of "email me at ..." / "reach us at ..."
+_LOCAL_START = r"(?<![\w.@'%+-])(?=[a-z0-9])(?!(?:me|us|him|her|them|you|it)\s+at\s)"
+# ...and ends at a word boundary that does not continue the address ("... at john.smith@example.com")
+_ADDRESS_END = r"\b(?![.@]?\w)"
+# Spoken or written separators: "john dot smith at example dot com" / "john.smith@example.com"
+_LOCAL_JOINER = r"(?:\s*[._+-]\s*|\s+(?:dot|underscore|dash|hyphen|plus)\s+)"
+_AT = r"(?:\s*@\s*|\s+at\s+)"
+# "at" is often heard as "that", which is too common in sentences ("...office that day dot com") to
+# build an email from on its own: only accepted after a local part that looks like an address
+# ("john dot smith that example dot com", "jsmith42 that example dot com")
+_MISHEARD_AT = r"\s+that\s+"
+_SPOKEN_AT = r"(?:\s*@\s*|\s+(?:at|that)\s+)"
+_DOT = r"(?:\s*\.\s*|\s+dot\s+)"
+# Words that end a name ("i'm john and ...") or show the phrase is not a name at all
+_NOT_NAME = (r"(?!(?:and|but|or|my|email|from|with|at|here|calling|having|trying|not|a|an|the|so|just|"
+             r"looking|still|unable|in|on|is|was|going|getting|sorry|fine|good|ok|okay|sure|yes|no)\b)")
+_NAME_WORD = _NOT_NAME + r"[a-z][a-z'.-]*"
+# Trailing characters that belong to the sentence, not the name ("Hi, I'm Bob.")
+NAME_TRAILING = ".'-"
+# An issue clause runs until the end of the sentence or the next "and my ..." / "and i ..." clause
+_CLAUSE_END = r"(?=\s+and\s+(?:my|i|the|you)\b|\s*[.!?;,]|$)"
+_PROBLEM = (r"(?:not\s+)?(?:working|work|broken|crashing|crashes|failing|fails|responding|respond|loading|load|"
+            r"turning on|turn on|printing|print|connecting|connect|starting|start|down|frozen|freezing|slow|"
+            r"showing an error|giving an error|an error)")
+
+SLOT_REGEX = re.compile(
+    # Email, spoken or written
+    rf"{_LOCAL_START}(?P<email>(?:{_WORD}(?:{_LOCAL_JOINER}{_WORD})*{_AT}"
+    rf"|(?:{_WORD}(?:{_LOCAL_JOINER}{_WORD})+|[a-z]*\d[a-z0-9]*){_MISHEARD_AT})"
+    rf"{_WORD}(?:{_DOT}{_WORD})*{_DOT}[a-z]{{2,}}){_ADDRESS_END}"
+    # Phone number, as digits or spoken digits
+    rf"|(?<![\w+])(?P<phone>(?:\+?1[\s.-]?)?\(?\d{{3}}\)?[\s.-]?\d{{3}}[\s.-]?\d{{4}}"
+    rf"|(?:{_DIGIT}[\s,-]+){{6,14}}{_DIGIT})(?!\w)"
+    # Name after an explicit introduction, in any case
+    rf"|\b(?:my name is|my name's|name is|call me|name:)\s+(?P<name>{_NAME_WORD}(?:\s+{_NAME_WORD}){{0,2}})"
+    # Name after "i'm" / "this is" only when capitalized, so "i'm having trouble" is not a name
+    rf"|\b(?:i am|i'm|this is|it's)\s+(?P<name_intro>(?-i:[A-Z]){_NAME_WORD}(?:\s+(?-i:[A-Z]){_NAME_WORD}){{0,2}})"
+    # Issue stated explicitly
+    rf"|\b(?:the |my )?(?:issue|problem)(?: is|:)\s+(?:that\s+)?(?P<issue>.+?){_CLAUSE_END}"
+    # Issue described as "my printer is not working", "the vpn keeps failing"
+    rf"|\b(?P<issue_clause>(?:my|the|our)\s+(?!(?:name|email|e-mail|number|phone|contact)\b)[a-z0-9' -]{{1,40}}?"
+    rf"\s+(?:is|isn't|is not|won't|will not|doesn't|does not|keeps|stopped|can't|cannot|has stopped)\s+{_PROBLEM}.*?)"
+    rf"{_CLAUSE_END}"
+    # "i'm having trouble with ...", "i can't log in"
+    rf"|\b(?:i'm|i am|we're|we are)\s+having\s+(?P<issue_trouble>(?:a\s+|an\s+|some\s+)?"
+    rf"(?:trouble|problems?|issues?|difficulty)\b.+?){_CLAUSE_END}"
+    rf"|\b(?P<issue_unable>i\s+(?:can't|cannot|can not|am unable to|am not able to)\s+.+?){_CLAUSE_END}",
+    re.IGNORECASE
+)
+
+# Named groups of SLOT_REGEX -> slot kind
+GROUP_SLOTS = {"email": "email", "phone": "phone", "name": "name", "name_intro": "name",
+               "issue": "issue", "issue_clause": "issue", "issue_trouble": "issue", "issue_unable": "issue"}
+
+# Schema field names understood by the slot filler -> slot kind
+FIELD_ALIASES = {"name": "name", "full_name": "name", "email": "email", "email_address": "email",
+                 "contact_number": "phone", "phone": "phone", "phone_number": "phone",
+                 "issue": "issue", "description": "issue", "problem": "issue"}
+
+EMAIL_REGEX = re.compile(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}", re.IGNORECASE)
+SPOKEN_AT_REGEX = re.compile(_SPOKEN_AT, re.IGNORECASE)
+SPOKEN_SYMBOL_REGEX = re.compile(r"\s*\b(dot|underscore|dash|hyphen|plus)\b\s*", re.IGNORECASE)
+SPOKEN_SYMBOLS = {"dot": ".", "underscore": "_", "dash": "-", "hyphen": "-", "plus": "+"}
+WHITESPACE_REGEX = re.compile(r"\s+")
+DIGIT_WORD_REGEX = re.compile(r"\b(?:" + "|".join(DIGIT_WORDS) + r")\b", re.IGNORECASE)
+NON_DIGIT_REGEX = re.compile(r"[^\d+]")
+# Replies that answer a yes/no question and never fill a free-text field
+YES_NO_REGEX = re.compile(
+    r"(?:(?:yes|yeah|yep|yup|no|nope|nah|sure|ok(?:ay)?|alright|all right|right|correct|exactly|fine|"
+    r"of course|please|thanks|thank you|not really|that's right|that's correct)[\s,.!?]*)+",
+    re.IGNORECASE
+)
+# Lead-ins dropped when a whole reply is taken as the answer to a single question
+ANSWER_LEAD_IN_REGEX = re.compile(
+    r"^(?:(?:sure|ok(?:ay)?|yes|yeah|well|so|um|uh),?\s+)*(?:(?:it's|it is|my name is|i'm|i am|this is|"
+    r"the (?:issue|problem) is|my (?:issue|problem) is)\s+)?",
+    re.IGNORECASE
+)
+
+
+def normalize_email(text: str) -> str:
+    """Turn a spoken email ("john dot smith at example dot com") into an address."""
+    address = SPOKEN_AT_REGEX.sub("@", text.strip())
+    address = SPOKEN_SYMBOL_REGEX.sub(lambda match: SPOKEN_SYMBOLS[match.group(1).lower()], address)
+    return WHITESPACE_REGEX.sub("", address).lower()
+
+
+def is_valid_email(email: str) -> bool:
+    """Whether `email`, written or spoken, is a syntactically valid address."""
+    return bool(email) and EMAIL_REGEX.fullmatch(normalize_email(email)) is not None
+
+
+def normalize_phone(text: str) -> Optional[str]:
+    digits = NON_DIGIT_REGEX.sub("", DIGIT_WORD_REGEX.sub(lambda match: DIGIT_WORDS[match.group(0).lower()], text))
+    return digits if 7 <= len(digits.lstrip("+")) <= 15 else None
+
+
+class SlotFiller:
+    """
+    Pulls every field of a tool's schema out of one user utterance.
+
+    Emails (including spoken ones), phone numbers, names and issue descriptions
+    are found in a single pass with one precompiled expression. `extract`
+    returns only the schema's fields. When the utterance holds none of the
+    fields the user was asked for and exactly one free-text field (name or
+    issue) is expected, the whole reply is taken as its answer, unless it is
+    only a yes/no-style reply.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        # Slot kind -> schema field name
+        self.fields: Dict[str, str] = {}
+        for field in fields:
+            kind = FIELD_ALIASES.get(field)
+            if kind and kind not in self.fields:
+                self.fields[kind] = field
+
+    def extract(self, text: str, expected: Iterable[str] = ()) -> Dict[str, str]:
+        values: Dict[str, str] = {}
+        issues: List[str] = []
+        for match in SLOT_REGEX.finditer(text):
+            group = match.lastgroup
+            kind = GROUP_SLOTS[group]
+            value = match.group(group).strip(" ,")
+            if kind == "email":
+                value = normalize_email(value)
+            elif kind == "phone":
+                value = normalize_phone(value)
+            elif kind == "name":
+                value = value.rstrip(NAME_TRAILING)
+            if not value or kind not in self.fields:
+                continue
+            if kind == "issue":
+                issues.append(value)
+            else:
+                # Later mentions win ("john at example dot com, sorry, jon at example dot com")
+                values[self.fields[kind]] = value
+        if issues and "issue" in self.fields:
+            values[self.fields["issue"]] = ". ".join(issues)
+
+        expected = list(expected)
+        if not any(field in values for field in expected):
+            free_text = [field for field in expected if FIELD_ALIASES.get(field) in ("name", "issue")]
+            if len(free_text) == 1 and len(expected) == 1 and not YES_NO_REGEX.fullmatch(text.strip()):
+                answer = ANSWER_LEAD_IN_REGEX.sub("", text.strip()).strip(" .!?")
+                if FIELD_ALIASES[free_text[0]] == "name":
+                    answer = answer.rstrip(NAME_TRAILING)
+                if FIELD_ALIASES[free_text[0]] == "name" and len(answer.split()) > 4:
+                    return values
+                if answer:
+                    values[free_text[0]] = answer
+        return values
+
+    @staticmethod
+    def email_was_spoken(email: str, text: str) -> bool:
+        """Whether `email` was reconstructed from a spoken form rather than written out in `text`."""
+        return email.lower() not in text.lower()
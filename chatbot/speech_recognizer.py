@@ -1,14 +1,202 @@
-import speech_recognition as sr
+import json
 import logging
+import time
+from typing import Callable, List, Optional
+
+from chatbot.capture import AudioCapture, MicrophoneSource
+from chatbot.tracing import TRACER
+
+try:
+    import vosk
+except ImportError:  # vosk is optional; only needed for the local backend
+    vosk = None
+
+
+class ASRBackend:
+    """
+    Speech to text for captured utterances.
+
+    `transcribe` returns the text of a complete utterance, or None if nothing was
+    understood. Streaming backends also implement `start_stream`, which returns
+    an object fed one frame at a time (`feed(frame)` returns the partial
+    hypothesis when it changes, `finish()` the final text). Streams that know
+    when each word was said also keep `words`, (word, start, end) tuples for the
+    final text in seconds from the start of the stream.
+    """
+
+    name = "base"
+    streaming = False
+
+    def transcribe(self, utterance) -> Optional[str]:
+        raise NotImplementedError
+
+    def start_stream(self, sample_rate: int):
+        raise NotImplementedError
+
+
+class GoogleASR(ASRBackend):
+    """Google Web Speech API: one network round trip per complete utterance."""
+
+    name = "google"
+
+    def __init__(self, language="en-US"):
+        # speech_recognition is imported on first use (in the thread creating the backend), not with this module
+        import speech_recognition as sr
 
-class SpeechRecognizer:
-    def __init__(self, language="en-US", microphone_index=None):
         self.recognizer = sr.Recognizer()
         self.language = language
+
+    def transcribe(self, utterance) -> Optional[str]:
+        import speech_recognition as sr
+
+        try:
+            return self.recognizer.recognize_google(utterance.to_audio_data(), language=self.language)
+        except sr.UnknownValueError:
+            return None
+
+
+class _VoskStream:
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        # Text of the segments Vosk has already finalized inside this utterance
+        self.committed = []
+        self.partial = ""
+        # Word timings of the finalized segments
+        self.words = []
+
+    def _text(self, tail: str) -> str:
+        return " ".join(self.committed + [tail] if tail else self.committed)
+
+    def feed(self, frame: bytes) -> Optional[str]:
+        if self.recognizer.AcceptWaveform(frame):
+            result = json.loads(self.recognizer.Result())
+            self._add_words(result)
+            text = result.get("text", "")
+            if text:
+                self.committed.append(text)
+            hypothesis = self._text("")
+        else:
+            hypothesis = self._text(json.loads(self.recognizer.PartialResult()).get("partial", ""))
+        if hypothesis and hypothesis != self.partial:
+            self.partial = hypothesis
+            return hypothesis
+        return None
+
+    def _add_words(self, result: dict) -> None:
+        self.words.extend((word["word"], word["start"], word["end"]) for word in result.get("result", ()))
+
+    def finish(self) -> Optional[str]:
+        result = json.loads(self.recognizer.FinalResult())
+        self._add_words(result)
+        return self._text(result.get("text", "")) or None
+
+
+class VoskASR(ASRBackend):
+    """
+    Local, CPU-only recognition with Vosk (requires the vosk package and a model directory).
+
+    Streams: partial hypotheses are available while the user is still speaking.
+    With `grammar` (a list of phrases, plus "[unk]" for anything else) decoding
+    is restricted to those phrases, which is much cheaper, e.g. for spotting a
+    wake word.
+    """
+
+    name = "vosk"
+    streaming = True
+
+    def __init__(self, model_path: Optional[str] = None, grammar: Optional[List[str]] = None, model=None):
+        if vosk is None:
+            raise RuntimeError("vosk is not installed")
+        vosk.SetLogLevel(-1)
+        self.model = model if model is not None else vosk.Model(model_path)
+        self.grammar = json.dumps(grammar) if grammar else None
+
+    def with_grammar(self, grammar: List[str]) -> "VoskASR":
+        """A backend restricted to `grammar` that shares this backend's model."""
+        return VoskASR(grammar=grammar, model=self.model)
+
+    def start_stream(self, sample_rate: int) -> _VoskStream:
+        if self.grammar:
+            recognizer = vosk.KaldiRecognizer(self.model, sample_rate, self.grammar)
+        else:
+            recognizer = vosk.KaldiRecognizer(self.model, sample_rate)
+        recognizer.SetWords(True)
+        return _VoskStream(recognizer)
+
+    def transcribe(self, utterance) -> Optional[str]:
+        stream = self.start_stream(utterance.sample_rate)
+        stream.feed(utterance.audio)
+        return stream.finish()
+
+
+ASR_BACKENDS = {"google": GoogleASR, "vosk": VoskASR}
+
+
+def create_asr_backend(name: str = "google", **options) -> ASRBackend:
+    if name not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend: {name}")
+    return ASR_BACKENDS[name](**options)
+
+
+class StreamingTranscriber:
+    """
+    AudioCapture listener that runs a streaming backend over each utterance while it is spoken.
+
+    `on_partial` is called with every new partial hypothesis; the final text is
+    stored on the utterance (`transcript`) before it is queued, so it is ready
+    as soon as the utterance is.
+    """
+
+    def __init__(self, backend: ASRBackend, on_partial: Optional[Callable[[str], None]] = None):
+        self.backend = backend
+        self.on_partial = on_partial
+        self.stream = None
+
+    def speech_started(self, sample_rate: int) -> None:
+        self.stream = self.backend.start_stream(sample_rate)
+
+    def speech_frame(self, frame: bytes) -> None:
+        if self.stream is None:
+            return
+        partial = self.stream.feed(frame)
+        if partial and self.on_partial:
+            self.on_partial(partial)
+
+    def speech_ended(self, utterance) -> None:
+        stream, self.stream = self.stream, None
+        if stream is None:
+            return
+        with TRACER.span("asr", backend=self.backend.name, streaming=True):
+            text = stream.finish()
+        if utterance is not None:
+            utterance.transcript = text or ""
+
+
+def transcribe_utterance(backend: ASRBackend, utterance) -> Optional[str]:
+    """The text of `utterance`: its streamed transcript if there is one, otherwise a fresh transcription."""
+    if utterance.transcript is not None:
+        return utterance.transcript or None
+    with TRACER.span("asr", backend=backend.name, streaming=False):
+        return backend.transcribe(utterance)
+
+class SpeechRecognizer:
+    def __init__(self, language="en-US", microphone_index=None, capture=None, backend=None, on_partial=None,
+                 wake_word_gate=None):
+        self.language = language
         self.microphone_index = microphone_index
-        self.setup_microphone()
+        self.backend = backend or GoogleASR(language)
+        # Streaming backends transcribe on the capture thread while the user speaks
+        self.transcriber = StreamingTranscriber(self.backend, on_partial) if self.backend.streaming else None
+        # Optional WakeWordGate: only speech after the calling name is recognized
+        self.wake_word_gate = wake_word_gate
+        # Opened on first listen and kept open; pass an AudioCapture (e.g. over a WAV file) to replace the microphone.
+        # The microphones are listed and checked then too, rather than before anything else can start.
+        self.capture = capture
+        self.device_index = None
 
     def setup_microphone(self):
+        import speech_recognition as sr
+
         mic_list = sr.Microphone.list_microphone_names()
         if not mic_list:
             logging.error("No microphones found. Please connect a microphone.")
@@ -28,19 +216,50 @@ class SpeechRecognizer:
             self.device_index = None
             logging.info("Using default microphone.")
 
+    def start(self):
+        """Open the microphone and start capturing in the background."""
+        if self.capture is None:
+            self.setup_microphone()
+            self.capture = AudioCapture(MicrophoneSource(self.device_index))
+        for listener in (self.wake_word_gate, self.transcriber):
+            if listener is not None and listener not in self.capture.listeners:
+                self.capture.listeners.append(listener)
+        self.capture.start()
+        return self.capture
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.close()
+
+    def _next_utterance(self, capture, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            utterance = capture.next_utterance(timeout=remaining)
+            if utterance is None or self.wake_word_gate is None:
+                return utterance
+            utterance = self.wake_word_gate.admit(utterance)
+            if utterance is not None:
+                return utterance
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
     def listen(self, timeout=None, phrase_time_limit=None):
+        import speech_recognition as sr
+
         try:
-            with sr.Microphone(device_index=self.device_index) as source:
-                logging.info("Adjusting for ambient noise...")
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
-                logging.info("Listening...")
-                audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
-                transcription = self.recognizer.recognize_google(audio, language=self.language)
-                logging.info(f"You said: {transcription}")
-                return transcription.lower()
-        except sr.WaitTimeoutError:
-            logging.warning("Listening timed out while waiting for phrase to start.")
-            return None
+            capture = self.start()
+            logging.info("Listening...")
+            utterance = self._next_utterance(capture, timeout)
+            if utterance is None:
+                logging.warning("Listening timed out while waiting for phrase to start.")
+                return None
+            transcription = transcribe_utterance(self.backend, utterance.trim(phrase_time_limit))
+            if not transcription:
+                logging.warning("Could not understand audio.")
+                return None
+            logging.info(f"You said: {transcription}")
+            return transcription.lower()
         except sr.UnknownValueError:
             logging.warning("Could not understand audio.")
             return None
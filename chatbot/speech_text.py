@@ -0,0 +1,319 @@
+import re
+from typing import Any, Iterable, Iterator, List, Tuple
+from urllib.parse import urlsplit
+
+# Kinds of segment produced by SpeechTextNormalizer
+SPEECH = "speech"
+CODE = "code"
+
+# Modes of the normalizer
+PROSE = "prose"
+INLINE_CODE = "inline_code"
+FENCED_CODE = "fenced_code"
+
+CODE_FENCE = "```"
+# Inline code up to this length is spoken verbatim; longer spans are treated like code blocks
+INLINE_CODE_SPOKEN_MAX = 40
+
+# Tokens of prose: backtick runs, line breaks, other whitespace and words
+TOKEN = re.compile(r"`+|\n|[^\S\n]+|[^\s`]+")
+# Language tag on the opening line of a fenced code block
+INFO_STRING = re.compile(r"[\w+#.-]*")
+# Markup at the start of a line: headings, bullets, block quotes, rules and table separators
+LINE_MARKER = re.compile(r"#{1,6}|[-*+>]|[-*_]{3,}|\|?(?::?-+:?\|?)+")
+NUMBERED_MARKER = re.compile(r"\d+[.)]")
+# Emphasis and strikethrough markers that are not inside a word (snake_case and 2*3 are kept)
+EMPHASIS = re.compile(r"(?<!\w)[*_~]+|[*_~]+(?!\w)")
+LINK_TARGET = re.compile(r"\]\([^)]*\)?")
+# Opening punctuation, the word itself and closing punctuation
+WORD_PARTS = re.compile(r"([(\"'\[<]*)(.*?)([)\"'\]>.,;:!?]*)", re.DOTALL)
+SENTENCE_END = re.compile(r"[.!?][)\"'\]]*$")
+CLOSING_PUNCTUATION = ".,;:!?)\"'"
+
+# Only words with one of these can need verbalizing
+VERBALIZE_HINT = re.compile(r"[\d@/$€£%]|www\.", re.IGNORECASE)
+URL = re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE)
+EMAIL = re.compile(r"([\w.+-]+)@([\w-]+(?:\.[\w-]+)+)")
+AMOUNT = r"\d[\d,]*(?:\.\d+)?"
+CURRENCY = re.compile(rf"([$€£])({AMOUNT})([kKmMbB]?)")
+PERCENT = re.compile(rf"({AMOUNT})%")
+# "5-10" and "5–10"; longer numbers around a hyphen are phone numbers or years, not ranges
+NUMBER_RANGE = re.compile(rf"(\d{{1,3}})-(\d{{1,3}})|({AMOUNT})–({AMOUNT})")
+VERSION = re.compile(r"[vV]?(\d+(?:\.\d+){2,})")
+
+CURRENCY_NAMES = {"$": "dollars", "€": "euros", "£": "pounds"}
+MAGNITUDES = {"k": "thousand", "m": "million", "b": "billion"}
+# Words spoken differently from how they are written
+SYMBOLS = {"&": "and", "->": "to", "=>": "to", "→": "to", "=": "equals", "+": "plus", "|": "", "-": "", "–": "", "—": ""}
+ABBREVIATIONS = {"e.g.": "for example", "i.e.": "that is", "vs.": "versus", "approx.": "approximately"}
+# Abbreviations that do not end a sentence
+TITLES = {"mr.", "mrs.", "ms.", "dr.", "prof.", "st."}
+
+
+def spoken_domain(domain: str) -> str:
+    return domain.replace(".", " dot ")
+
+
+def verbalize(word: str) -> str:
+    """Spell out a URL, email address, amount, percentage, range or version number the way it is said."""
+    if not VERBALIZE_HINT.search(word):
+        return word
+    if URL.fullmatch(word):
+        host = urlsplit(word if "://" in word else "http://" + word).hostname or ""
+        return spoken_domain(host[4:] if host.startswith("www.") else host)
+    match = EMAIL.fullmatch(word)
+    if match:
+        return f"{match.group(1).replace('.', ' dot ')} at {spoken_domain(match.group(2))}"
+    match = CURRENCY.fullmatch(word)
+    if match:
+        symbol, amount, magnitude = match.groups()
+        magnitude = MAGNITUDES.get(magnitude.lower(), "")
+        return " ".join(part for part in (amount, magnitude, CURRENCY_NAMES[symbol]) if part)
+    match = PERCENT.fullmatch(word)
+    if match:
+        return f"{match.group(1)} percent"
+    match = NUMBER_RANGE.fullmatch(word)
+    if match:
+        start, end = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+        return f"{start} to {end}"
+    match = VERSION.fullmatch(word)
+    if match:
+        return match.group(1).replace(".", " point ")
+    return word
+
+
+def speakable_word(word: str) -> str:
+    """A word of markdown prose as it should be spoken ("" if it is only markup)."""
+    if word.isalpha():
+        return word
+    stripped = word.rstrip(",;:")
+    abbreviation = ABBREVIATIONS.get(stripped.lower())
+    if abbreviation is not None:
+        return abbreviation + word[len(stripped):]
+    if stripped.rstrip(".!?").isalpha():
+        return word
+    if "](" in word:
+        # Keep the text of [text](url) links
+        word = LINK_TARGET.sub("", word)
+    word = EMPHASIS.sub("", word)
+    if word in SYMBOLS:
+        return SYMBOLS[word]
+    if word.startswith("!["):
+        word = word[1:]
+    lead, core, trail = WORD_PARTS.fullmatch(word).groups()
+    if "[" in lead or "<" in lead:
+        lead = lead.replace("[", "").replace("<", "")
+    if "]" in trail or ">" in trail:
+        trail = trail.replace("]", "").replace(">", "")
+    return lead + verbalize(core) + trail
+
+
+class SpeechTextNormalizer:
+    """
+    Incremental conversion of markdown chat replies into speakable text.
+
+    Text is fed in chunks of any size (stream deltas or a whole reply) and comes
+    back as (kind, text) segments: SPEECH segments are sentences, headings or
+    list items ready for TTS, returned as soon as they end; CODE segments are
+    fenced code blocks (without the language tag) and long inline code, which
+    are not spoken. In prose, markdown markup is removed and URLs, email
+    addresses, amounts, percentages, ranges and versions are spelled out.
+
+    Each chunk is scanned once: complete words are tokenized with one regex and
+    only the unfinished last word is kept for the next chunk (a chunk without
+    whitespace is just appended to it); inside a code block only the closing
+    fence is searched for. `close` flushes what is left at the end of the reply.
+    """
+
+    def __init__(self, inline_code_max: int = INLINE_CODE_SPOKEN_MAX):
+        self.inline_code_max = inline_code_max
+        self.buffer = ""
+        self.mode = PROSE
+        # Spoken words of the segment being built
+        self.words: List[str] = []
+        self.inline_parts: List[str] = []
+        self.line_start = True
+        # Where to resume looking for the closing fence in `buffer`
+        self.fence_scan = 0
+        self.segments: List[Tuple[str, str]] = []
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Consume a chunk and return the segments it completes."""
+        # Outside code blocks the buffer holds at most an unfinished word, so the last
+        # whitespace, which ends the words that are complete, can only be in `text`
+        last_space = max(text.rfind(" "), text.rfind("\n"), text.rfind("\t"))
+        if last_space < 0 and self.mode != FENCED_CODE:
+            self.buffer += text
+            return []
+        limit = len(self.buffer) + last_space + 1
+        self.buffer += text
+        self._process(limit)
+        return self._take()
+
+    def close(self) -> List[Tuple[str, str]]:
+        """Return the remaining segments at the end of the text and reset for the next one."""
+        self._process(len(self.buffer), final=True)
+        if self.mode == INLINE_CODE:
+            # A stray backtick: what follows it is prose
+            self._unclosed_inline_code()
+        self._end_segment()
+        self.line_start = True
+        return self._take()
+
+    def _take(self) -> List[Tuple[str, str]]:
+        segments = self.segments
+        self.segments = []
+        return segments
+
+    def _process(self, limit: int, final: bool = False) -> None:
+        """Consume `buffer`, tokenizing prose up to `limit` (just past the last whitespace)."""
+        buffer = self.buffer
+        pos = 0
+        while pos < len(buffer):
+            if self.mode == FENCED_CODE:
+                end = buffer.find(CODE_FENCE, max(pos, self.fence_scan))
+                if end >= 0:
+                    self._emit_code_block(buffer[pos:end])
+                    pos = end + len(CODE_FENCE)
+                    self.mode = PROSE
+                elif final:
+                    self._emit_code_block(buffer[pos:])
+                    pos = len(buffer)
+                    self.mode = PROSE
+                else:
+                    # A fence split across chunks starts at most two characters back
+                    self.fence_scan = max(pos, len(buffer) - len(CODE_FENCE) + 1)
+                    break
+                continue
+
+            if limit <= pos:
+                break
+            for match in TOKEN.finditer(buffer, pos, limit):
+                token = match.group()
+                if token[0] == "`":
+                    if len(token) >= len(CODE_FENCE) and self.mode == PROSE:
+                        self._end_segment()
+                        self.mode = FENCED_CODE
+                        pos = self.fence_scan = match.end()
+                        break
+                    self._toggle_inline_code()
+                elif self.mode == INLINE_CODE:
+                    if token == "\n":
+                        self._unclosed_inline_code()
+                        self._end_line()
+                    else:
+                        self.inline_parts.append(token)
+                elif token == "\n":
+                    self._end_line()
+                elif not token.isspace():
+                    self._add_word(token)
+            else:
+                pos = limit
+                break
+        self.buffer = buffer[pos:]
+        self.fence_scan = max(0, self.fence_scan - pos)
+
+    def _add_word(self, token: str) -> None:
+        if self.line_start:
+            self.line_start = False
+            if LINE_MARKER.fullmatch(token):
+                return
+            if NUMBERED_MARKER.fullmatch(token):
+                # "1." numbers a list item; it does not end a sentence
+                self.words.append(token)
+                return
+        text = speakable_word(token)
+        if not text:
+            return
+        if self.words and not text.strip(CLOSING_PUNCTUATION):
+            # Punctuation right after inline code belongs to it
+            self.words[-1] += text
+        else:
+            self.words.append(text)
+        if text[-1] in CLOSING_PUNCTUATION and SENTENCE_END.search(text) and token.lower() not in TITLES:
+            self._end_segment()
+
+    def _end_line(self) -> None:
+        self._end_segment()
+        self.line_start = True
+
+    def _end_segment(self) -> None:
+        if self.words:
+            self.segments.append((SPEECH, " ".join(self.words)))
+            self.words = []
+
+    def _toggle_inline_code(self) -> None:
+        if self.mode == PROSE:
+            self.mode = INLINE_CODE
+            self.inline_parts = []
+            return
+        self.mode = PROSE
+        code = "".join(self.inline_parts).strip()
+        if not code:
+            return
+        self.line_start = False
+        if len(code) <= self.inline_code_max:
+            self.words.append(code)
+        else:
+            self.segments.append((CODE, code))
+
+    def _unclosed_inline_code(self) -> None:
+        self.mode = PROSE
+        for part in self.inline_parts:
+            if not part.isspace():
+                self._add_word(part)
+        self.inline_parts = []
+
+    def _emit_code_block(self, code: str) -> None:
+        first_line, newline, rest = code.partition("\n")
+        if newline and INFO_STRING.fullmatch(first_line.strip()):
+            code = rest
+        code = code.strip("\n").rstrip() if newline else code.strip()
+        if code.strip():
+            self.segments.append((CODE, code))
+
+
+def speech_segments(text: str) -> List[Tuple[str, str]]:
+    """The (kind, text) segments of a whole reply."""
+    normalizer = SpeechTextNormalizer()
+    return normalizer.feed(text) + normalizer.close()
+
+
+def normalize_for_speech(text: str) -> Tuple[str, List[str]]:
+    """The speakable text of a whole reply and its code blocks."""
+    speech: List[str] = []
+    code_blocks: List[str] = []
+    for kind, segment in speech_segments(text):
+        (speech if kind == SPEECH else code_blocks).append(segment)
+    return " ".join(speech), code_blocks
+
+
+class SpeechStream:
+    """
+    Turn a stream of text deltas into (kind, text) speech and code segments.
+
+    The streaming counterpart of SentenceStream: each segment is yielded as soon
+    as it ends, so it can be spoken while the rest of the reply is generated.
+    After iteration, `text` holds the full reply and `result` holds the return
+    value of the wrapped generator (if any).
+    """
+
+    def __init__(self, deltas: Iterable[str]):
+        self.deltas = deltas
+        self.text = ""
+        self.result: Any = None
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        normalizer = SpeechTextNormalizer()
+        parts: List[str] = []
+        iterator = iter(self.deltas)
+        while True:
+            try:
+                delta = next(iterator)
+            except StopIteration as stop:
+                self.result = stop.value
+                break
+            parts.append(delta)
+            yield from normalizer.feed(delta)
+        self.text = "".join(parts)
+        yield from normalizer.close()
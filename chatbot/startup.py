@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from chatbot.tracing import TRACER
+
+
+class Warmup:
+    """
+    A component built by `factory`, on a background thread started right away
+    (or in the calling thread with `background=False`). `result` waits for it.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], background: bool = True):
+        self.name = name
+        self.factory = factory
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.seconds: Optional[float] = None
+        self.done = threading.Event()
+        if background:
+            threading.Thread(target=self._run, name=f"startup-{name}", daemon=True).start()
+        else:
+            self._run()
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        try:
+            self.value = self.factory()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - started
+            TRACER.record("startup", self.seconds, component=self.name)
+            self.done.set()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """The component, once built; raises the factory's error if building it failed."""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"{self.name} was not ready within {timeout} seconds")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class Startup:
+    """
+    Builds an application's components concurrently.
+
+    Each component started with `start` is built on its own thread, so slow
+    initializations (module imports, the speech engine, the microphone, model
+    loading, the TLS handshake with the API) overlap instead of adding up, and
+    `get` waits only for the component needed next. `mark` records milestones
+    such as the greeting or being ready to listen, in seconds since the
+    Startup was created.
+
+    With `background=False` every component is built in the calling thread as
+    soon as it is started, one after another, which is the previous sequential
+    startup (kept for comparison in the startup benchmark).
+    """
+
+    def __init__(self, background: bool = True):
+        self.background = background
+        self.started = time.perf_counter()
+        self.components: Dict[str, Warmup] = {}
+        self.milestones: Dict[str, float] = {}
+
+    def start(self, name: str, factory: Callable[[], Any]) -> Warmup:
+        warmup = self.components[name] = Warmup(name, factory, self.background)
+        return warmup
+
+    def get(self, name: str, timeout: Optional[float] = None) -> Any:
+        return self.components[name].result(timeout)
+
+    def mark(self, milestone: str) -> float:
+        seconds = self.milestones[milestone] = time.perf_counter() - self.started
+        TRACER.record("startup", seconds, milestone=milestone)
+        return seconds
+
+    def timings(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Seconds spent building each component and to reach each milestone."""
+        return {
+            "components": {name: warmup.seconds for name, warmup in self.components.items()},
+            "milestones": dict(self.milestones),
+        }
@@ -0,0 +1,200 @@
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# A sentence ends with terminal punctuation (optionally followed by closing quotes or
+# brackets) and whitespace, or with a line break.
+SENTENCE_BOUNDARY = re.compile(r'[.!?]+["\')\]]*\s+|\n+')
+CODE_FENCE = "```"
+
+
+class SSEDecoder:
+    """
+    Incremental server-sent events parser, fed one line at a time.
+
+    Multi-line data fields are joined with newlines, comment lines are ignored and
+    the OpenAI '[DONE]' sentinel sets `done`.
+    """
+
+    def __init__(self):
+        self.data_lines: List[str] = []
+        self.done = False
+
+    def feed_line(self, line) -> Optional[str]:
+        """Consume one line and return the data payload of the event it completes, if any."""
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r\n")
+        if not line:
+            return self.flush()
+        if not line.startswith(":"):
+            field, _, value = line.partition(":")
+            if field == "data":
+                self.data_lines.append(value[1:] if value.startswith(" ") else value)
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Dispatch the pending event (called on a blank line or at the end of the stream)."""
+        if not self.data_lines:
+            return None
+        payload = "\n".join(self.data_lines)
+        self.data_lines = []
+        if payload == "[DONE]":
+            self.done = True
+            return None
+        return payload
+
+
+def iter_sse_data(lines: Iterable[str]) -> Iterator[str]:
+    """Parse a server-sent events stream and yield the data payload of each event."""
+    decoder = SSEDecoder()
+    for line in lines:
+        payload = decoder.feed_line(line)
+        if decoder.done:
+            return
+        if payload is not None:
+            yield payload
+    payload = decoder.flush()
+    if payload is not None:
+        yield payload
+
+
+def iter_sse_json(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield each SSE data payload decoded as JSON."""
+    for payload in iter_sse_data(lines):
+        yield json.loads(payload)
+
+
+class StreamAccumulator:
+    """
+    Assemble a chat completion message from streamed delta chunks.
+
+    Text deltas are returned as they arrive while function call names and argument
+    fragments (legacy `function_call` or parallel `tool_calls`, keyed by index) are
+    collected until the stream ends.
+    """
+
+    def __init__(self):
+        self.content_parts: List[str] = []
+        self.function_name: Optional[str] = None
+        self.argument_parts: List[str] = []
+        # Tool call index -> {"id", "name", "argument_parts"}
+        self.tool_calls: Dict[int, Dict[str, Any]] = {}
+        self.finish_reason: Optional[str] = None
+
+    def add_chunk(self, chunk: Dict[str, Any]) -> str:
+        """Consume one streamed chunk and return its text delta (possibly empty)."""
+        choices = chunk.get("choices") or []
+        if not choices:
+            return ""
+        choice = choices[0]
+        if choice.get("finish_reason"):
+            self.finish_reason = choice["finish_reason"]
+        delta = choice.get("delta") or {}
+
+        function_call = delta.get("function_call")
+        if function_call:
+            if function_call.get("name"):
+                self.function_name = function_call["name"]
+            if function_call.get("arguments"):
+                self.argument_parts.append(function_call["arguments"])
+
+        for tool_call in delta.get("tool_calls") or []:
+            entry = self.tool_calls.setdefault(tool_call.get("index", 0), {"id": None, "name": None, "argument_parts": []})
+            if tool_call.get("id"):
+                entry["id"] = tool_call["id"]
+            function = tool_call.get("function") or {}
+            if function.get("name"):
+                entry["name"] = function["name"]
+            if function.get("arguments"):
+                entry["argument_parts"].append(function["arguments"])
+
+        content = delta.get("content") or ""
+        if content:
+            self.content_parts.append(content)
+        return content
+
+    @property
+    def content(self) -> str:
+        return "".join(self.content_parts)
+
+    @property
+    def has_function_call(self) -> bool:
+        return self.function_name is not None or bool(self.tool_calls)
+
+    def message(self) -> Dict[str, Any]:
+        """Return the assembled message in the same shape as a non-streamed response."""
+        message: Dict[str, Any] = {"role": "assistant", "content": self.content}
+        if self.function_name is not None:
+            message["function_call"] = {
+                "name": self.function_name,
+                "arguments": "".join(self.argument_parts) or "{}"
+            }
+        if self.tool_calls:
+            message["tool_calls"] = [
+                {
+                    "id": entry["id"],
+                    "type": "function",
+                    "function": {"name": entry["name"], "arguments": "".join(entry["argument_parts"]) or "{}"}
+                }
+                for _, entry in sorted(self.tool_calls.items())
+            ]
+        return message
+
+
+class SentenceStream:
+    """
+    Regroup a stream of text deltas into complete sentences.
+
+    Iterating yields each sentence as soon as its boundary has been received, so it
+    can be handed to TTS while the rest of the reply is still being generated. Fenced
+    code blocks are never split. After iteration, `text` holds the full reply and
+    `result` holds the return value of the wrapped generator (if any).
+    """
+
+    def __init__(self, deltas: Iterable[str]):
+        self.deltas = deltas
+        self.text = ""
+        self.result: Any = None
+
+    def __iter__(self) -> Iterator[str]:
+        buffer = ""
+        parts: List[str] = []
+        iterator = iter(self.deltas)
+        while True:
+            try:
+                delta = next(iterator)
+            except StopIteration as stop:
+                self.result = stop.value
+                break
+            parts.append(delta)
+            buffer += delta
+            sentences, buffer = split_sentences(buffer)
+            for sentence in sentences:
+                yield sentence
+        self.text = "".join(parts)
+        remainder = buffer.strip()
+        if remainder:
+            yield remainder
+
+
+def split_sentences(buffer: str) -> Tuple[List[str], str]:
+    """Split complete sentences off the front of `buffer` and return them with the remainder."""
+    sentences: List[str] = []
+    start = 0
+    search_from = 0
+    while True:
+        match = SENTENCE_BOUNDARY.search(buffer, search_from)
+        if not match:
+            break
+        end = match.end()
+        # Only split outside fenced code blocks.
+        if buffer.count(CODE_FENCE, start, end) % 2:
+            search_from = end
+            continue
+        sentence = buffer[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = search_from = end
+    return sentences, buffer[start:]
+
@@ -0,0 +1,269 @@
+import asyncio
+import contextvars
+import inspect
+import json
+import re
+import typing
+from concurrent.futures import Executor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from chatbot.tracing import TRACER
+
+# Python annotation -> JSON schema type
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+# "name (str): description" lines in the Parameters section of a docstring
+DOCSTRING_PARAMETER_REGEX = re.compile(r"^\s*(\w+)\s*(?:\([^)]*\))?\s*:\s*(.+?)\s*$")
+DOCSTRING_SECTION_REGEX = re.compile(r"^\s*(?:Parameters|Args|Arguments|Returns|Raises|Yields)\s*:\s*$")
+
+
+def json_schema_type(annotation: Any) -> Dict[str, Any]:
+    """JSON schema of a parameter annotation (Optional[...] is unwrapped, unknown types become strings)."""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        arguments = [argument for argument in typing.get_args(annotation) if argument is not type(None)]
+        if len(arguments) == 1:
+            return json_schema_type(arguments[0])
+    if origin in (list, List):
+        schema: Dict[str, Any] = {"type": "array"}
+        arguments = typing.get_args(annotation)
+        if arguments:
+            schema["items"] = json_schema_type(arguments[0])
+        return schema
+    if origin in (dict, Dict):
+        return {"type": "object"}
+    return {"type": JSON_TYPES.get(annotation, "string")}
+
+
+def parse_docstring(docstring: Optional[str]) -> typing.Tuple[str, Dict[str, str]]:
+    """Return the summary paragraph of a docstring and the descriptions of its parameters."""
+    lines = inspect.cleandoc(docstring or "").splitlines()
+    summary_lines = []
+    for line in lines:
+        if not line.strip():
+            break
+        summary_lines.append(line.strip())
+
+    descriptions: Dict[str, str] = {}
+    in_parameters = False
+    for line in lines:
+        if DOCSTRING_SECTION_REGEX.match(line):
+            in_parameters = line.strip().rstrip(":") in ("Parameters", "Args", "Arguments")
+            continue
+        if in_parameters:
+            match = DOCSTRING_PARAMETER_REGEX.match(line)
+            if match:
+                descriptions[match.group(1)] = match.group(2)
+    return " ".join(summary_lines), descriptions
+
+
+class Tool:
+    """
+    A Python function the model can call.
+
+    The JSON schema is derived once from the signature (types, defaults) and the
+    docstring (summary, "name (type): description" parameter lines). With
+    `interactive`, the arguments are collected from the user and confirmed by the
+    handler's slot-filling flow before the tool runs, and the reply is composed
+    locally; other tools run as soon as the model calls them and their results
+    are sent back to the model.
+
+    `reply` turns the result of a tool the handler runs itself (an interactive
+    tool, or any tool once the tool rounds are used up) into the reply for the
+    user; without it the result is reported as JSON.
+    """
+
+    def __init__(self, function: Callable[..., Any], name: Optional[str] = None, description: Optional[str] = None,
+                 timeout: Optional[float] = 10.0, interactive: bool = False,
+                 reply: Optional[Callable[[Any], str]] = None):
+        self.function = function
+        self.name = name or function.__name__
+        self.timeout = timeout
+        self.interactive = interactive
+        self.reply = reply
+        self.is_async = inspect.iscoroutinefunction(function)
+
+        summary, parameter_descriptions = parse_docstring(function.__doc__)
+        hints = typing.get_type_hints(function)
+        properties: Dict[str, Dict[str, Any]] = {}
+        required: List[str] = []
+        for parameter in inspect.signature(function).parameters.values():
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                continue
+            schema = json_schema_type(hints.get(parameter.name, str))
+            if parameter.name in parameter_descriptions:
+                schema["description"] = parameter_descriptions[parameter.name]
+            properties[parameter.name] = schema
+            if parameter.default is parameter.empty:
+                required.append(parameter.name)
+
+        self.schema: Dict[str, Any] = {
+            "name": self.name,
+            "description": description or summary,
+            "parameters": {"type": "object", "properties": properties, "required": required}
+        }
+
+    @property
+    def properties(self) -> Dict[str, Dict[str, Any]]:
+        return self.schema["parameters"]["properties"]
+
+    @property
+    def required(self) -> List[str]:
+        return self.schema["parameters"]["required"]
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+
+class ToolCall(NamedTuple):
+    # None for legacy `function_call` responses
+    id: Optional[str]
+    name: str
+    arguments: str
+
+    def parsed_arguments(self) -> Dict[str, Any]:
+        return json.loads(self.arguments or "{}")
+
+
+class ToolResult(NamedTuple):
+    call: ToolCall
+    content: str
+    error: bool = False
+
+
+def tool_calls_of(message: Dict[str, Any]) -> List[ToolCall]:
+    """The tool calls of an assistant message, in either the `tool_calls` or the legacy `function_call` format."""
+    calls = [
+        ToolCall(call.get("id"), call["function"]["name"], call["function"].get("arguments") or "{}")
+        for call in message.get("tool_calls") or []
+    ]
+    function_call = message.get("function_call")
+    if not calls and function_call:
+        calls.append(ToolCall(None, function_call["name"], function_call.get("arguments") or "{}"))
+    return calls
+
+
+def encode_tool_result(result: Any) -> str:
+    """A tool's return value as message content: strings as they are, anything else as JSON."""
+    return result if isinstance(result, str) else json.dumps(result, default=str)
+
+
+class ToolRegistry:
+    """
+    Tools indexed by name, with their schemas built once.
+
+    Register functions with the `tool` decorator. `functions` and `tool_schemas`
+    are the request payloads for the legacy `functions` and the `tools` formats;
+    both lists are rebuilt only when a tool is registered, so they can be sent
+    (and hashed) as-is on every request.
+    """
+
+    def __init__(self):
+        self.tools: Dict[str, Tool] = {}
+        self.functions: List[Dict[str, Any]] = []
+        self.tool_schemas: List[Dict[str, Any]] = []
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tools
+
+    def __iter__(self):
+        return iter(self.tools.values())
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self.tools.get(name)
+
+    def register(self, tool: Tool) -> Tool:
+        self.tools[tool.name] = tool
+        self.functions = [registered.schema for registered in self.tools.values()]
+        self.tool_schemas = [{"type": "function", "function": schema} for schema in self.functions]
+        return tool
+
+    def tool(self, name: Optional[str] = None, description: Optional[str] = None, timeout: Optional[float] = 10.0,
+             interactive: bool = False, reply: Optional[Callable[[Any], str]] = None):
+        """Decorator registering a function as a tool; the function itself is returned unchanged."""
+        def decorator(function):
+            self.register(Tool(function, name, description, timeout, interactive, reply))
+            return function
+        return decorator
+
+    def _run(self, call: ToolCall) -> Any:
+        with TRACER.span("tool", tool=call.name):
+            return self.tools[call.name].function(**call.parsed_arguments())
+
+    def execute(self, calls: List[ToolCall], executor: Executor) -> List[ToolResult]:
+        """
+        Run independent tool calls concurrently on `executor` and return their results in order.
+
+        Each call is bounded by its tool's timeout; failures and timeouts are
+        reported as error results for the model instead of being raised. A call
+        that times out keeps its worker thread until it returns.
+        """
+        futures = []
+        for call in calls:
+            if call.name not in self.tools:
+                futures.append(None)
+            else:
+                # The worker runs in a copy of the caller's context so the call is traced with its turn
+                futures.append(executor.submit(contextvars.copy_context().run, self._run, call))
+
+        results = []
+        for call, future in zip(calls, futures):
+            if future is None:
+                results.append(ToolResult(call, f"Unknown tool '{call.name}'.", True))
+                continue
+            try:
+                result = future.result(timeout=self.tools[call.name].timeout)
+                results.append(ToolResult(call, encode_tool_result(result)))
+            except FutureTimeoutError:
+                future.cancel()
+                results.append(ToolResult(call, f"Tool '{call.name}' timed out.", True))
+            except Exception as e:
+                results.append(ToolResult(call, f"Tool '{call.name}' failed: {e}", True))
+        return results
+
+    async def execute_async(self, calls: List[ToolCall], executor: Optional[Executor] = None) -> List[ToolResult]:
+        """Asynchronous `execute`: coroutine tools are awaited, the others run on `executor`."""
+        return list(await asyncio.gather(*(self._execute_one_async(call, executor) for call in calls)))
+
+    async def _execute_one_async(self, call: ToolCall, executor: Optional[Executor]) -> ToolResult:
+        tool = self.tools.get(call.name)
+        if tool is None:
+            return ToolResult(call, f"Unknown tool '{call.name}'.", True)
+        try:
+            if tool.is_async:
+                with TRACER.span("tool", tool=call.name):
+                    result = await asyncio.wait_for(tool.function(**call.parsed_arguments()), tool.timeout)
+            else:
+                awaitable = asyncio.get_running_loop().run_in_executor(
+                    executor, contextvars.copy_context().run, self._run, call
+                )
+                result = await asyncio.wait_for(awaitable, tool.timeout)
+            return ToolResult(call, encode_tool_result(result))
+        except asyncio.TimeoutError:
+            return ToolResult(call, f"Tool '{call.name}' timed out.", True)
+        except Exception as e:
+            return ToolResult(call, f"Tool '{call.name}' failed: {e}", True)
+
+
+def tool_result_messages(message: Dict[str, Any], results: List[ToolResult]) -> List[Dict[str, Any]]:
+    """
+    The history messages for one round of tool calls: the assistant message that
+    made the calls followed by one result message per call, all sent back to the
+    model in a single follow-up request. The API rejects a history in which a
+    call has no result, so `results` must cover every call of `message`.
+    """
+    assistant = {"role": "assistant", "content": message.get("content")}
+    if message.get("tool_calls"):
+        assistant["tool_calls"] = message["tool_calls"]
+    elif message.get("function_call"):
+        assistant["function_call"] = message["function_call"]
+    messages = [assistant]
+    for result in results:
+        if result.call.id is None:
+            messages.append({"role": "function", "name": result.call.name, "content": result.content})
+        else:
+            messages.append({"role": "tool", "tool_call_id": result.call.id, "content": result.content})
+    return messages
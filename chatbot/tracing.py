@@ -0,0 +1,260 @@
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from chatbot.payload import dumps
+
+# Stages timed across the voice pipeline:
+#   capture, endpointing        - speech captured and trailing silence waited for (capture thread)
+#   asr                         - speech recognition of an utterance
+#   intent                      - local intent routing
+#   llm_request                 - chat completion request including retries (attempts attribute)
+#   llm_first_token             - time to the first streamed token
+#   finish_check                - conversation finished check
+#   tool                        - one tool call (tool attribute)
+#   tts_synthesis, tts_playback - rendering and playing one sentence
+#   startup                     - initializing one component (component attribute) or reaching a
+#                                 startup milestone (milestone attribute)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = "voice_bot"
+
+# Trace id of the turn being handled; copied into worker threads with contextvars.copy_context()
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the `q` quantile (None without observations)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class _Span:
+    __slots__ = ("tracer", "stage", "trace_id", "attributes", "started")
+
+    def __init__(self, tracer: "Tracer", stage: str, trace_id: Optional[str], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.stage = stage
+        self.trace_id = trace_id if trace_id is not None else _trace_id.get()
+        self.attributes = attributes
+
+    def __enter__(self) -> "_Span":
+        self.started = time.perf_counter()
+        return self
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.record(self.stage, time.perf_counter() - self.started, self.trace_id, **self.attributes)
+        return False
+
+
+class _NullSpan:
+    """Span handed out while tracing is disabled; does nothing."""
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Times the stages of each turn into in-process histograms.
+
+    `span(stage)` is a context manager timing its block; `record` adds a timing
+    measured elsewhere. Every timing carries the trace id of the turn it belongs
+    to (set with `turn()`), so the stages of one turn can be put back together
+    from the JSONL export. `count` keeps plain counters such as retries.
+
+    Disabled (the default), `span` returns a shared no-op span and `record`
+    returns at once, so instrumented code costs an attribute check. Enable with
+    `configure`: timings go to the histograms, optionally to a JSONL file (one
+    object per timing) and are served as Prometheus text by `serve_prometheus`.
+    """
+
+    def __init__(self, enabled: bool = False, jsonl_path: Optional[str] = None,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = False
+        self.buckets = tuple(buckets)
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.jsonl_file = None
+        self.server = None
+        if enabled:
+            self.configure(jsonl_path=jsonl_path)
+
+    def configure(self, enabled: bool = True, jsonl_path: Optional[str] = None) -> "Tracer":
+        with self.lock:
+            if self.jsonl_file is not None:
+                self.jsonl_file.close()
+                self.jsonl_file = None
+            if enabled and jsonl_path:
+                self.jsonl_file = open(jsonl_path, "ab", buffering=0)
+            self.enabled = enabled
+        return self
+
+    def span(self, stage: str, trace_id: Optional[str] = None, **attributes):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, stage, trace_id, attributes)
+
+    def record(self, stage: str, seconds: float, trace_id: Optional[str] = None, **attributes) -> None:
+        if not self.enabled:
+            return
+        if trace_id is None:
+            trace_id = _trace_id.get()
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if self.jsonl_file is not None:
+                entry = {"time": time.time(), "trace_id": trace_id, "stage": stage, "seconds": seconds}
+                entry.update(attributes)
+                self.jsonl_file.write(dumps(entry) + b"\n")
+
+    def count(self, name: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def turn(self, trace_id: Optional[str] = None) -> Iterator[Optional[str]]:
+        """Run the block as one turn: timings recorded inside it carry its trace id."""
+        if not self.enabled:
+            yield None
+            return
+        token = _trace_id.set(trace_id or uuid.uuid4().hex[:16])
+        try:
+            yield _trace_id.get()
+        finally:
+            _trace_id.reset(token)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per stage: count, mean and approximate p50/p95 (bucket upper bounds)."""
+        with self.lock:
+            return {
+                stage: {
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count if histogram.count else None,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                }
+                for stage, histogram in self.histograms.items()
+            }
+
+    def prometheus_text(self) -> str:
+        """The histograms and counters in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self.lock:
+            histograms: List[Tuple[str, Histogram]] = sorted(self.histograms.items())
+            if histograms:
+                lines.append(f"# HELP {METRIC_PREFIX}_stage_seconds Time spent in each stage of a turn.")
+                lines.append(f"# TYPE {METRIC_PREFIX}_stage_seconds histogram")
+            for stage, histogram in histograms:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+                lines.append(f"{METRIC_PREFIX}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "127.0.0.1"):
+        """Serve `prometheus_text` at http://host:port/metrics from a background thread."""
+        # Only needed with a metrics port, so not imported with the module
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        return self.server
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        self.configure(enabled=False)
+
+
+# Tracer shared by the whole pipeline; disabled until configured
+TRACER = Tracer()
+
+
+def configure_from_environment() -> Tracer:
+    """
+    Enable TRACER from the `trace_file` (JSONL output path) and `metrics_port`
+    (Prometheus endpoint) environment variables; it stays disabled without them.
+    """
+    trace_file = os.environ.get("trace_file")
+    metrics_port = os.environ.get("metrics_port")
+    if trace_file or metrics_port:
+        TRACER.configure(jsonl_path=trace_file)
+        if metrics_port:
+            TRACER.serve_prometheus(int(metrics_port))
+    return TRACER
@@ -1,20 +1,605 @@
-import pyttsx3
+import hashlib
+import os
+import queue
+import shutil
+import tempfile
 import threading
+import time
+import wave
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterable, Optional
 
-class TTS:
-    def __init__(self, rate=150, volume=1.0, voice=None):
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', rate)
-        self.engine.setProperty('volume', volume)
-        if voice:
-            self.engine.setProperty('voice', voice)
+from chatbot.speech_text import SPEECH, speech_segments
+from chatbot.tracing import TRACER, current_trace_id
+
+try:
+    import sounddevice
+except (ImportError, OSError):  # sounddevice (and PortAudio) are optional; fall back to engine playback
+    sounddevice = None
+
+# sounddevice sample formats by WAV sample width
+SAMPLE_FORMATS = {1: "uint8", 2: "int16", 4: "int32"}
+# Frames written per block during playback; cancel() takes effect between blocks
+PLAYBACK_BLOCK_FRAMES = 1024
+
+DEFAULT_AUDIO_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gpt_voice_bot", "tts")
+
+
+def is_playable_wav(path: str) -> bool:
+    """Whether `path` is a WAV file sounddevice can play (pyttsx3 drivers may write e.g. AIFF instead)."""
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getsampwidth() in SAMPLE_FORMATS and wav.getnframes() > 0
+    except (wave.Error, EOFError, OSError):
+        return False
+
+
+class AudioCache:
+    """
+    Content-addressed cache of rendered phrases.
+
+    WAV files are stored under the hash of (text, voice, rate, volume), and the
+    least recently played files are evicted once the directory exceeds
+    `max_bytes`. Phrases are admitted on their second synthesis (or explicitly,
+    for prewarmed phrases) so one-off replies do not churn the cache.
+    """
+
+    def __init__(self, directory: str = DEFAULT_AUDIO_CACHE_DIR, max_bytes: int = 50 * 1024 * 1024,
+                 admit_after: int = 2, max_tracked: int = 4096):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.admit_after = admit_after
+        self.max_tracked = max_tracked
         self.lock = threading.Lock()
+        # key -> file size, least recently used first
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        # Synthesis counts of phrases not cached yet
+        self.seen: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".wav"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+        self._evict()
 
-    def speak(self, text):
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    @staticmethod
+    def key(text: str, voice, rate, volume) -> str:
+        return hashlib.sha256(f"{voice}\0{rate}\0{volume}\0{text}".encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached file for `key`, marking it as recently used, or None."""
         with self.lock:
-            self.engine.say(text)
-            self.engine.runAndWait()
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        path = self.path(key)
+        try:
+            # The modification time keeps the LRU order across restarts
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+        return path
 
-    def stop(self):
+    def should_admit(self, key: str) -> bool:
+        """Count a synthesis of `key` and return whether it is now frequent enough to cache."""
         with self.lock:
-            self.engine.stop()
\ No newline at end of file
+            count = self.seen.pop(key, 0) + 1
+            if count >= self.admit_after:
+                return True
+            self.seen[key] = count
+            if len(self.seen) > self.max_tracked:
+                self.seen.popitem(last=False)
+            return False
+
+    def store(self, key: str, source_path: str) -> str:
+        """Copy a rendered file into the cache and return its cached path."""
+        path = self.path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            self._evict()
+        return path
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.total_bytes}
+
+
+class _Utterance:
+    __slots__ = ("generation", "text", "path", "cached", "trace_id")
+
+    def __init__(self, generation: int, text: str, path: Optional[str] = None):
+        self.generation = generation
+        self.text = text
+        self.path = path
+        # Cached files are played in place and never deleted after playback
+        self.cached = False
+        # Turn that queued the utterance; synthesis and playback run on other threads
+        self.trace_id = current_trace_id()
+
+
+class _Marker:
+    """Queue item that signals `event` once every utterance queued before it has been handled."""
+    __slots__ = ("event",)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+class _Settings:
+    """Queue item that changes the engine's rate and volume for the utterances queued after it."""
+    __slots__ = ("rate", "volume")
+
+    def __init__(self, rate, volume):
+        self.rate = rate
+        self.volume = volume
+
+
+_STOP = object()
+_PREWARM = object()
+
+
+class TTS:
+    """
+    Text to speech on background threads.
+
+    `enqueue` returns immediately; a synthesis thread renders queued utterances to
+    WAV files with the pyttsx3 engine while a playback thread plays the previous
+    one, so the next sentence is ready as soon as the current one ends. `cancel`
+    drops everything queued and interrupts playback. Without sounddevice the
+    engine speaks directly on the synthesis thread (no pre-synthesis).
+
+    With `cache_dir`, frequently spoken phrases are kept in an AudioCache and
+    played straight from disk; `prewarm` renders known phrases in the background.
+
+    `audio_sink`, if given, is called on the playback thread with the path of
+    each rendered WAV file instead of playing it on the sound device (e.g. a
+    null sink when benchmarking without audio hardware).
+
+    pyttsx3 is imported and its engine initialized on the synthesis thread. The
+    constructor waits for it unless `wait_ready` is False; then it returns at
+    once, text queued meanwhile is spoken as soon as the engine is up, and
+    `wait_ready()` waits for it.
+
+    If the engine's rendered files cannot be played as WAV (pyttsx3 writes AIFF
+    on macOS), every utterance from then on is spoken by the engine directly;
+    a file that cannot be played (e.g. a cached phrase evicted while it was
+    queued) is spoken directly too. Direct speech runs on the synthesis thread,
+    which also interrupts it on `cancel`: pyttsx3 engines must only be used
+    from the thread that created them.
+
+    `is_playing(tail)` and `recent_text` tell what the speakers are putting out,
+    so speech the microphone picks up meanwhile can be checked for echo (see
+    EchoGuard).
+    """
+
+    def __init__(self, rate=150, volume=1.0, voice=None, queue_size=32, presynthesize=True,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 50 * 1024 * 1024,
+                 audio_sink: Optional[Callable[[str], None]] = None, wait_ready: bool = True):
+        self.rate = rate
+        self.volume = volume
+        self.voice = voice
+        # What the engine is set to; lags rate/volume until queued settings are applied
+        self.engine_rate = rate
+        self.engine_volume = volume
+        self.audio_sink = audio_sink
+        self.presynthesize = presynthesize and (sounddevice is not None or audio_sink is not None)
+        self.audio_cache = AudioCache(cache_dir, cache_max_bytes) if cache_dir and self.presynthesize else None
+        # Phrases to render into the cache while the synthesis thread is idle
+        self.prewarm_queue: "queue.Queue" = queue.Queue()
+        self.text_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        # Holds at most one rendered utterance besides the one playing
+        self.play_queue: "queue.Queue" = queue.Queue(maxsize=1)
+        self.generation = 0
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+        self.engine = None
+        # Set once the engine's rendered files turn out not to be playable WAV
+        self.direct_speech = False
+        # Generation of the utterance the engine is speaking directly, checked on every word
+        self._speaking_generation: Optional[int] = None
+        # (utterance, done event) the playback thread could not play, spoken by the synthesis thread
+        self.fallback_queue: "queue.Queue" = queue.Queue()
+        # Text of the utterance being played, when playback of the last one ended, and the last few played
+        self.playing: Optional[str] = None
+        self.played_until = 0.0
+        self.recent_speech: Deque[str] = deque(maxlen=4)
+        self._engine_ready = threading.Event()
+        self._engine_error: Optional[BaseException] = None
+
+        self.synthesis_thread = threading.Thread(target=self._synthesis_loop, name="tts-synthesis", daemon=True)
+        self.synthesis_thread.start()
+        if self.presynthesize:
+            self.playback_thread = threading.Thread(target=self._playback_loop, name="tts-playback", daemon=True)
+            self.playback_thread.start()
+
+        # pyttsx3 engines must be used from the thread that created them
+        if wait_ready:
+            self.wait_ready()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the speech engine; raises the error of a failed initialization."""
+        ready = self._engine_ready.wait(timeout)
+        if self._engine_error is not None:
+            raise self._engine_error
+        return ready
+
+    def _init_engine(self):
+        # Imported here so loading the speech driver never holds up the thread creating the TTS
+        import pyttsx3
+
+        engine = pyttsx3.init()
+        engine.setProperty('rate', self.rate)
+        engine.setProperty('volume', self.volume)
+        if self.voice:
+            engine.setProperty('voice', self.voice)
+        engine.connect('started-word', self._on_word)
+        return engine
+
+    def _on_word(self, name, location, length) -> None:
+        # Called by the engine loop on the synthesis thread, so stopping here is safe
+        if self._speaking_generation is not None and self._speaking_generation != self.generation:
+            self.engine.stop()
+
+    def prewarm(self, phrases: Iterable[str]) -> None:
+        """Render `phrases` into the audio cache in the background, segment by segment as they are spoken."""
+        if self.audio_cache is None:
+            return
+        for phrase in phrases:
+            for kind, segment in speech_segments(phrase):
+                if kind == SPEECH:
+                    self.prewarm_queue.put(segment)
+        # Wake the synthesis thread if it is waiting for work
+        self.text_queue.put(_PREWARM)
+
+    def configure(self, rate=None, volume=None) -> None:
+        """Change the speaking rate (words per minute) and/or volume (0.0-1.0) of everything queued from now on."""
+        if rate is not None:
+            self.rate = rate
+        if volume is not None:
+            self.volume = max(0.0, min(1.0, volume))
+        self.text_queue.put(_Settings(self.rate, self.volume))
+
+    def enqueue(self, text: str) -> bool:
+        """Queue `text` to be spoken and return immediately. Returns False if the queue is full."""
+        if not text or not text.strip():
+            return True
+        # Counted before it is queued, so the threads can never finish it first
+        with self.pending_lock:
+            self.pending += 1
+        try:
+            self.text_queue.put_nowait(_Utterance(self.generation, text))
+        except queue.Full:
+            with self.pending_lock:
+                self.pending -= 1
+            return False
+        return True
+
+    def flush(self) -> threading.Event:
+        """Return an event that is set once everything queued so far has been spoken (or cancelled)."""
+        marker = _Marker()
+        self.text_queue.put(marker)
+        return marker.event
+
+    def speak(self, text, timeout: Optional[float] = None) -> None:
+        """Speak `text` and block until it has been spoken."""
+        with self.pending_lock:
+            self.pending += 1
+        self.text_queue.put(_Utterance(self.generation, text))
+        self.flush().wait(timeout)
+
+    def cancel(self) -> None:
+        """Drop every queued utterance and interrupt the one playing."""
+        # Utterances from older generations are skipped by both threads, and speech the engine is
+        # saying directly stops at the next word (see _on_word)
+        self.generation += 1
+
+    def stop(self):
+        self.cancel()
+
+    @property
+    def is_speaking(self) -> bool:
+        return self.pending > 0
+
+    def is_playing(self, tail: float = 0.0) -> bool:
+        """Whether audio is playing now or stopped less than `tail` seconds ago."""
+        return self.playing is not None or time.monotonic() - self.played_until < tail
+
+    @property
+    def recent_text(self) -> str:
+        """The text of the last few utterances played, including the one playing."""
+        playing = self.playing
+        return " ".join(list(self.recent_speech) + ([playing] if playing else []))
+
+    def _playback_started(self, text: str) -> None:
+        self.playing = text
+
+    def _playback_ended(self) -> None:
+        if self.playing is not None:
+            self.recent_speech.append(self.playing)
+        self.playing = None
+        self.played_until = time.monotonic()
+
+    def close(self) -> None:
+        self.cancel()
+        self.text_queue.put(_STOP)
+
+    def _done(self, utterance: _Utterance) -> None:
+        with self.pending_lock:
+            self.pending -= 1
+        if utterance.path and not utterance.cached:
+            try:
+                os.remove(utterance.path)
+            except OSError:
+                pass
+
+    def _synthesis_loop(self) -> None:
+        try:
+            self.engine = self._init_engine()
+        except BaseException as e:
+            self._engine_error = e
+            self._engine_ready.set()
+            self._discard_loop()
+            return
+        self._engine_ready.set()
+
+        while True:
+            self._speak_fallbacks()
+            try:
+                item = self.text_queue.get_nowait()
+            except queue.Empty:
+                # Nothing to say right now: use the time to prewarm the cache
+                if self._prewarm_one():
+                    continue
+                item = self.text_queue.get()
+            if item is _PREWARM:
+                continue
+            if isinstance(item, _Settings):
+                self.engine.setProperty('rate', item.rate)
+                self.engine.setProperty('volume', item.volume)
+                self.engine_rate, self.engine_volume = item.rate, item.volume
+                continue
+            if item is _STOP:
+                if self.presynthesize:
+                    self._to_playback(_STOP)
+                return
+            if isinstance(item, _Marker):
+                if self.presynthesize:
+                    self._to_playback(item)
+                else:
+                    item.event.set()
+                continue
+            if item.generation != self.generation:
+                self._done(item)
+                continue
+
+            rendered = False
+            if self.presynthesize and not self.direct_speech:
+                try:
+                    with TRACER.span("tts_synthesis", item.trace_id) as span:
+                        rendered = self._render(item)
+                        span.set(cached=item.cached)
+                except Exception as e:
+                    print(f"Error synthesizing speech: {e}")
+                    self._done(item)
+                    continue
+            if rendered:
+                self._to_playback(item)
+                continue
+
+            if self.presynthesize:
+                # Let what is already queued for playback finish first
+                self._wait_for_playback()
+            self._speak(item)
+            self._done(item)
+
+    def _speak(self, item: _Utterance) -> None:
+        """Say `item` with the engine, on the synthesis thread."""
+        if item.generation != self.generation:
+            return
+        with TRACER.span("tts_playback", item.trace_id, presynthesized=False):
+            self._playback_started(item.text)
+            self._speaking_generation = item.generation
+            try:
+                self.engine.say(item.text)
+                self.engine.runAndWait()
+            except Exception as e:
+                print(f"Error speaking: {e}")
+            finally:
+                self._speaking_generation = None
+                self._playback_ended()
+
+    def _speak_fallbacks(self) -> None:
+        """Speak the utterances the playback thread handed back."""
+        while True:
+            try:
+                item, done = self.fallback_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._speak(item)
+            finally:
+                done.set()
+
+    def _to_playback(self, item) -> None:
+        # The playback thread may be waiting for us to speak a fallback, so keep serving those
+        while True:
+            try:
+                self.play_queue.put(item, timeout=0.05)
+                return
+            except queue.Full:
+                self._speak_fallbacks()
+
+    def _wait_for_playback(self) -> None:
+        marker = _Marker()
+        self._to_playback(marker)
+        while not marker.event.wait(0.05):
+            self._speak_fallbacks()
+
+    def _discard_loop(self) -> None:
+        """Without an engine: drop queued utterances so `flush` and `speak` do not wait forever."""
+        print(f"Error initializing speech engine: {self._engine_error}")
+        while True:
+            item = self.text_queue.get()
+            if item is _STOP:
+                if self.presynthesize:
+                    self.play_queue.put(_STOP)
+                return
+            if isinstance(item, _Marker):
+                item.event.set()
+            elif isinstance(item, _Utterance):
+                self._done(item)
+
+    def _cache_key(self, text: str) -> str:
+        return AudioCache.key(text, self.voice, self.engine_rate, self.engine_volume)
+
+    def _render(self, item: _Utterance) -> bool:
+        """
+        Set `item.path` to a WAV file of its text, from the cache when possible.
+        Returns False if the engine's output cannot be played as WAV.
+        """
+        key = None
+        if self.audio_cache is not None:
+            key = self._cache_key(item.text)
+            cached_path = self.audio_cache.get(key)
+            if cached_path:
+                item.path = cached_path
+                item.cached = True
+                return True
+
+        fd, item.path = tempfile.mkstemp(prefix="tts-", suffix=".wav")
+        os.close(fd)
+        self._speaking_generation = item.generation
+        try:
+            self.engine.save_to_file(item.text, item.path)
+            self.engine.runAndWait()
+        finally:
+            self._speaking_generation = None
+        if item.generation != self.generation:
+            # Cancelled while rendering: the file may be cut short, so it is dropped, not cached
+            return True
+
+        if not is_playable_wav(item.path):
+            print("The speech engine does not render WAV audio; speaking directly instead")
+            self.direct_speech = True
+            os.remove(item.path)
+            item.path = None
+            return False
+
+        if key is not None and self.audio_cache.should_admit(key):
+            cached_path = self.audio_cache.store(key, item.path)
+            os.remove(item.path)
+            item.path = cached_path
+            item.cached = True
+        return True
+
+    def _prewarm_one(self) -> bool:
+        """Render one pending prewarm phrase into the cache. Returns False when there is none."""
+        if self.direct_speech:
+            return False
+        try:
+            text = self.prewarm_queue.get_nowait()
+        except queue.Empty:
+            return False
+        key = self._cache_key(text)
+        if key in self.audio_cache:
+            return True
+        fd, path = tempfile.mkstemp(prefix="tts-prewarm-", suffix=".wav")
+        os.close(fd)
+        try:
+            self.engine.save_to_file(text, path)
+            self.engine.runAndWait()
+            if is_playable_wav(path):
+                self.audio_cache.store(key, path)
+            else:
+                self.direct_speech = True
+        except Exception as e:
+            print(f"Error prewarming speech: {e}")
+        finally:
+            os.remove(path)
+        return True
+
+    def _playback_loop(self) -> None:
+        while True:
+            item = self.play_queue.get()
+            if item is _STOP:
+                return
+            if isinstance(item, _Marker):
+                item.event.set()
+                continue
+            try:
+                if item.generation == self.generation:
+                    with TRACER.span("tts_playback", item.trace_id):
+                        if self.audio_sink is not None:
+                            self._playback_started(item.text)
+                            self.audio_sink(item.path)
+                        elif not self._play_file(item):
+                            self._speak_on_synthesis_thread(item)
+            except Exception as e:
+                print(f"Error playing speech: {e}")
+            finally:
+                self._playback_ended()
+                self._done(item)
+
+    def _speak_on_synthesis_thread(self, item: _Utterance) -> None:
+        """Have the engine say an utterance whose file could not be played, and wait for it."""
+        done = threading.Event()
+        self.fallback_queue.put((item, done))
+        try:
+            # Wake the synthesis thread if it is waiting for text
+            self.text_queue.put_nowait(_PREWARM)
+        except queue.Full:
+            pass
+        done.wait()
+
+    def _play_file(self, item: _Utterance) -> bool:
+        """Play the utterance's file; returns False if it is missing or not playable WAV."""
+        if not is_playable_wav(item.path):
+            print(f"Error playing speech: cannot read {item.path} as WAV audio, speaking it directly")
+            return False
+        self._playback_started(item.text)
+        with wave.open(item.path, "rb") as wav:
+            with sounddevice.RawOutputStream(
+                samplerate=wav.getframerate(),
+                channels=wav.getnchannels(),
+                dtype=SAMPLE_FORMATS[wav.getsampwidth()]
+            ) as stream:
+                while item.generation == self.generation:
+                    frames = wav.readframes(PLAYBACK_BLOCK_FRAMES)
+                    if not frames:
+                        break
+                    stream.write(frames)
+        return True
@@ -0,0 +1,152 @@
+import re
+from typing import List, Optional, Tuple
+
+from chatbot.capture import FRAME_MS
+
+DEFAULT_CALLING_NAME = "computer"
+
+
+def calling_name_pattern(calling_name: str) -> "re.Pattern":
+    """Matches the calling name as whole words, however the recognizer spaced or capitalized it."""
+    words = [re.escape(word) for word in calling_name.lower().split()]
+    return re.compile(r"\b" + r"\s+".join(words) + r"\b", re.IGNORECASE)
+
+
+def strip_calling_name(text: str, calling_name: str) -> str:
+    """Drop the calling name and anything said before it."""
+    match = calling_name_pattern(calling_name).search(text)
+    if match is None:
+        return text
+    return text[match.end():].lstrip(" ,.!?")
+
+
+class KeywordSpotter:
+    """
+    Spots the calling name in a stream of frames with a streaming recognizer.
+
+    The recognizer should be cheap: a local backend restricted to the calling
+    name (e.g. `VoskASR.with_grammar([name, "[unk]"])`) decodes only that one
+    phrase, so it can run on every captured frame.
+    """
+
+    def __init__(self, backend, calling_name: str = DEFAULT_CALLING_NAME):
+        self.backend = backend
+        self.calling_name = calling_name
+        self.pattern = calling_name_pattern(calling_name)
+        self.stream = None
+
+    def start(self, sample_rate: int) -> None:
+        self.stream = self.backend.start_stream(sample_rate)
+
+    def feed(self, frame: bytes) -> bool:
+        """Consume one frame and return whether the calling name has just been heard."""
+        hypothesis = self.stream.feed(frame)
+        return bool(hypothesis and self.pattern.search(hypothesis))
+
+    def finish(self) -> Optional[float]:
+        """
+        End the utterance and return where the calling name ended in it (in seconds),
+        or None if it was not said. Without word timings from the backend, that
+        is 0.0: the name was heard, but not when.
+        """
+        stream, self.stream = self.stream, None
+        text = stream.finish() if stream is not None else None
+        if not text or not self.pattern.search(text):
+            return None
+        return self.name_end(getattr(stream, "words", None) or [])
+
+    def name_end(self, words: List[Tuple[str, float, float]]) -> float:
+        """The end time of the first word that completes the calling name in `words`."""
+        text = ""
+        ends = []
+        for word, _, end in words:
+            text = f"{text} {word}" if text else word
+            ends.append((len(text), end))
+        match = self.pattern.search(text)
+        if match is None:
+            return 0.0
+        return next(end for offset, end in ends if offset >= match.end())
+
+
+class WakeWordGate:
+    """
+    Lets through only speech addressed to the bot, before it reaches speech recognition.
+
+    As an AudioCapture listener, the gate runs a KeywordSpotter on every frame of
+    an utterance and marks where the calling name ended (`keyword_end`). When
+    only the final result has the name, its word timings place the end; a
+    backend without them gives 0.0, and the whole utterance is passed on with
+    the name stripped from its streamed transcript.
+    `admit` then returns what should be recognized: the rest of an utterance
+    that starts with the calling name, or, when the calling name was said on
+    its own, the next utterance if it starts within `follow_seconds`.
+    Everything else returns None and never costs a recognition request.
+
+    `accepted`, `rejected` and `woken` count utterances for tuning.
+    """
+
+    def __init__(self, spotter: KeywordSpotter, follow_seconds: float = 5.0, min_command_seconds: float = 0.3):
+        self.spotter = spotter
+        self.follow_seconds = follow_seconds
+        self.min_command_seconds = min_command_seconds
+        # Stream time until which an utterance is accepted without the calling name
+        self.armed_until: Optional[float] = None
+        self.frames = 0
+        self.keyword_end: Optional[float] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.woken = 0
+
+    @property
+    def calling_name(self) -> str:
+        return self.spotter.calling_name
+
+    # AudioCapture listener interface
+
+    def speech_started(self, sample_rate: int) -> None:
+        self.spotter.start(sample_rate)
+        self.frames = 0
+        self.keyword_end = None
+
+    def speech_frame(self, frame: bytes) -> None:
+        if self.spotter.stream is None:
+            return
+        self.frames += 1
+        if self.keyword_end is None and self.spotter.feed(frame):
+            self.keyword_end = self.frames * FRAME_MS / 1000
+
+    def speech_ended(self, utterance) -> None:
+        name_end = self.spotter.finish()
+        if utterance is None:
+            return
+        if self.keyword_end is None and name_end is not None:
+            # Only the final result had it
+            self.keyword_end = name_end
+        utterance.keyword_end = self.keyword_end
+
+    def admit(self, utterance):
+        """Return the utterance (or the part of it after the calling name) to recognize, or None."""
+        if utterance.keyword_end is not None:
+            self.woken += 1
+            command = utterance.after(utterance.keyword_end)
+            if utterance.transcript is not None:
+                command.transcript = strip_calling_name(utterance.transcript, self.calling_name)
+            if command.duration >= self.min_command_seconds and command.transcript != "":
+                self.armed_until = None
+                self.accepted += 1
+                return command
+            # Just the calling name: the command follows in the next utterance
+            self.armed_until = utterance.ended_at + self.follow_seconds
+            return None
+
+        if self.armed_until is not None and utterance.started_at <= self.armed_until:
+            self.armed_until = None
+            self.accepted += 1
+            return utterance
+
+        self.rejected += 1
+        return None
+
+    @property
+    def is_armed(self) -> bool:
+        return self.armed_until is not None
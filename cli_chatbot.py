@@ -1,7 +1,19 @@
 import os
 import sys
+from chatbot.intents import AssistantContext, default_router
 from chatbot.openai_handler import OpenAIHandler
-from chatbot.tts import TTS
+from chatbot.session import session_store_from_environment
+from chatbot.speech_text import CODE, SpeechStream
+from chatbot.tracing import TRACER, configure_from_environment
+from chatbot.tts import DEFAULT_AUDIO_CACHE_DIR, TTS
+
+# Phrases the CLI speaks verbatim; rendered into the audio cache at startup
+FIXED_PHRASES = [
+    "Conversation cleared.",
+    "Conversation completed. Goodbye.",
+    "An error occurred. Please try again.",
+    "Okay."
+]
 
 def main():
     api_key = os.environ.get("openai_token")
@@ -9,28 +21,49 @@ def main():
         print("Error: OpenAI API key not found in environment variable 'openai_token'.")
         sys.exit(1)
 
-    chatbot = OpenAIHandler(api_key=api_key, model="gpt-4o-mini")
-    tts = TTS()
+    # Per-stage timings, exported when `trace_file` (JSONL) or `metrics_port` (Prometheus) is set
+    configure_from_environment()
+    # With `session_db` set, the conversation is saved there and resumed on the next start
+    chatbot = OpenAIHandler(api_key=api_key, model="gpt-4o-mini", session_store=session_store_from_environment())
+    tts = TTS(cache_dir=DEFAULT_AUDIO_CACHE_DIR)
+    tts.prewarm(FIXED_PHRASES + chatbot.fixed_prompts())
+    router = default_router()
+    context = AssistantContext(chatbot, tts)
 
     print("ChatBot CLI started. Type 'new chat' to reset conversation or 'exit' to quit.")
     while True:
         try:
             user_input = input("You: ").strip()
-            if user_input.lower() == "new chat":
-                chatbot.reset_conversation()
-                tts.speak("Conversation cleared.")
-                print("Conversation history has been cleared.")
-                continue
-            elif user_input.lower() in ["exit", "quit"]:
-                print("Exiting ChatBot CLI.")
-                break
-            elif not user_input:
+            if not user_input:
                 continue
-            response, finished = chatbot.generate_response(user_input)
-            if response:
-                print(f"GPT: {response}")
-                tts.speak(response)
+            with TRACER.turn():
+                # Requests like "new chat", "exit" or "what's the time" are answered locally
+                reply = router.handle(user_input, context)
+                if reply is not None:
+                    if context.should_exit:
+                        print("Exiting ChatBot CLI.")
+                        break
+                    if reply:
+                        print(f"Bot: {reply}")
+                        tts.enqueue(reply)
+                    continue
+                # Speak each sentence as soon as it has streamed in; code is printed, not spoken
+                segments = SpeechStream(chatbot.generate_response_stream(user_input))
+                print("GPT: ", end="", flush=True)
+                spoken = []
+                for kind, segment in segments:
+                    if kind == CODE:
+                        print(f"\n{segment}\n", flush=True)
+                        continue
+                    print(segment, end=" ", flush=True)
+                    tts.enqueue(segment)
+                    spoken.append(segment)
+                print()
+                context.last_answer = " ".join(spoken)
+                # The finish check ran in the background while the reply was spoken
+                finished = segments.result or chatbot.wait_finished()
             if finished:
+                tts.flush().wait()
                 tts.speak("Conversation completed. Goodbye.")
                 exit()
         except KeyboardInterrupt:
@@ -38,7 +71,7 @@ def main():
             break
         except Exception as e:
             print(f"An error occurred: {e}")
-            tts.speak("An error occurred. Please try again.")
+            tts.enqueue("An error occurred. Please try again.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from benchmarks.mock_openai import DEFAULT_REPLY, MockOpenAIServer
+from chatbot.async_handler import AsyncOpenAIHandler
+from chatbot.session import PersistentSessionStore
+
+
+@pytest.fixture
+def server():
+    with MockOpenAIServer(latency=0.3, jitter=0.0, tokens_per_second=1000, function_trigger=None) as server:
+        yield server
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def handler_for(server, **options):
+    options.setdefault("finish_check", "none")
+    return AsyncOpenAIHandler(api_key="test", model="gpt-4o-mini", api_url=server.url, timeout=5, **options)
+
+
+def contents(handler, session_id):
+    return [(m["role"], m["content"]) for m in handler.sessions.get(session_id).conversation_history]
+
+
+def test_sessions_run_concurrently_and_stay_isolated(server):
+    async def main():
+        async with handler_for(server) as handler:
+            started = time.monotonic()
+            replies = await asyncio.gather(*(
+                handler.generate_response_async(f"s{index}", f"Question from s{index}") for index in range(4)))
+            return handler, replies, time.monotonic() - started
+
+    handler, replies, elapsed = run(main())
+    # Four requests of 0.3 s each overlapped
+    assert elapsed < 0.9
+    assert [reply for reply, _ in replies] == [DEFAULT_REPLY] * 4
+    for index in range(4):
+        assert contents(handler, f"s{index}") == [("user", f"Question from s{index}"), ("assistant", DEFAULT_REPLY)]
+
+
+def test_turns_of_one_session_run_in_order(server):
+    async def main():
+        async with handler_for(server) as handler:
+            started = time.monotonic()
+            await asyncio.gather(handler.generate_response_async("s", "first"),
+                                 handler.generate_response_async("s", "second"))
+            return handler, time.monotonic() - started
+
+    handler, elapsed = run(main())
+    # The second turn waited for the first to finish
+    assert elapsed >= 0.6
+    assert contents(handler, "s") == [("user", "first"), ("assistant", DEFAULT_REPLY),
+                                      ("user", "second"), ("assistant", DEFAULT_REPLY)]
+
+
+def test_streaming_turn(server):
+    async def main():
+        async with handler_for(server) as handler:
+            deltas = [delta async for delta in handler.generate_response_stream_async("s", "Hello")]
+            return handler, deltas
+
+    handler, deltas = run(main())
+    assert len(deltas) > 1
+    assert "".join(deltas) == DEFAULT_REPLY
+    assert contents(handler, "s") == [("user", "Hello"), ("assistant", DEFAULT_REPLY)]
+
+
+def test_wait_finished_async(server):
+    async def main():
+        async with handler_for(server, finish_check="llm") as handler:
+            await handler.generate_response_async("llm", "Hello")
+            llm = await handler.wait_finished_async("llm", timeout=5)
+        async with handler_for(server, finish_check="local") as handler:
+            await handler.generate_response_async("done", "Thanks, that's all")
+            await handler.generate_response_async("open", "My printer is broken")
+            done = await handler.wait_finished_async("done", timeout=5)
+            still_open = await handler.wait_finished_async("open", timeout=5)
+            unknown = await handler.wait_finished_async("unknown")
+        return llm, done, still_open, unknown
+
+    # The mock answers the model's finish check with "no"
+    assert run(main()) == (False, True, False, False)
+
+
+def test_failed_streams_give_their_connection_back(server):
+    async def main():
+        async with handler_for(server, max_connections=1, retries=1) as handler:
+            server.rate_limit = 1.0
+            for _ in range(3):
+                with pytest.raises(Exception, match="Failed after 1 attempts"):
+                    async for _ in handler.generate_response_stream_async("s", "Hello"):
+                        pass
+            server.rate_limit = 0.0
+            # With a leaked connection the only one in the pool would never come back
+            deltas = await asyncio.wait_for(
+                _collect(handler.generate_response_stream_async("t", "Hello")), timeout=5)
+            return "".join(deltas)
+
+    assert run(main()) == DEFAULT_REPLY
+
+
+async def _collect(stream):
+    return [delta async for delta in stream]
+
+
+class RecordingStore(PersistentSessionStore):
+    """A PersistentSessionStore that notes which threads touched the database."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = set()
+
+    def __contains__(self, session_id):
+        self.threads.add(threading.current_thread())
+        return super().__contains__(session_id)
+
+    def load(self, session_id):
+        self.threads.add(threading.current_thread())
+        return super().load(session_id)
+
+    def save(self, session_id, state):
+        self.threads.add(threading.current_thread())
+        super().save(session_id, state)
+
+    def drop(self, session_id):
+        self.threads.add(threading.current_thread())
+        super().drop(session_id)
+
+
+def test_reset_waits_for_the_turn_in_flight(server):
+    async def main():
+        async with handler_for(server) as handler:
+            turn = asyncio.ensure_future(handler.generate_response_async("s", "Hello"))
+            await asyncio.sleep(0.05)
+            await handler.reset_session("s")
+            assert turn.done()
+            return handler
+
+    handler = run(main())
+    assert contents(handler, "s") == []
+
+
+def test_session_management_keeps_sqlite_off_the_event_loop(server, tmp_path):
+    store = RecordingStore(str(tmp_path / "sessions.db"))
+
+    async def main():
+        async with handler_for(server, session_store=store) as handler:
+            await handler.generate_response_async("s", "Hello")
+            store.sessions.clear()
+            await handler.reset_session("s")
+            await handler.reset_session("missing")
+            await handler.generate_response_async("t", "Hello")
+            await handler.end_session("t")
+            await handler.end_session("missing")
+            return threading.current_thread()
+
+    loop_thread = run(main())
+    assert store.threads and loop_thread not in store.threads
+    assert "s" in store and len(store.load("s").conversation_history) == 0
+    assert "t" not in store and "missing" not in store
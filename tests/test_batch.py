@@ -0,0 +1,87 @@
+import json
+import threading
+
+import pytest
+
+from chatbot.batch import BatchRunner, Conversation, completed_ids, open_output, read_conversations
+
+
+class FakeHandler:
+    def __init__(self, fail=(), gates=None):
+        self.fail = set(fail)
+        # Prompt -> event the turn waits for
+        self.gates = gates or {}
+        self.resets = 0
+        self.answered = []
+
+    def reset_conversation(self):
+        self.resets += 1
+
+    def generate_response(self, prompt):
+        if prompt in self.gates:
+            self.gates[prompt].wait(timeout=5)
+        if prompt in self.fail:
+            raise RuntimeError(f"failed on {prompt}")
+        self.answered.append(prompt)
+        return f"answer to {prompt}", False
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_results_are_the_checkpoint_of_a_resumed_run(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    lines = ['{"id": "a", "prompt": "one"}', "", '{"turns": ["two", "three"]}', '{"id": "c", "prompt": "bad"}']
+    conversations = list(read_conversations(lines))
+    assert [(c.id, c.turns) for c in conversations] == [("a", ["one"]), ("3", ["two", "three"]), ("c", ["bad"])]
+
+    runner = BatchRunner(lambda: FakeHandler(fail={"bad"}), workers=2)
+    with open_output(path) as output:
+        runner.run(conversations, output)
+    assert (runner.completed, runner.failed) == (2, 1)
+    results = {result["id"]: result for result in read_results(path)}
+    assert results["3"]["turns"][1] == {"prompt": "three", "response": "answer to three"}
+    assert results["c"]["error"] == "failed on bad"
+
+    # The failed conversation is run again; the others are skipped
+    skip = completed_ids(path)
+    assert skip == {"a", "3"}
+    runner = BatchRunner(lambda: FakeHandler(), workers=2)
+    with open_output(path) as output:
+        runner.run(conversations, output, skip=skip)
+    assert (runner.completed, runner.skipped) == (1, 2)
+    assert completed_ids(path) == {"a", "3", "c"}
+
+
+def test_a_line_cut_short_is_ended_and_ignored(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "a", "turns": []}\n{"id": "b", "tu', encoding="utf-8")
+    assert completed_ids(str(path)) == {"a"}
+    with open_output(str(path)) as output:
+        output.write('{"id": "c", "turns": []}\n')
+    assert completed_ids(str(path)) == {"a", "c"}
+    assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_interrupted_run_writes_finished_and_running_conversations(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    release_slow = threading.Event()
+    handler = FakeHandler(gates={"slow": release_slow})
+    runner = BatchRunner(lambda: handler, workers=2)
+    finished = []
+
+    def conversations():
+        yield Conversation("fast", ["fast"])
+        yield Conversation("slow", ["slow"])
+        # Wait until the fast one is done and the slow one is running, then press Ctrl+C
+        while "fast" not in handler.answered:
+            threading.Event().wait(0.01)
+        threading.Timer(0.1, release_slow.set).start()
+        raise KeyboardInterrupt
+
+    with open_output(path) as output, pytest.raises(KeyboardInterrupt):
+        runner.run(conversations(), output, on_result=finished.append)
+    assert sorted(result["id"] for result in finished) == ["fast", "slow"]
+    assert completed_ids(path) == {"fast", "slow"}
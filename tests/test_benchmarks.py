@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs a benchmark's main() and reports whether the ASR module was imported before it exited
+RUN_MAIN = """
+import sys
+from benchmarks import {module} as benchmark
+sys.argv = ["benchmark"] + sys.argv[1:]
+try:
+    benchmark.main()
+finally:
+    print("speech_recognizer imported:", "chatbot.speech_recognizer" in sys.modules)
+"""
+
+
+def run_benchmark(module, *args):
+    return subprocess.run([sys.executable, "-c", RUN_MAIN.format(module=module), *args],
+                          cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+
+@pytest.mark.parametrize("module, corpus", [("asr_benchmark", "asr_corpus"),
+                                            ("wake_word_benchmark", "wake_word_corpus")])
+def test_missing_recordings_exit_before_loading_asr(tmp_path, module, corpus):
+    # The shipped corpora hold only the manifests, as on a fresh checkout
+    result = run_benchmark(module, "--vosk-model", str(tmp_path))
+
+    assert result.returncode == 1
+    assert f"recordings missing from {os.path.join(ROOT, 'benchmarks', corpus)}" in result.stderr
+    assert "--record" in result.stderr
+    assert "speech_recognizer imported: False" in result.stdout
+
+
+def test_missing_vosk_model_exits_with_instructions(tmp_path):
+    result = run_benchmark("wake_word_benchmark", "--vosk-model", str(tmp_path / "missing"))
+
+    assert result.returncode == 1
+    assert "Vosk model not found" in result.stderr
+    assert "speech_recognizer imported: False" in result.stdout
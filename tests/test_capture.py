@@ -0,0 +1,111 @@
+import math
+import wave
+from array import array
+
+import pytest
+
+from chatbot.capture import FRAME_MS, SAMPLE_RATE, SAMPLE_WIDTH, EnergyVAD, Segmenter, WebRTCVAD, segment_wav
+
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+# A vowel-like tone (fundamental and one harmonic) that both detectors take for speech
+TONE = array("h", (int(6000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)
+                       + 3000 * math.sin(2 * math.pi * 660 * i / SAMPLE_RATE))
+                   for i in range(FRAME_SAMPLES))).tobytes()
+SILENCE = bytes(FRAME_SAMPLES * SAMPLE_WIDTH)
+
+
+def frames(*parts):
+    """(frame, count) parts as one list of frames."""
+    return [frame for frame, count in parts for _ in range(count)]
+
+
+def write_wav(path, frame_list):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(b"".join(frame_list))
+    return str(path)
+
+
+def feed_all(segmenter, frame_list):
+    """The utterances and the index of the frame that completed each one."""
+    results = []
+    for index, frame in enumerate(frame_list):
+        utterance = segmenter.feed(frame)
+        if utterance is not None:
+            results.append((index, utterance))
+    utterance = segmenter.flush()
+    if utterance is not None:
+        results.append((len(frame_list), utterance))
+    return results
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def speech_started(self, sample_rate):
+        self.events.append(("started", sample_rate))
+
+    def speech_frame(self, frame):
+        self.events.append(("frame", frame))
+
+    def speech_ended(self, utterance):
+        self.events.append(("ended", utterance))
+
+
+def test_energy_vad_boundaries_pre_roll_and_hangover():
+    # 20 silent frames, 30 voiced, 40 silent
+    results = feed_all(Segmenter(EnergyVAD()), frames((SILENCE, 20), (TONE, 30), (SILENCE, 40)))
+    assert len(results) == 1
+    index, utterance = results[0]
+    # Speech starts once 6 of the 10 pre-roll frames are voiced; the pre-roll keeps the 4 silent ones before
+    assert utterance.started_at == pytest.approx(16 * FRAME_MS / 1000)
+    assert utterance.audio[:4 * len(SILENCE)] == SILENCE * 4
+    assert utterance.audio[4 * len(SILENCE):] == TONE * 30
+    # Trailing silence is dropped, but the utterance only ends after 700 ms of it (23 frames)
+    assert utterance.ended_at == pytest.approx(50 * FRAME_MS / 1000)
+    assert index == 50 + 23 - 1
+
+
+def test_pause_shorter_than_the_hangover_does_not_split_the_utterance():
+    results = feed_all(Segmenter(EnergyVAD()),
+                       frames((SILENCE, 10), (TONE, 20), (SILENCE, 15), (TONE, 20), (SILENCE, 30)))
+    assert len(results) == 1
+    assert results[0][1].duration == pytest.approx((4 + 20 + 15 + 20) * FRAME_MS / 1000)
+
+    results = feed_all(Segmenter(EnergyVAD(), end_silence_ms=300),
+                       frames((SILENCE, 10), (TONE, 20), (SILENCE, 15), (TONE, 20), (SILENCE, 30)))
+    assert len(results) == 2
+
+
+def test_short_blips_are_dropped_and_long_speech_is_cut():
+    assert feed_all(Segmenter(EnergyVAD()), frames((SILENCE, 10), (TONE, 7), (SILENCE, 30))) == []
+
+    results = feed_all(Segmenter(EnergyVAD(), max_utterance_s=0.6), frames((SILENCE, 10), (TONE, 50)))
+    assert results[0][1].duration == pytest.approx(0.6)
+
+
+def test_capture_listeners_see_pre_roll_frames_and_the_end(tmp_path):
+    path = write_wav(tmp_path / "speech.wav", frames((SILENCE, 20), (TONE, 30), (SILENCE, 40)))
+    recorder = Recorder()
+    utterances = segment_wav(path, vad=EnergyVAD(), listeners=[recorder])
+    assert len(utterances) == 1
+    assert recorder.events[0] == ("started", SAMPLE_RATE)
+    assert recorder.events[-1] == ("ended", utterances[0])
+    heard = b"".join(frame for kind, frame in recorder.events if kind == "frame")
+    # Every frame of the utterance (pre-roll included), then the hangover
+    assert heard == utterances[0].audio + SILENCE * 23
+
+
+def test_webrtc_vad_segments_the_same_speech(tmp_path):
+    pytest.importorskip("webrtcvad")
+    path = write_wav(tmp_path / "speech.wav",
+                     frames((SILENCE, 20), (TONE, 30), (SILENCE, 40), (TONE, 30), (SILENCE, 40)))
+    utterances = segment_wav(path, vad=WebRTCVAD())
+    assert len(utterances) == 2
+    for utterance, onset, offset in zip(utterances, (0.6, 2.7), (1.5, 3.6)):
+        # The pre-roll reaches back to the onset; the detector's own hangover may keep a few frames after the end
+        assert utterance.started_at <= onset < utterance.started_at + 0.3
+        assert offset <= utterance.ended_at <= offset + 0.3
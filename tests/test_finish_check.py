@@ -0,0 +1,94 @@
+import json
+import threading
+
+import pytest
+
+from chatbot.openai_handler import FINISH_CHECK_PROMPT, OpenAIHandler
+
+
+def handler_with(finish_check, answer_finish_check, **options):
+    """
+    A handler whose replies echo the prompt and whose finish checks are answered
+    by `answer_finish_check(data)`, without a network.
+    """
+    handler = OpenAIHandler(api_key="test", finish_check=finish_check, **options)
+    requests = {"reply": [], "finish": []}
+
+    def make_gpt_request(data):
+        if data["max_tokens"] == 10:
+            requests["finish"].append(data)
+            return {"choices": [{"message": {"role": "assistant", "content": answer_finish_check(data)}}]}
+        requests["reply"].append(data)
+        prompt = data["messages"][-1]["content"]
+        return {"choices": [{"message": {"role": "assistant", "content": f"You said: {prompt}"}}]}
+
+    handler._make_gpt_request = make_gpt_request
+    return handler, requests
+
+
+def test_llm_check_runs_in_the_background_on_the_finished_exchange():
+    notified = []
+    handler, requests = handler_with("llm", lambda data: "Yes.", on_finished=notified.append)
+    response, finished = handler.generate_response("thanks, bye")
+    # Not known yet when the reply is returned
+    assert (response, finished) == ("You said: thanks, bye", False)
+    assert handler.wait_finished(timeout=5) is True
+    assert notified == [True]
+
+    data = requests["finish"][0]
+    assert data["messages"][-1] == FINISH_CHECK_PROMPT
+    assert [m["content"] for m in data["messages"][:-1]] == ["thanks, bye", "You said: thanks, bye"]
+    # The pre-encoded messages are the same request
+    assert json.loads(data.encoded_messages) == data["messages"]
+    # Tools are still offered (same request prefix) but cannot be called
+    assert data["temperature"] == 0.0 and data["tool_choice"] == "none"
+
+
+def test_llm_check_answered_no_is_not_finished():
+    notified = []
+    handler, _ = handler_with("llm", lambda data: "no", on_finished=notified.append)
+    handler.generate_response("what's the weather?")
+    assert handler.finish_future.result(timeout=5) is False
+    assert handler.wait_finished() is False
+    assert notified == []
+
+
+def test_llm_check_failures_and_timeouts_are_not_finished(capsys):
+    def fail(data):
+        raise RuntimeError("connection reset")
+
+    notified = []
+    handler, _ = handler_with("llm", fail, on_finished=notified.append)
+    handler.generate_response("bye")
+    assert handler.wait_finished(timeout=5) is False
+    assert isinstance(handler.finish_future.exception(), RuntimeError)
+    assert "Finish check failed: connection reset" in capsys.readouterr().out
+    assert notified == []
+
+    release = threading.Event()
+    handler, _ = handler_with("llm", lambda data: "yes" if release.wait(timeout=5) else "no")
+    handler.generate_response("bye")
+    assert handler.wait_finished(timeout=0.05) is False
+    release.set()
+    assert handler.wait_finished(timeout=5) is True
+
+
+def test_local_check_matches_closing_remarks_without_a_request():
+    notified = []
+    handler, requests = handler_with("local", lambda data: pytest.fail("no finish request"),
+                                     on_finished=notified.append)
+    assert handler.generate_response("what's the weather?")[1] is False
+    assert handler.generate_response("Okay, thanks, that's all.")[1] is True
+    assert handler.finish_future.result() is True and handler.wait_finished() is True
+    assert notified == [True]
+    assert len(requests["reply"]) == 2 and requests["finish"] == []
+
+
+def test_none_never_finishes():
+    handler, requests = handler_with("none", lambda data: pytest.fail("no finish request"))
+    assert handler.generate_response("goodbye")[1] is False
+    assert handler.wait_finished() is False
+    assert requests["finish"] == []
+
+    with pytest.raises(ValueError):
+        OpenAIHandler(api_key="test", finish_check="sometimes")
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.mock_openai import MockOpenAIServer
+from chatbot.hedging import COMPLETE, STREAM, AttemptTiming, HedgePolicy, run_hedged, run_hedged_async
+from chatbot.openai_handler import OpenAIHandler
+from chatbot.scheduler import RequestScheduler
+
+
+def hedge_policy(**kwargs):
+    options = dict(default_delay=0.2, min_delay=0.05, min_samples=5, budget_ratio=1.0)
+    options.update(kwargs)
+    return HedgePolicy(**options)
+
+
+def record(policy, latency, kind, request_id=0):
+    policy.record(AttemptTiming(request_id, 0, False, 0.0, latency, "won", kind))
+
+
+def test_streaming_and_complete_requests_have_separate_windows():
+    policy = hedge_policy()
+    for _ in range(10):
+        record(policy, 0.1, STREAM)
+        record(policy, 2.0, COMPLETE)
+    assert policy.delay(STREAM) == pytest.approx(0.1)
+    assert policy.delay(COMPLETE) == pytest.approx(2.0)
+
+
+def test_default_delay_until_enough_samples_of_that_kind():
+    policy = hedge_policy(default_delay=0.7)
+    for _ in range(10):
+        record(policy, 0.1, COMPLETE)
+    assert policy.delay(STREAM) == 0.7
+
+
+def test_hedge_wins_when_first_attempt_is_slow():
+    policy = hedge_policy()
+    delays = iter([1.0, 0.01])
+    lock = threading.Lock()
+    discarded = []
+
+    def send():
+        with lock:
+            delay = next(delays)
+        time.sleep(delay)
+        return delay
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        started = time.monotonic()
+        assert run_hedged(send, policy, executor, on_discard=discarded.append, kind=STREAM) == 0.01
+        assert time.monotonic() - started < 0.8
+    assert policy.stats()["hedges"] == 1
+    assert policy.hedge_wins == 1
+    # The slow attempt ran to completion in the background and was handed back
+    assert discarded == [1.0]
+    assert {timing.kind for timing in policy.timings} == {STREAM}
+    assert set(policy.latencies) == {STREAM}
+
+
+def test_hedge_refused_by_admission_is_not_sent():
+    policy = hedge_policy()
+    asked = []
+
+    def admit():
+        asked.append(True)
+        return False
+
+    def send():
+        time.sleep(0.4)
+        return "slow"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert run_hedged(send, policy, executor, admit=admit) == "slow"
+    assert asked == [True]
+    assert policy.stats()["hedges"] == 0 and policy.stats()["hedges_refused"] == 1
+    # The refused hedge does not use up the budget
+    assert policy.try_hedge()
+
+
+def test_no_hedge_when_first_attempt_is_fast():
+    policy = hedge_policy()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert run_hedged(lambda: "reply", policy, executor) == "reply"
+    assert policy.stats()["hedges"] == 0
+
+
+def test_async_hedge_cancels_the_slow_attempt():
+    policy = hedge_policy()
+    delays = iter([1.0, 0.01])
+
+    async def send():
+        delay = next(delays)
+        await asyncio.sleep(delay)
+        return delay
+
+    async def main():
+        started = time.monotonic()
+        result = await run_hedged_async(send, policy, kind=STREAM)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(main())
+    assert result == 0.01
+    assert elapsed < 0.8
+    assert [timing.outcome for timing in policy.timings] == ["won", "cancelled"]
+
+
+@pytest.fixture
+def slow_first_server():
+    # The first request is slow; the hedge sent after the default delay is answered right away
+    with MockOpenAIServer(jitter=0.0, latency=0.01, tokens_per_second=1000, function_trigger=None,
+                          delays=[1.5]) as server:
+        yield server
+
+
+def handler_for(server, policy):
+    return OpenAIHandler(api_key="test", model="gpt-4o-mini", api_url=server.url, finish_check="none",
+                         hedge_policy=policy, timeout=5)
+
+
+def test_handler_hedges_slow_complete_request(slow_first_server):
+    policy = hedge_policy()
+    handler = handler_for(slow_first_server, policy)
+    started = time.monotonic()
+    reply, _ = handler.generate_response("hello")
+    assert time.monotonic() - started < 1.2
+    assert reply.startswith("Sure")
+    assert slow_first_server.stats()["requests"] == 2
+    assert policy.hedge_wins == 1
+    assert {timing.kind for timing in policy.timings} == {COMPLETE}
+
+
+def test_handler_hedges_slow_stream(slow_first_server):
+    policy = hedge_policy()
+    handler = handler_for(slow_first_server, policy)
+    started = time.monotonic()
+    reply = "".join(handler.generate_response_stream("hello"))
+    assert time.monotonic() - started < 1.2
+    assert reply.startswith("Sure")
+    assert policy.hedge_wins == 1
+    # Stream openings are timed to the response headers and kept apart from complete replies
+    assert {timing.kind for timing in policy.timings} == {STREAM}
+    assert STREAM in policy.latencies and COMPLETE not in policy.latencies
+
+
+def test_handler_hedges_only_within_the_schedulers_limits(slow_first_server):
+    policy = hedge_policy()
+    # Room for the first attempt only
+    scheduler = RequestScheduler(requests_per_minute=1)
+    handler = OpenAIHandler(api_key="test", model="gpt-4o-mini", api_url=slow_first_server.url, finish_check="none",
+                            hedge_policy=policy, scheduler=scheduler, timeout=5)
+    reply, _ = handler.generate_response("hello")
+    assert reply.startswith("Sure")
+    assert slow_first_server.stats()["requests"] == 1
+    assert policy.refused == 1 and scheduler.admitted == 1
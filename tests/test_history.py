@@ -0,0 +1,136 @@
+import json
+
+from chatbot.history import MESSAGE_TOKEN_OVERHEAD, ConversationHistory, approximate_token_count
+
+
+def words(count):
+    """A message of `count` tokens with the one-token-per-word tokenizer below."""
+    return " ".join(["word"] * (count - MESSAGE_TOKEN_OVERHEAD))
+
+
+def tokenizer(text):
+    return len(text.split())
+
+
+def turn(history, question_tokens=10, answer_tokens=10):
+    history.append({"role": "user", "content": words(question_tokens)})
+    history.append({"role": "assistant", "content": words(answer_tokens)})
+    history.trim()
+
+
+def test_approximate_token_count():
+    assert approximate_token_count("") == 0
+    assert approximate_token_count("Hello, world!") == 4
+    assert approximate_token_count("x" * 40) == 10
+
+
+def test_oldest_whole_turns_are_evicted_to_fit_the_budget():
+    history = ConversationHistory(max_tokens=30, tokenizer=tokenizer)
+    for _ in range(3):
+        history.append({"role": "user", "content": words(10)})
+        history.append({"role": "assistant", "content": None,
+                        "function_call": {"name": "Lookup", "arguments": "{}"}})
+        history.append({"role": "function", "name": "Lookup", "content": words(6)})
+        history.trim()
+    # Only the last turn fits; its function call exchange was kept with it
+    assert [message["role"] for message in history] == ["user", "assistant", "function"]
+    assert history.total_tokens <= 30
+    assert history.first_seq == 6
+
+
+def test_message_budget():
+    history = ConversationHistory(max_tokens=10 ** 6, max_messages=4, tokenizer=tokenizer)
+    for _ in range(5):
+        turn(history)
+    assert len(history) == 4
+    assert history.next_seq == 10
+
+
+def test_summary_is_regenerated_once_enough_text_was_evicted():
+    calls = []
+
+    def summarizer(summary, messages):
+        calls.append((summary, len(messages)))
+        return f"summary {len(calls)}"
+
+    history = ConversationHistory(max_tokens=39, tokenizer=tokenizer, summarizer=summarizer,
+                                  summary_threshold_tokens=35)
+    turn(history)
+    turn(history)
+    # One turn (20 tokens) evicted: below the threshold, kept for the next summary
+    assert calls == [] and history.unsummarized_tokens == 20
+    turn(history)
+    assert calls == [(None, 4)]
+    assert history.summary == "summary 1"
+    assert history.to_messages()[0]["content"].endswith("summary 1")
+    # The summary counts against the budget
+    assert history.payload_tokens <= 39
+
+
+def test_failed_summary_keeps_the_previous_one():
+    def summarizer(summary, messages):
+        raise RuntimeError("offline")
+
+    history = ConversationHistory(max_tokens=20, tokenizer=tokenizer, summarizer=summarizer,
+                                  summary_threshold_tokens=1)
+    history.apply_summary("earlier")
+    turn(history)
+    turn(history)
+    assert history.summary == "earlier"
+    assert history.unsummarized == []
+
+
+def test_deferred_summary_is_left_to_the_owner():
+    history = ConversationHistory(max_tokens=20, tokenizer=tokenizer, summary_threshold_tokens=1,
+                                  defer_summary=True)
+    turn(history)
+    turn(history)
+    assert history.needs_summary and history.summary is None
+    history.apply_summary("done elsewhere")
+    assert not history.needs_summary
+    assert history.to_messages()[0]["role"] == "system"
+
+
+def test_clear_keeps_counting_sequence_numbers():
+    history = ConversationHistory(tokenizer=tokenizer)
+    turn(history)
+    history.clear()
+    assert len(history) == 0 and history.first_seq == 2
+    assert json.loads(history.encoded_messages()) == []
+
+
+def check(history):
+    assert json.loads(history.encoded_messages()) == history.to_messages()
+
+
+def test_encoded_messages_follow_appends_evictions_and_summaries():
+    history = ConversationHistory(max_tokens=10 ** 6, max_messages=6, defer_summary=True)
+    check(history)
+    for index in range(20):
+        history.append({"role": "user", "content": f"Question {index} with \"quotes\" and ünïcode"})
+        check(history)
+        history.append({"role": "assistant", "content": f"Answer {index}"})
+        history.trim()
+        check(history)
+        if index == 5:
+            history.apply_summary("Earlier questions.")
+            check(history)
+    history.clear()
+    check(history)
+    history.apply_summary("Only a summary.")
+    check(history)
+
+
+def test_encoded_messages_after_restore():
+    history = ConversationHistory(max_messages=4)
+    for index in range(6):
+        history.append({"role": "user", "content": f"Question {index}"})
+        history.trim()
+    rows = [(history.first_seq + i, tokens, encoded)
+            for i, (tokens, encoded) in enumerate(zip(history.token_counts, history.encoded))]
+    restored = ConversationHistory(max_messages=4)
+    restored.restore(history.first_seq, rows, "A summary.")
+    check(restored)
+    restored.append({"role": "assistant", "content": "More"})
+    restored.trim()
+    check(restored)
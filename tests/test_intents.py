@@ -0,0 +1,98 @@
+from chatbot.intents import AssistantContext, Intent, IntentRouter, default_router, normalize
+from chatbot.openai_handler import OpenAIHandler
+
+
+class FakeTTS:
+    def __init__(self):
+        self.volume = 0.5
+        self.rate = 150
+        self.cancelled = 0
+
+    def cancel(self):
+        self.cancelled += 1
+
+    def configure(self, volume=None, rate=None):
+        if volume is not None:
+            self.volume = volume
+        if rate is not None:
+            self.rate = rate
+
+
+def test_normalize_drops_fillers_contractions_and_punctuation():
+    assert normalize("Hey, could you please tell me what's the time, please?") == "what is the time"
+    assert normalize("OK… New chat!") == "new chat"
+
+
+def test_exact_matches_and_slots():
+    router = default_router()
+    assert router.match("What time is it?").name == "time"
+    assert router.match("set the volume to 80%").slots == {"level": "80"}
+    assert router.match("turn it down").slots == {"down": "turn it down"}
+    match = router.match("Never mind.")
+    assert (match.name, match.fuzzy) == ("stop", False)
+    assert router.match("bye").name == "exit"
+
+
+def test_fuzzy_matches_recover_near_misses():
+    router = default_router()
+    for text, name in [("stop talkin", "stop"), ("new conversations", "reset"), ("wat time is it", "time"),
+                       ("say that agian", "repeat"), ("speek slower", "rate")]:
+        match = router.match(text)
+        assert match is not None and (match.name, match.fuzzy) == (name, True), text
+
+
+def test_questions_that_only_resemble_an_intent_go_to_the_model():
+    router = default_router()
+    for text in ["what time does the store open", "stop the printer from jamming", "how do I cancel my order",
+                 "what is the date of the next release", "say hello to my team", "volume of a sphere",
+                 "what time is it in tokyo right now and what is the weather like there"]:
+        assert router.match(text) is None, text
+    assert router.match("...") is None
+
+
+def test_custom_intents_replace_defaults_and_keep_their_own_slots():
+    router = default_router()
+    router.register(Intent("time", [r"clock"], lambda match, context: "tick"))
+    assert [intent.name for intent in router.intents].count("time") == 1
+    assert router.handle("clock") == "tick"
+
+    @router.intent("weather", [r"weather in (?P<city>\w+)"], examples=["weather in paris"])
+    def weather(match, context):
+        return f"Sunny in {match.slots['city']}"
+
+    assert router.handle("weather in oslo") == "Sunny in oslo"
+    # A fuzzy match takes the slots of the example it matched
+    assert router.handle("wether in paris") == "Sunny in paris"
+
+
+def test_handlers_act_on_the_context():
+    tts = FakeTTS()
+    context = AssistantContext(tts=tts)
+    router = default_router()
+    assert router.handle("volume up", context) == "Volume set to 60 percent."
+    assert router.handle("stop talking", context) == "" and tts.cancelled == 1
+    assert router.handle("repeat that", context) == "I haven't said anything yet."
+    context.last_answer = "Forty two."
+    assert router.handle("what did you say", context) == "Forty two."
+    assert router.handle("quit", context) == "" and context.should_exit
+
+
+def test_a_tool_flow_waiting_for_an_answer_takes_precedence_over_stop_and_exit():
+    chatbot = OpenAIHandler(api_key="test", finish_check="none")
+    context = AssistantContext(chatbot, FakeTTS())
+    router = default_router()
+    chatbot.pending_function_calls = {"OpenTicket": {"args": {"name": "Ann"}, "missing_fields": ["issue"]}}
+    assert context.in_tool_flow
+    for text in ["cancel", "never mind", "bye", "stop"]:
+        assert router.handle(text, context) is None, text
+    assert not context.should_exit and context.tts.cancelled == 0
+    # Other local requests are still answered mid-flow
+    assert router.handle("what time is it", context).startswith("The current time is")
+
+    chatbot.pending_function_calls = {}
+    chatbot.confirmation_steps = {"OpenTicket": {"args": {}, "awaiting_confirmation": True}}
+    assert router.handle("goodbye", context) is None
+
+    chatbot.reset_conversation()
+    assert not context.in_tool_flow
+    assert router.handle("goodbye", context) == "" and context.should_exit
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+
+import pytest
+
+from chatbot.response_cache import ResponseCache, normalize_text
+
+REPLY = {"role": "assistant", "content": "We open at nine."}
+
+
+def request(question, **options):
+    data = {"model": "gpt-4o-mini", "temperature": 0, "max_tokens": 100,
+            "messages": [{"role": "system", "content": "Be brief."}, {"role": "user", "content": question}]}
+    data.update(options)
+    return data
+
+
+def test_normalize_text_keeps_emails_and_decimals():
+    assert normalize_text("  What are your HOURS?!  ") == "what are your hours"
+    assert normalize_text("Mail bob@example.com about v1.5.") == "mail bob@example.com about v1.5"
+
+
+def test_exact_and_normalized_hits():
+    cache = ResponseCache()
+    assert cache.get(request("What are your hours?")) is None
+    cache.put(request("What are your hours?"), REPLY)
+    assert cache.get(request("What are your hours?")) == REPLY
+    assert cache.get(request("what are your hours")) == REPLY
+    assert cache.get(request("What are your prices?")) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_model_and_output_budget_are_part_of_the_key():
+    cache = ResponseCache()
+    cache.put(request("Hi"), REPLY)
+    assert cache.get(request("Hi", model="gpt-4o")) is None
+    assert cache.get(request("Hi", max_tokens=50)) is None
+
+
+def test_sampled_requests_bypass_the_cache_by_default():
+    cache = ResponseCache()
+    cache.put(request("Hi", temperature=0.7), REPLY)
+    assert cache.get(request("Hi", temperature=0.7)) is None
+    assert cache.bypassed == 1
+    cache = ResponseCache(temperature_policy="cache")
+    cache.put(request("Hi", temperature=0.7), REPLY)
+    assert cache.get(request("Hi", temperature=0.7)) == REPLY
+
+
+def test_function_calls_are_never_cached():
+    call = {"role": "assistant", "content": None, "function_call": {"name": "CreateTicket", "arguments": "{}"}}
+    tool = {"role": "assistant", "content": "Checking.", "tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": "Weather", "arguments": "{}"}}]}
+    cache = ResponseCache(temperature_policy="cache")
+    cache.put(request("I need a ticket"), call)
+    cache.put(request("What's the weather?"), tool)
+    assert cache.get(request("I need a ticket")) is None
+    assert cache.get(request("What's the weather?")) is None
+    assert len(cache.entries) == 0
+
+
+def test_stored_function_calls_are_not_replayed(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path)
+    cache.put(request("What's the weather?"), REPLY)
+    # A database written when function calls could still be cached
+    cache.db.execute("UPDATE responses SET message = ?", (json.dumps(
+        {"role": "assistant", "content": None, "function_call": {"name": "Weather", "arguments": "{}"}}),))
+    cache.db.commit()
+    cache.close()
+    cache = ResponseCache(path=path)
+    assert cache.get(request("What's the weather?")) is None
+    cache.close()
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        ResponseCache(temperature_policy="sometimes")
+
+
+def test_entries_expire_and_are_evicted_least_recently_used_first():
+    cache = ResponseCache(ttl=0.05)
+    cache.put(request("Hi"), REPLY)
+    time.sleep(0.1)
+    assert cache.get(request("Hi")) is None
+
+    cache = ResponseCache(max_entries=4)
+    for question in ("one", "two", "three"):
+        # Each reply takes two entries: the exact and the normalized key
+        cache.put(request(question), REPLY)
+    assert cache.get(request("one")) is None
+    assert cache.get(request("three")) == REPLY
+    assert cache.evictions == 2
+
+
+def test_sqlite_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path)
+    cache.put(request("What are your hours?"), REPLY)
+    cache.close()
+    cache = ResponseCache(path=path)
+    assert cache.get(request("What are your hours?")) == REPLY
+    assert cache.disk_hits == 1
+    cache.close()
+
+
+def test_tool_calls_in_the_context_are_part_of_the_key():
+    def after_call(city):
+        data = request("What's the weather?")
+        data["messages"] += [
+            {"role": "assistant", "content": None, "tool_calls": [
+                {"id": "call_1", "type": "function", "function": {"name": "Weather", "arguments": f'{{"city": "{city}"}}'}}]},
+            {"role": "tool", "tool_call_id": "call_1", "content": "Sunny"},
+        ]
+        return data
+
+    cache = ResponseCache()
+    cache.put(after_call("Oslo"), {"role": "assistant", "content": "It is sunny in Oslo."})
+    assert cache.get(after_call("Oslo"))["content"] == "It is sunny in Oslo."
+    assert cache.get(after_call("Paris")) is None
+
+
+def test_counters_are_exact_under_concurrency():
+    cache = ResponseCache()
+    cache.put(request("Hi"), REPLY)
+
+    def lookups():
+        for _ in range(500):
+            cache.get(request("Hi"))
+            cache.get(request("Bye"))
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()["hits"] == 4000
+    assert cache.stats()["misses"] == 4000
@@ -0,0 +1,88 @@
+import pytest
+
+from chatbot.openai_handler import OpenAIHandler
+from chatbot.routing import RouteTier, RoutingPolicy, default_routing_policy
+from chatbot.tools import ToolRegistry
+
+
+def policy(**options):
+    return RoutingPolicy({
+        "brief": RouteTier("fast", 60, 1.0),
+        "tool": RouteTier("fast", 150, 1.5),
+        "standard": RouteTier("main", 300, 2.5, fallback="tool"),
+        "complex": RouteTier("main", 600, 5.0, fallback="standard"),
+    }, **options)
+
+
+def test_turns_are_classified_locally():
+    routing = policy()
+    assert routing.classify("Thanks!") == "brief"
+    assert routing.classify("ok, great, thank you.") == "brief"
+    assert routing.classify("hello there, can you book me a room for two nights") == "standard"
+    assert routing.classify("What are your opening hours?") == "standard"
+    assert routing.classify("Why does my laptop keep crashing?") == "complex"
+    assert routing.classify("how do I set up the vpn") == "complex"
+    assert routing.classify(" ".join(["word"] * 30)) == "complex"
+    # Tool results go back on the tool route whatever the user said
+    assert routing.classify("Thanks!", tool_round=True) == "tool"
+
+
+def test_each_class_gets_its_tier_model_and_budget():
+    routing = default_routing_policy(model="big", fast_model="small", max_tokens=200)
+    assert routing.route("yes") == ("brief", "small", 60)
+    assert routing.route("what is on the menu today", tool_round=True) == ("tool", "small", 150)
+    assert routing.route("what is on the menu today") == ("standard", "big", 200)
+    assert routing.route("explain the difference between the plans") == ("complex", "big", 400)
+    with pytest.raises(ValueError):
+        RoutingPolicy({"brief": RouteTier("small", 60, 1.0)})
+
+
+def test_slow_route_falls_back_and_is_still_probed():
+    routing = policy(min_samples=5, probe_every=4)
+    for _ in range(5):
+        routing.record("complex", 9.0)
+    names = [routing.route("why is it broken").name for _ in range(8)]
+    # Every 4th complex turn probes the slow route; the others take its fallback
+    assert names == ["standard", "standard", "standard", "complex"] * 2
+    stats = routing.stats()["complex"]
+    assert (stats["requests"], stats["fallbacks"], stats["samples"]) == (8, 6, 5)
+    assert stats["p50"] == 9.0 and stats["first_token_p50"] is None
+
+    # Fallbacks chain while each step misses its own target
+    for _ in range(5):
+        routing.record("standard", 3.0)
+    assert routing.route("why is it broken").name == "tool"
+
+    # A route back under its target is used again
+    for _ in range(200):
+        routing.record("complex", 1.0)
+    assert routing.route("why is it broken").name == "complex"
+
+
+def test_handler_sends_each_turn_on_its_route():
+    registry = ToolRegistry()
+
+    @registry.tool()
+    def Menu() -> str:
+        return "Soup of the day"
+
+    replies = [
+        {"role": "assistant", "content": "You're welcome."},
+        {"role": "assistant", "content": None,
+         "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "Menu", "arguments": "{}"}}]},
+        {"role": "assistant", "content": "Today there is soup."},
+    ]
+    handler = OpenAIHandler(api_key="test", finish_check="none", tools=registry,
+                            routing_policy=default_routing_policy(model="big", fast_model="small", max_tokens=200))
+    sent = []
+
+    def make_gpt_request(data):
+        sent.append((data["model"], data["max_tokens"]))
+        return {"choices": [{"message": replies.pop(0)}]}
+
+    handler._make_gpt_request = make_gpt_request
+    assert handler.generate_response("thanks")[0] == "You're welcome."
+    assert handler.generate_response("what is on the menu today")[0] == "Today there is soup."
+    assert sent == [("small", 60), ("big", 200), ("small", 150)]
+    stats = handler.routing_policy.stats()
+    assert (stats["brief"]["samples"], stats["standard"]["samples"], stats["tool"]["samples"]) == (1, 1, 1)
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from chatbot.scheduler import (PRIORITY_BATCH, PRIORITY_INTERACTIVE, CircuitBreaker, CircuitOpenError,
+                               RequestScheduler, TokenBucket, backoff_delay, estimate_request_tokens,
+                               parse_retry_after)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert parse_retry_after({"Retry-After": "2"}) == 2.0
+    assert parse_retry_after({"retry-after-ms": "soon", "Retry-After": "3"}) == 3.0
+    assert parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert parse_retry_after({}) is None
+    assert parse_retry_after(None) is None
+
+
+def test_backoff_honors_the_server_hint():
+    assert 2.0 <= backoff_delay(0, retry_after=2.0) <= 3.0
+    assert 0.0 <= backoff_delay(3) <= 8.0
+    assert backoff_delay(10, retry_after=100.0, max_delay=5.0) <= 6.0
+
+
+def test_estimate_request_tokens_counts_the_output_budget():
+    data = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}
+    assert estimate_request_tokens(data) == 100 + 4 + 100
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(10, period=1.0)
+    now = bucket.updated
+    assert bucket.wait_time(10, now) == 0.0
+    bucket.consume(10)
+    assert bucket.wait_time(5, now) == pytest.approx(0.5)
+    # Larger than the whole bucket: admitted once it is full
+    assert bucket.wait_time(50, now + 1.0) == 0.0
+
+
+def test_circuit_breaker_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_rejects_requests():
+    scheduler = RequestScheduler(failure_threshold=1, reset_timeout=60)
+    scheduler.acquire()
+    scheduler.record_failure(status_code=503)
+    with pytest.raises(CircuitOpenError):
+        scheduler.acquire()
+    assert scheduler.stats()["rejected"] == 1
+    assert scheduler.stats()["queued"] == 0
+
+
+def test_rate_limit_pauses_admission_without_opening_the_circuit():
+    scheduler = RequestScheduler(failure_threshold=1)
+    scheduler.acquire()
+    scheduler.record_failure(status_code=429, retry_after=0.2)
+    started = time.monotonic()
+    scheduler.acquire()
+    assert time.monotonic() - started >= 0.15
+    assert scheduler.stats()["circuit"] == "closed"
+    assert scheduler.throttled == 1
+
+
+def test_interactive_requests_go_ahead_of_batch_work():
+    scheduler = RequestScheduler(requests_per_minute=60)
+    # Empty the bucket: the next request waits about a second
+    for _ in range(60):
+        scheduler.request_bucket.consume(1)
+    order = []
+
+    def worker(name, priority):
+        scheduler.acquire(priority=priority)
+        order.append(name)
+
+    batch = threading.Thread(target=worker, args=("batch", PRIORITY_BATCH))
+    batch.start()
+    time.sleep(0.1)
+    interactive = threading.Thread(target=worker, args=("interactive", PRIORITY_INTERACTIVE))
+    interactive.start()
+    batch.join(5)
+    interactive.join(5)
+    assert order == ["interactive", "batch"]
+
+
+def test_usage_corrects_the_token_estimate():
+    scheduler = RequestScheduler(tokens_per_minute=1000)
+    scheduler.acquire(estimated_tokens=400)
+    scheduler.record_success(estimated_tokens=400, used_tokens=100)
+    assert scheduler.token_bucket.tokens == pytest.approx(900, abs=5)
+    assert scheduler.stats()["completed"] == 1
+
+
+def test_try_acquire_never_waits_or_jumps_the_queue():
+    scheduler = RequestScheduler(requests_per_minute=60, tokens_per_minute=1000)
+    assert scheduler.try_acquire(estimated_tokens=100)
+    assert scheduler.token_bucket.tokens == pytest.approx(900, abs=5)
+    assert not scheduler.try_acquire(estimated_tokens=950)
+    for _ in range(59):
+        scheduler.request_bucket.consume(1)
+    started = time.monotonic()
+    assert not scheduler.try_acquire()
+    assert time.monotonic() - started < 0.05
+    assert scheduler.stats()["queued"] == 0 and scheduler.admitted == 1
+
+    # A request already waiting goes first, even once there is room
+    scheduler.request_bucket.refund(10)
+    waiter = scheduler._enqueue(PRIORITY_INTERACTIVE)
+    assert not scheduler.try_acquire()
+    assert scheduler.queue == [waiter]
+
+
+def test_try_acquire_is_refused_while_the_circuit_is_open():
+    scheduler = RequestScheduler(failure_threshold=1, reset_timeout=60)
+    scheduler.acquire()
+    scheduler.record_failure(status_code=503)
+    assert not scheduler.try_acquire()
+    assert scheduler.stats()["queued"] == 0
@@ -0,0 +1,96 @@
+import time
+
+from chatbot.history import ConversationHistory
+from chatbot.session import ConversationState, PersistentSessionStore, SessionStore
+
+
+def new_state():
+    return ConversationState(ConversationHistory(max_tokens=60, max_messages=6, summary_threshold_tokens=10,
+                                                 defer_summary=True))
+
+
+def talk(state, *turns):
+    for question, answer in turns:
+        state.conversation_history.append({"role": "user", "content": question})
+        state.conversation_history.append({"role": "assistant", "content": answer})
+        state.conversation_history.trim()
+
+
+def test_memory_store_creates_and_evicts_sessions():
+    store = SessionStore(new_state)
+    state = store.get("a")
+    assert store.get("a") is state
+    store.get("b")
+    state.last_used = time.monotonic() - 60
+    assert store.evict_idle(30) == 1
+    assert "a" not in store and "b" in store
+    # An evicted in-memory session starts over
+    assert len(store.get("a").conversation_history) == 0
+
+
+def test_add_keeps_the_session_registered_first():
+    store = SessionStore(new_state)
+    first = store.add("a", store.load("a"))
+    assert store.add("a", store.load("a")) is first
+
+
+def test_persistent_store_round_trip(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = PersistentSessionStore(path, new_state)
+    state = store.get("a")
+    talk(state, ("My printer is broken", "Sorry to hear that."))
+    state.pending_function_calls = {"CreateTicket": {"name": "Bob"}}
+    store.save("a", state)
+    talk(state, ("It is the office printer", "Thanks, noted."))
+    store.close()
+
+    store = PersistentSessionStore(path, new_state)
+    assert "a" in store and "missing" not in store
+    loaded = store.get("a")
+    assert list(loaded.conversation_history) == list(state.conversation_history)
+    assert loaded.conversation_history.next_seq == state.conversation_history.next_seq
+    assert loaded.pending_function_calls == {"CreateTicket": {"name": "Bob"}}
+    # Messages are stored as the history encoded them
+    assert loaded.conversation_history.encoded_messages() == state.conversation_history.encoded_messages()
+    store.close()
+
+
+def test_evicted_messages_and_summary_are_restored(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = PersistentSessionStore(path, new_state)
+    state = store.get("a")
+    talk(state, *[(f"Question number {i}", f"Answer number {i}") for i in range(6)])
+    history = state.conversation_history
+    assert history.first_seq > 0 and history.needs_summary
+    store.save("a", state)
+    history.apply_summary("They asked numbered questions.")
+    talk(state, ("Last question", "Last answer"))
+    store.save("a", state)
+
+    loaded = PersistentSessionStore(path, new_state).get("a")
+    assert loaded.conversation_history.summary == "They asked numbered questions."
+    assert list(loaded.conversation_history) == list(history)
+    assert loaded.conversation_history.first_seq == history.first_seq
+    store.close()
+
+
+def test_evict_idle_saves_and_reloads(tmp_path):
+    store = PersistentSessionStore(str(tmp_path / "sessions.db"), new_state)
+    state = store.get("a")
+    talk(state, ("Hello", "Hi, how can I help?"))
+    state.last_used = time.monotonic() - 60
+    assert store.evict_idle(30) == 1
+    assert "a" not in store.sessions and "a" in store
+    reloaded = store.get("a")
+    assert reloaded is not state
+    assert list(reloaded.conversation_history) == list(state.conversation_history)
+    store.close()
+
+
+def test_drop_deletes_the_stored_session(tmp_path):
+    store = PersistentSessionStore(str(tmp_path / "sessions.db"), new_state)
+    talk(store.get("a"), ("Hello", "Hi"))
+    store.save("a", store.get("a"))
+    store.drop("a")
+    assert "a" not in store
+    store.close()
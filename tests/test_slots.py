@@ -0,0 +1,81 @@
+import pytest
+
+from chatbot.slots import SlotFiller, is_valid_email, normalize_email, normalize_phone
+
+FIELDS = ["name", "email", "contact_number", "issue"]
+
+
+@pytest.fixture
+def filler():
+    return SlotFiller(FIELDS)
+
+
+def test_all_fields_in_one_utterance(filler):
+    text = ("My name is John Smith, my email is john dot smith at example dot com, "
+            "my number is 555 123 4567 and my printer is not working.")
+    assert filler.extract(text) == {"name": "John Smith", "email": "john.smith@example.com",
+                                    "contact_number": "5551234567", "issue": "my printer is not working"}
+
+
+@pytest.mark.parametrize("text, email", [
+    ("john dot smith at example dot com", "john.smith@example.com"),
+    ("email me at john.smith@example.com", "john.smith@example.com"),
+    ("email me at john at gmail dot com", "john@gmail.com"),
+    ("my email is jon_doe@mail.example.co.uk.", "jon_doe@mail.example.co.uk"),
+    ("john dot smith that example dot com", "john.smith@example.com"),
+    ("jsmith42 that example dot com", "jsmith42@example.com"),
+    ("jon at gmail dot com, sorry, jon at example dot com", "jon@example.com"),
+])
+def test_emails(filler, text, email):
+    assert filler.extract(text)["email"] == email
+
+
+@pytest.mark.parametrize("text", [
+    "I was in the office that day dot com",
+    "we met at noon",
+    "I'm at home.",
+])
+def test_not_emails(filler, text):
+    assert "email" not in filler.extract(text)
+
+
+@pytest.mark.parametrize("text, name", [
+    ("Hi, I'm Bob.", "Bob"),
+    ("My name is Mary O'Brien.", "Mary O'Brien"),
+    ("call me Jean-Luc-", "Jean-Luc"),
+    ("this is Ann and my email is ann at example dot com", "Ann"),
+])
+def test_names(filler, text, name):
+    assert filler.extract(text)["name"] == name
+
+
+def test_lowercase_intro_is_not_a_name(filler):
+    assert "name" not in filler.extract("i'm having trouble with my laptop")
+
+
+def test_whole_reply_answers_a_single_free_text_question(filler):
+    assert filler.extract("Bob.", ["name"]) == {"name": "Bob"}
+    assert filler.extract("Sure, the VPN drops every hour", ["issue"]) == {"issue": "the VPN drops every hour"}
+    assert filler.extract("I would rather not give that out right now", ["name"]) == {}
+
+
+@pytest.mark.parametrize("text", ["yes", "No.", "yeah sure", "Okay, thanks!", "that's right"])
+def test_yes_no_replies_do_not_fill_free_text(filler, text):
+    assert filler.extract(text, ["name"]) == {}
+    assert filler.extract(text, ["issue"]) == {}
+
+
+def test_only_schema_fields_are_returned():
+    filler = SlotFiller(["full_name", "problem"])
+    assert filler.extract("My name is Ann, email ann@example.com, the issue is a broken screen") == {
+        "full_name": "Ann", "problem": "a broken screen"}
+
+
+def test_normalizers():
+    assert normalize_email("Ann Dot Lee At Example Dot Org") == "ann.lee@example.org"
+    assert is_valid_email("ann at example dot org")
+    assert not is_valid_email("ann at example")
+    assert normalize_phone("five five five one two three four five six seven") == "5551234567"
+    assert normalize_phone("12") is None
+    assert SlotFiller.email_was_spoken("ann@example.org", "ann at example dot org")
+    assert not SlotFiller.email_was_spoken("ann@example.org", "it's ann@example.org")
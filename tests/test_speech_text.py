@@ -0,0 +1,40 @@
+from chatbot.speech_text import CODE, SPEECH, SpeechStream, normalize_for_speech, speech_segments, verbalize
+
+
+def test_markdown_is_not_read_out():
+    assert speech_segments("# Title\n\nUse **bold** and see [docs](https://example.com/a).") == [
+        (SPEECH, "Title"), (SPEECH, "Use bold and see docs.")]
+
+
+def test_amounts_percentages_versions_and_abbreviations_are_spoken():
+    text, _ = normalize_for_speech("Costs $5k or 10% for v1.2.3, e.g. now.")
+    assert text == "Costs 5 thousand dollars or 10 percent for 1 point 2 point 3, for example now."
+
+
+def test_emails_and_urls_are_spelled_out():
+    text, _ = normalize_for_speech("Email bob@example.com or visit www.example.com.")
+    assert text == "Email bob at example dot com or visit example dot com."
+    assert verbalize("plain") == "plain"
+
+
+def test_code_blocks_are_separate_segments():
+    assert speech_segments("Run:\n```python\nprint(1)\n```\nDone.") == [
+        (SPEECH, "Run:"), (CODE, "print(1)"), (SPEECH, "Done.")]
+
+
+def test_short_inline_code_is_spoken():
+    assert speech_segments("Call `pip install x` now.") == [(SPEECH, "Call pip install x now.")]
+
+
+def test_stream_matches_whole_text():
+    deltas = ["Hello wor", "ld. How are", "  you?\n```\nx=1\n", "```\nBye"]
+
+    def generator():
+        yield from deltas
+        return False
+
+    stream = SpeechStream(generator())
+    assert list(stream) == [(SPEECH, "Hello world."), (SPEECH, "How are you?"), (CODE, "x=1"), (SPEECH, "Bye")]
+    assert stream.text == "".join(deltas)
+    assert stream.result is False
+    assert list(SpeechStream(deltas)) == speech_segments("".join(deltas))
@@ -0,0 +1,162 @@
+import threading
+
+import pytest
+
+import voice_input_chatbot
+from chatbot.startup import Startup, Warmup
+
+
+class FakeHandler:
+    def __init__(self, preconnect_error=None):
+        self.preconnect_error = preconnect_error
+        self.preconnected = threading.Event()
+        self.in_tool_flow = False
+
+    def preconnect(self):
+        self.preconnected.set()
+        if self.preconnect_error:
+            raise self.preconnect_error
+
+    def fixed_prompts(self):
+        return ["Please tell me your email address."]
+
+
+class FakeTTS:
+    def __init__(self):
+        self.spoken = []
+        self.prewarmed = []
+        self.greeted = threading.Event()
+
+    def enqueue(self, text):
+        self.spoken.append(text)
+        self.greeted.set()
+
+    def prewarm(self, phrases):
+        self.prewarmed.extend(phrases)
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    """voice_input_chatbot with stub factories; its globals are restored afterwards."""
+    for name in ("chatbot", "tts", "asr", "router", "context", "wake_word_gate", "microphone"):
+        monkeypatch.setattr(voice_input_chatbot, name, None)
+    handler = FakeHandler()
+    monkeypatch.setattr(voice_input_chatbot, "create_chatbot", lambda api_key, api_url=None: handler)
+    monkeypatch.setattr(voice_input_chatbot, "create_asr", lambda backend: f"{backend} asr")
+    monkeypatch.setattr(voice_input_chatbot, "create_wake_word_gate",
+                        lambda calling_name, backend, asr: ("gate", calling_name, asr))
+    monkeypatch.setattr(voice_input_chatbot, "create_microphone", lambda: "microphone")
+    return voice_input_chatbot
+
+
+def test_warmup_builds_in_background_or_inline():
+    background = Warmup("component", lambda: threading.current_thread().name)
+    inline = Warmup("component", lambda: threading.current_thread().name, background=False)
+
+    assert background.result(5) == "startup-component"
+    assert inline.done.is_set()
+    assert inline.result() == threading.current_thread().name
+    assert background.seconds is not None and inline.seconds is not None
+
+
+def test_warmup_reraises_factory_error_and_times_out():
+    def fail():
+        raise OSError("no audio device")
+
+    failed = Warmup("microphone", fail)
+    for _ in range(2):
+        with pytest.raises(OSError, match="no audio device"):
+            failed.result(5)
+
+    release = threading.Event()
+    slow = Warmup("slow", release.wait)
+    with pytest.raises(TimeoutError, match="slow was not ready within 0.01 seconds"):
+        slow.result(0.01)
+    release.set()
+    assert slow.result(5) is True
+
+
+def test_components_overlap_in_background_and_run_in_order_when_eager():
+    # Each component waits for the other, which only finishes if they are built at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    startup = Startup()
+    startup.start("first", barrier.wait)
+    startup.start("second", barrier.wait)
+    assert {startup.get("first", 5), startup.get("second", 5)} == {0, 1}
+
+    order = []
+    eager = Startup(background=False)
+    eager.start("first", lambda: order.append("first"))
+    eager.start("second", lambda: order.append("second"))
+    assert order == ["first", "second"]
+    eager.mark("ready")
+    timings = eager.timings()
+    assert set(timings["components"]) == {"first", "second"}
+    assert timings["milestones"]["ready"] >= 0
+
+
+def test_start_up_greets_before_the_handler_is_ready(bot, monkeypatch):
+    handler_ready = threading.Event()
+    handler = FakeHandler()
+
+    def create_chatbot(api_key, api_url=None):
+        handler_ready.wait(5)
+        return handler
+
+    monkeypatch.setattr(bot, "create_chatbot", create_chatbot)
+    tts = FakeTTS()
+
+    def create_tts():
+        return tts
+
+    starting = threading.Thread(target=bot.start_up, args=(Startup(), "key"),
+                                kwargs={"calling_name": "Jarvis", "tts_factory": create_tts})
+    starting.start()
+    # The greeting is queued while the handler is still being built
+    assert tts.greeted.wait(5)
+    assert tts.spoken == [bot.GREETING]
+    assert bot.chatbot is None
+    handler_ready.set()
+    starting.join(5)
+
+    assert bot.chatbot is handler
+    assert handler.preconnected.wait(5)
+    assert tts.prewarmed == bot.FIXED_PHRASES + handler.fixed_prompts()
+    assert bot.asr == "google asr"
+    assert bot.wake_word_gate == ("gate", "Jarvis", "google asr")
+    assert bot.microphone == "microphone"
+    assert bot.context.chatbot is handler and bot.context.tts is tts
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_start_up_records_milestones_without_optional_components(bot, background):
+    startup = Startup(background=background)
+    bot.start_up(startup, "key", asr_backend="none", tts_factory=None, open_microphone=False)
+
+    assert set(startup.components) == {"chatbot", "preconnect"}
+    assert startup.milestones["greeting"] <= startup.milestones["ready"]
+    assert bot.tts is None and bot.asr is None and bot.microphone is None
+    assert bot.router is not None
+
+
+def test_start_up_raises_component_errors_after_greeting(bot, monkeypatch):
+    def create_asr(backend):
+        raise RuntimeError("vosk model missing")
+
+    monkeypatch.setattr(bot, "create_asr", create_asr)
+    tts = FakeTTS()
+    with pytest.raises(RuntimeError, match="vosk model missing"):
+        bot.start_up(Startup(), "key", asr_backend="vosk", tts_factory=lambda: tts)
+    assert tts.spoken == [bot.GREETING]
+
+
+def test_failed_preconnect_does_not_hold_up_startup(bot, monkeypatch):
+    handler = FakeHandler(preconnect_error=ConnectionError("offline"))
+    monkeypatch.setattr(bot, "create_chatbot", lambda api_key, api_url=None: handler)
+    startup = Startup()
+    bot.start_up(startup, "key", tts_factory=None, open_microphone=False)
+
+    assert "ready" in startup.milestones
+    preconnect = startup.components["preconnect"]
+    assert preconnect.done.wait(5)
+    assert isinstance(preconnect.error, ConnectionError)
@@ -0,0 +1,131 @@
+import json
+
+import pytest
+
+from benchmarks.mock_openai import DEFAULT_REPLY, MockOpenAIServer
+from chatbot.openai_handler import OpenAIHandler
+from chatbot.streaming import SSEDecoder, SentenceStream, StreamAccumulator, iter_sse_data, iter_sse_json, split_sentences
+from chatbot.tools import ToolRegistry
+
+
+def event(delta, finish_reason=None):
+    return "data: " + json.dumps({"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+
+def test_sse_events_end_at_blank_lines_and_done():
+    lines = [": keep-alive", "data: first", "", "data: second", "data: line", "", "data: [DONE]", "", "data: after"]
+    assert list(iter_sse_data(lines)) == ["first", "second\nline"]
+
+
+def test_sse_decoder_accepts_bytes_and_crlf():
+    decoder = SSEDecoder()
+    assert decoder.feed_line(b"data:{}\r\n") is None
+    assert decoder.feed_line(b"\r\n") == "{}"
+    assert decoder.feed_line("data: [DONE]") is None
+    decoder.flush()
+    assert decoder.done
+
+
+def test_accumulator_collects_text_and_parallel_tool_calls():
+    lines = [
+        event({"role": "assistant", "content": "Checking"}), "",
+        event({"content": " now."}), "",
+        event({"tool_calls": [{"index": 1, "id": "call_b", "function": {"name": "Weather", "arguments": "{\"city\""}}]}), "",
+        event({"tool_calls": [{"index": 0, "id": "call_a", "function": {"name": "Time", "arguments": ""}}]}), "",
+        event({"tool_calls": [{"index": 1, "function": {"arguments": ": \"Oslo\"}"}}]}), "",
+        event({}, "tool_calls"), "",
+        "data: [DONE]", "",
+    ]
+    accumulator = StreamAccumulator()
+    deltas = [accumulator.add_chunk(chunk) for chunk in iter_sse_json(lines)]
+    assert "".join(deltas) == "Checking now."
+    assert accumulator.has_function_call
+    assert accumulator.finish_reason == "tool_calls"
+    message = accumulator.message()
+    assert message["content"] == "Checking now."
+    assert [(call["id"], call["function"]["name"], call["function"]["arguments"]) for call in message["tool_calls"]] == [
+        ("call_a", "Time", "{}"),
+        ("call_b", "Weather", "{\"city\": \"Oslo\"}"),
+    ]
+
+
+def test_accumulator_legacy_function_call():
+    accumulator = StreamAccumulator()
+    accumulator.add_chunk({"choices": [{"delta": {"function_call": {"name": "CreateTicket", "arguments": "{\"na"}}}]})
+    accumulator.add_chunk({"choices": [{"delta": {"function_call": {"arguments": "me\": \"Bob\"}"}}}]})
+    assert accumulator.message()["function_call"] == {"name": "CreateTicket", "arguments": "{\"name\": \"Bob\"}"}
+
+
+def test_sentences_are_yielded_as_soon_as_they_end():
+    def deltas():
+        yield "Hello wor"
+        yield "ld. How are"
+        yield " you? Fine"
+        return True
+
+    stream = SentenceStream(deltas())
+    assert list(stream) == ["Hello world.", "How are you?", "Fine"]
+    assert stream.text == "Hello world. How are you? Fine"
+    assert stream.result is True
+
+
+def test_code_blocks_are_not_split():
+    sentences, rest = split_sentences("Run this:\n```\nx = 1. y = 2.\n```\nThen ")
+    assert sentences == ["Run this:", "```\nx = 1. y = 2.\n```"]
+    assert rest == "Then "
+
+
+def weather_registry(calls):
+    registry = ToolRegistry()
+
+    @registry.tool()
+    def Weather(city: str, unit: str = "celsius") -> str:
+        """Current weather for a city."""
+        calls.append((city, unit))
+        return f"Sunny in {city}"
+
+    return registry
+
+
+@pytest.fixture
+def weather_server():
+    arguments = {"city": "Oslo", "unit": "fahrenheit"}
+    with MockOpenAIServer(latency=0.0, jitter=0.0, tokens_per_second=2000, function_trigger=r"\bweather\b",
+                          function_name="Weather", function_arguments=arguments) as server:
+        yield server
+
+
+@pytest.mark.parametrize("tool_format", ["tools", "functions"])
+def test_tool_call_arguments_streamed_in_fragments_are_accumulated(weather_server, tool_format):
+    handler = OpenAIHandler(api_key="test", api_url=weather_server.url, finish_check="none", timeout=5,
+                            tools=weather_registry([]), tool_format=tool_format)
+    handler.conversation_history.append({"role": "user", "content": "what's the weather in oslo?"})
+    chunks = list(handler._stream_gpt_request(handler._build_chat_data(stream=True)))
+    # The call's header, then the arguments over several events
+    assert len(chunks) > 3
+
+    accumulator = StreamAccumulator()
+    assert "".join(accumulator.add_chunk(chunk) for chunk in chunks) == ""
+    assert accumulator.has_function_call
+    message = accumulator.message()
+    if tool_format == "tools":
+        (call,) = message["tool_calls"]
+        assert call["id"].startswith("call_") and call["function"]["name"] == "Weather"
+        arguments = call["function"]["arguments"]
+    else:
+        assert message["function_call"]["name"] == "Weather"
+        arguments = message["function_call"]["arguments"]
+    assert json.loads(arguments) == {"city": "Oslo", "unit": "fahrenheit"}
+
+
+def test_streamed_reply_runs_the_tool_and_streams_the_follow_up(weather_server):
+    calls = []
+    handler = OpenAIHandler(api_key="test", api_url=weather_server.url, finish_check="none", timeout=5,
+                            tools=weather_registry(calls))
+    deltas = list(handler.generate_response_stream("what's the weather in oslo?"))
+    assert calls == [("Oslo", "fahrenheit")]
+    # The follow-up to the tool result streams word by word
+    assert len(deltas) > 1 and "".join(deltas) == DEFAULT_REPLY
+    roles = [message["role"] for message in handler.conversation_history]
+    assert roles == ["user", "assistant", "tool", "assistant"]
+    assert weather_server.stats() == {"requests": 2, "rate_limited": 0, "function_calls": 1}
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pytest
+
+from chatbot.openai_handler import DEFERRED_TOOL_RESULT, OpenAIHandler
+from chatbot.tools import ToolCall, ToolRegistry, tool_calls_of, tool_result_messages
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        yield executor
+
+
+def test_decorator_builds_the_schema_from_signature_and_docstring():
+    registry = ToolRegistry()
+
+    @registry.tool()
+    def Lookup(order_id: int, tags: List[str], verbose: bool = False, note: Optional[str] = None,
+               extra: Dict[str, str] = None) -> dict:
+        """
+        Look up an order.
+
+        Parameters:
+            order_id (int): The order number
+            tags (list): Labels to filter by
+        Returns:
+            verbose: not a parameter description
+        """
+
+    assert registry.get("Lookup").schema == {
+        "name": "Lookup",
+        "description": "Look up an order.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "order_id": {"type": "integer", "description": "The order number"},
+                "tags": {"type": "array", "items": {"type": "string"}, "description": "Labels to filter by"},
+                "verbose": {"type": "boolean"},
+                "note": {"type": "string"},
+                "extra": {"type": "object"},
+            },
+            "required": ["order_id", "tags"],
+        },
+    }
+    # The decorated function is returned unchanged
+    assert Lookup.__name__ == "Lookup"
+
+
+def test_schema_lists_are_rebuilt_only_on_register():
+    registry = ToolRegistry()
+    registry.tool(name="first", description="First tool")(lambda: None)
+    schemas = registry.tool_schemas
+    assert registry.tool_schemas is schemas
+    assert schemas == [{"type": "function", "function": registry.functions[0]}]
+    assert registry.functions[0]["description"] == "First tool"
+    registry.tool(name="second")(lambda: None)
+    assert registry.tool_schemas is not schemas
+    assert [schema["name"] for schema in registry.functions] == ["first", "second"]
+
+
+def sleeping_registry():
+    registry = ToolRegistry()
+
+    @registry.tool()
+    def Sleep(seconds: float, label: str) -> str:
+        time.sleep(seconds)
+        return label
+
+    @registry.tool(timeout=0.05)
+    def Slow() -> str:
+        time.sleep(0.3)
+        return "too late"
+
+    @registry.tool()
+    def Fail() -> str:
+        raise RuntimeError("out of paper")
+
+    @registry.tool()
+    async def Later(seconds: float) -> Dict[str, float]:
+        await asyncio.sleep(seconds)
+        return {"waited": seconds}
+
+    return registry
+
+
+def call(function_name, call_id=None, **arguments):
+    return ToolCall(call_id, function_name, json.dumps(arguments))
+
+
+def test_calls_run_concurrently_and_keep_their_order(executor):
+    registry = sleeping_registry()
+    calls = [call("Sleep", seconds=0.2, label=label) for label in "abc"]
+    started = time.monotonic()
+    results = registry.execute(calls, executor)
+    assert time.monotonic() - started < 0.45
+    assert [result.content for result in results] == ["a", "b", "c"]
+    assert not any(result.error for result in results)
+
+
+def test_timeouts_failures_and_unknown_tools_become_error_results(executor):
+    registry = sleeping_registry()
+    results = registry.execute([call("Slow"), call("Fail"), call("Missing"), call("Sleep", seconds=0, label="ok")],
+                               executor)
+    assert [(result.content, result.error) for result in results] == [
+        ("Tool 'Slow' timed out.", True),
+        ("Tool 'Fail' failed: out of paper", True),
+        ("Unknown tool 'Missing'.", True),
+        ("ok", False),
+    ]
+
+
+def test_async_execution(executor):
+    registry = sleeping_registry()
+    calls = [call("Later", seconds=0.2), call("Sleep", seconds=0.2, label="sync"), call("Slow")]
+
+    async def main():
+        started = time.monotonic()
+        results = await registry.execute_async(calls, executor)
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(main())
+    assert elapsed < 0.45
+    assert [result.content for result in results] == ['{"waited": 0.2}', "sync", "Tool 'Slow' timed out."]
+
+
+def tool_call(call_id, function_name, **arguments):
+    return {"id": call_id, "type": "function", "function": {"name": function_name, "arguments": json.dumps(arguments)}}
+
+
+def test_result_messages_answer_every_call():
+    message = {"role": "assistant", "content": None,
+               "tool_calls": [tool_call("call_1", "Sleep", seconds=0, label="a"), tool_call("call_2", "Fail")]}
+    results = sleeping_registry().execute(tool_calls_of(message), ThreadPoolExecutor(max_workers=2))
+    messages = tool_result_messages(message, results)
+    assert messages[0] == {"role": "assistant", "content": None, "tool_calls": message["tool_calls"]}
+    assert [(m["role"], m["tool_call_id"]) for m in messages[1:]] == [("tool", "call_1"), ("tool", "call_2")]
+    legacy = {"role": "assistant", "content": None, "function_call": {"name": "Fail", "arguments": "{}"}}
+    results = sleeping_registry().execute(tool_calls_of(legacy), ThreadPoolExecutor(max_workers=1))
+    assert tool_result_messages(legacy, results)[1] == {"role": "function", "name": "Fail",
+                                                        "content": "Tool 'Fail' failed: out of paper"}
+
+
+def handler_with(registry, replies, **options):
+    """An OpenAIHandler whose requests are answered with `replies` in order, without a network."""
+    handler = OpenAIHandler(api_key="test", finish_check="none", tools=registry, **options)
+    requests = []
+
+    def make_gpt_request(data):
+        requests.append(data)
+        return {"choices": [{"message": replies.pop(0)}]}
+
+    handler._make_gpt_request = make_gpt_request
+    return handler, requests
+
+
+def ticket_registry():
+    registry = ToolRegistry()
+    created = []
+
+    @registry.tool()
+    def Weather(city: str) -> str:
+        return f"Sunny in {city}"
+
+    @registry.tool(interactive=True, reply=lambda ticket: f"Ticket {ticket['id']} created.")
+    def OpenTicket(name: str, issue: str) -> dict:
+        created.append((name, issue))
+        return {"id": len(created)}
+
+    return registry, created
+
+
+def test_mixed_calls_answer_every_tool_call_id():
+    registry, _ = ticket_registry()
+    reply = {"role": "assistant", "content": None,
+             "tool_calls": [tool_call("call_w", "Weather", city="Oslo"), tool_call("call_t", "OpenTicket")]}
+    handler, requests = handler_with(registry, [reply])
+    text, _ = handler.generate_response("What's the weather in Oslo? Also open a ticket.")
+    assert "name" in text and "issue" in text
+    history = list(handler.conversation_history)
+    results = {m["tool_call_id"]: m["content"] for m in history if m["role"] == "tool"}
+    assert results == {"call_w": "Sunny in Oslo", "call_t": DEFERRED_TOOL_RESULT}
+    # The interactive call is collected from the user instead of a second request
+    assert len(requests) == 1
+    assert "OpenTicket" in handler.pending_function_calls
+
+
+def test_local_tool_run_keeps_the_conversation():
+    registry, _ = ticket_registry()
+    replies = [{"role": "assistant", "content": None, "tool_calls": [tool_call("call_w", "Weather", city="Oslo")]}]
+    handler, _ = handler_with(registry, replies, max_tool_rounds=0)
+    text, _ = handler.generate_response("Weather in Oslo?")
+    assert text == "Sunny in Oslo"
+    # Out of tool rounds, the handler ran the tool itself and only added its result
+    assert [m["role"] for m in handler.conversation_history] == ["user", "assistant"]
+
+
+def test_interactive_flow_resets_the_conversation_when_done():
+    registry, created = ticket_registry()
+    replies = [{"role": "assistant", "content": None,
+                "tool_calls": [tool_call("call_t", "OpenTicket", name="Bob", issue="broken printer")]}]
+    handler, _ = handler_with(registry, replies)
+    text, _ = handler.generate_response("Open a ticket for Bob, the printer is broken")
+    assert text == "Ticket 1 created."
+    assert created == [("Bob", "broken printer")]
+    assert len(handler.conversation_history) == 0
@@ -0,0 +1,110 @@
+import contextvars
+import json
+import re
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from chatbot.tracing import NULL_SPAN, Histogram, Tracer, current_trace_id
+
+# name{labels} value, as in the Prometheus text exposition format
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(?:\{(?:[a-zA-Z_]\w*="[^"]*",?)*\})? \S+$')
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram((0.1, 0.5, 1.0))
+    for value in [0.05, 0.1, 0.2, 0.5, 0.7, 3.0]:
+        histogram.observe(value)
+    # A value equal to a bound belongs to that bucket (Prometheus "le"); the last count is +Inf
+    assert histogram.counts == [2, 2, 1, 1]
+    assert histogram.count == 6 and histogram.sum == pytest.approx(4.55)
+    assert histogram.quantile(0.3) == 0.1
+    assert histogram.quantile(0.5) == 0.5
+    assert histogram.quantile(0.8) == 1.0
+    assert histogram.quantile(1.0) == float("inf")
+    assert Histogram().quantile(0.5) is None
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    assert tracer.span("asr") is NULL_SPAN
+    with tracer.span("asr") as span:
+        span.set(backend="google")
+    tracer.record("asr", 1.0)
+    tracer.count("retries")
+    with tracer.turn() as trace_id:
+        assert trace_id is None
+    assert tracer.stats() == {} and tracer.counters == {}
+
+
+def test_jsonl_export_carries_the_turn_trace_id_into_worker_threads(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(enabled=True, jsonl_path=str(path), buckets=(0.1, 1.0))
+    with tracer.turn("turn-1") as trace_id:
+        assert trace_id == current_trace_id() == "turn-1"
+        with tracer.span("intent") as span:
+            span.set(intent="time")
+        # Work handed to a thread keeps the turn when run in a copy of the context
+        worker = threading.Thread(target=contextvars.copy_context().run,
+                                  args=(tracer.record, "tts_playback", 0.5), kwargs={"presynthesized": True})
+        worker.start()
+        worker.join()
+        with pytest.raises(ValueError):
+            with tracer.span("tool", tool="Weather"):
+                raise ValueError("bad")
+    tracer.record("asr", 2.0, trace_id="explicit")
+    tracer.record("capture", 0.2)
+    tracer.close()
+
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(e["stage"], e["trace_id"]) for e in entries] == [
+        ("intent", "turn-1"), ("tts_playback", "turn-1"), ("tool", "turn-1"), ("asr", "explicit"), ("capture", None)]
+    assert entries[0]["intent"] == "time" and entries[1]["presynthesized"] is True
+    assert entries[2]["error"] == "ValueError" and entries[2]["tool"] == "Weather"
+    assert entries[3]["seconds"] == 2.0 and all("time" in e for e in entries)
+    stats = tracer.stats()
+    assert stats["asr"] == {"count": 1, "mean": 2.0, "p50": float("inf"), "p95": float("inf")}
+    assert stats["tts_playback"]["p50"] == 1.0
+
+
+def test_prometheus_text_format():
+    tracer = Tracer(enabled=True, buckets=(0.1, 1.0))
+    tracer.record("asr", 0.05)
+    tracer.record("asr", 0.5)
+    tracer.record("llm_request", 3.0)
+    tracer.count("llm_request_errors")
+    tracer.count("llm_request_errors", 2)
+    text = tracer.prometheus_text()
+    lines = text.splitlines()
+    assert text.endswith("\n")
+    assert lines[:2] == ["# HELP voice_bot_stage_seconds Time spent in each stage of a turn.",
+                         "# TYPE voice_bot_stage_seconds histogram"]
+    assert lines[2:7] == [
+        'voice_bot_stage_seconds_bucket{stage="asr",le="0.1"} 1',
+        'voice_bot_stage_seconds_bucket{stage="asr",le="1.0"} 2',
+        'voice_bot_stage_seconds_bucket{stage="asr",le="+Inf"} 2',
+        'voice_bot_stage_seconds_sum{stage="asr"} 0.55',
+        'voice_bot_stage_seconds_count{stage="asr"} 2',
+    ]
+    assert 'voice_bot_stage_seconds_bucket{stage="llm_request",le="1.0"} 0' in lines
+    assert 'voice_bot_stage_seconds_bucket{stage="llm_request",le="+Inf"} 1' in lines
+    assert lines[-2:] == ["# TYPE voice_bot_llm_request_errors_total counter", "voice_bot_llm_request_errors_total 3"]
+    assert all(SAMPLE_LINE.match(line) for line in lines if not line.startswith("#"))
+
+
+def test_metrics_are_served_over_http():
+    tracer = Tracer(enabled=True)
+    tracer.record("asr", 0.3)
+    server = tracer.serve_prometheus(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert response.read().decode("utf-8") == tracer.prometheus_text()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other", timeout=5)
+    finally:
+        tracer.close()
+    assert not tracer.enabled
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+import wave
+
+from chatbot.tts import TTS, AudioCache
+
+
+def write_wav(path, frames=1600):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(bytes(frames * 2))
+
+
+class FakeEngine:
+    """Stands in for a pyttsx3 engine: renders silent WAV files (or AIFF-like bytes) and records speech."""
+
+    def __init__(self, wav=True):
+        self.wav = wav
+        self.properties = {}
+        self.rendered = []
+        self.spoken = []
+        self.to_render = []
+        self.to_say = []
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def connect(self, topic, callback):
+        pass
+
+    def save_to_file(self, text, path):
+        self.to_render.append((text, path))
+
+    def say(self, text):
+        self.to_say.append(text)
+
+    def runAndWait(self):
+        for text, path in self.to_render:
+            if self.wav:
+                write_wav(path)
+            else:
+                with open(path, "wb") as f:
+                    f.write(b"FORM\0\0\0\0AIFF")
+            self.rendered.append(text)
+        self.spoken.extend(self.to_say)
+        self.to_render, self.to_say = [], []
+
+    def stop(self):
+        pass
+
+
+class FakeTTS(TTS):
+    def __init__(self, engine, **options):
+        self.fake_engine = engine
+        super().__init__(**options)
+
+    def _init_engine(self):
+        return self.fake_engine
+
+
+class Player:
+    """An audio sink that records what it plays; `gate` holds playback until set."""
+
+    def __init__(self, tts_ref=None):
+        self.played = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.tts = tts_ref
+        self.pending_seen = []
+
+    def __call__(self, path):
+        self.gate.wait(timeout=5)
+        assert os.path.exists(path)
+        if self.tts is not None:
+            self.pending_seen.append(self.tts.pending)
+        self.played.append(path)
+
+
+def test_next_sentence_is_synthesized_while_the_previous_one_plays():
+    engine, player = FakeEngine(), Player()
+    player.gate.clear()
+    tts = FakeTTS(engine, audio_sink=player)
+    player.tts = tts
+    for sentence in ["One.", "Two.", "Three."]:
+        assert tts.enqueue(sentence)
+    assert tts.is_speaking
+    # "One." is held at the sink; "Two." is rendered and waiting for it
+    deadline = time.monotonic() + 5
+    while len(engine.rendered) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert engine.rendered[:2] == ["One.", "Two."] and player.played == []
+    player.gate.set()
+    assert tts.flush().wait(timeout=5)
+    assert engine.rendered == ["One.", "Two.", "Three."] and len(player.played) == 3
+    # Every utterance was still counted while it played, and temporary files are removed
+    assert all(pending >= 1 for pending in player.pending_seen)
+    assert tts.pending == 0 and not tts.is_speaking
+    assert not any(os.path.exists(path) for path in player.played)
+    tts.close()
+
+
+def test_cancel_drops_queued_utterances():
+    engine, player = FakeEngine(), Player()
+    player.gate.clear()
+    tts = FakeTTS(engine, audio_sink=player)
+    for sentence in ["One.", "Two.", "Three.", "Four."]:
+        tts.enqueue(sentence)
+    tts.cancel()
+    player.gate.set()
+    assert tts.flush().wait(timeout=5)
+    assert len(player.played) <= 1 and tts.pending == 0
+    tts.enqueue("Five.")
+    assert tts.flush().wait(timeout=5)
+    assert engine.rendered[-1] == "Five."
+    tts.close()
+
+
+def test_full_queue_rejects_text_without_counting_it():
+    engine, player = FakeEngine(), Player()
+    player.gate.clear()
+    tts = FakeTTS(engine, audio_sink=player, queue_size=1)
+    accepted = [tts.enqueue(f"Sentence {index}.") for index in range(8)]
+    assert not all(accepted)
+    assert tts.pending == accepted.count(True)
+    player.gate.set()
+    assert tts.flush().wait(timeout=5)
+    assert tts.pending == 0
+    tts.close()
+
+
+def test_repeated_and_prewarmed_phrases_play_from_the_cache(tmp_path):
+    engine, player = FakeEngine(), Player()
+    tts = FakeTTS(engine, audio_sink=player, cache_dir=str(tmp_path))
+    for _ in range(3):
+        tts.speak("Conversation cleared.", timeout=5)
+    # Rendered twice, admitted on the second synthesis, then played from disk
+    assert engine.rendered == ["Conversation cleared.", "Conversation cleared."]
+    assert player.played[1] == player.played[2] and player.played[2].startswith(str(tmp_path))
+    assert tts.audio_cache.stats()["hits"] == 1
+
+    tts.prewarm(["Okay. Goodbye."])
+    deadline = time.monotonic() + 5
+    while len(tts.audio_cache.entries) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    tts.speak("Goodbye.", timeout=5)
+    assert engine.rendered.count("Goodbye.") == 1
+    assert len(player.played) == 4 and os.path.exists(player.played[-1])
+    tts.close()
+
+
+def test_engine_without_wav_output_speaks_directly(tmp_path):
+    engine, player = FakeEngine(wav=False), Player()
+    tts = FakeTTS(engine, audio_sink=player, cache_dir=str(tmp_path))
+    tts.speak("Hello there.", timeout=5)
+    tts.speak("Still here.", timeout=5)
+    assert tts.direct_speech
+    assert engine.spoken == ["Hello there.", "Still here."]
+    # Only the first sentence was rendered, to find out
+    assert engine.rendered == ["Hello there."] and player.played == []
+    assert tts.pending == 0 and tts.recent_text == "Hello there. Still here."
+    tts.close()
+
+
+def test_audio_cache_admits_on_the_second_synthesis_and_evicts_the_least_recently_played(tmp_path):
+    source = str(tmp_path / "source.wav")
+    write_wav(source)
+    size = os.path.getsize(source)
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=2 * size)
+    keys = [AudioCache.key(text, None, 150, 1.0) for text in ["a", "b", "c"]]
+    assert keys[0] != AudioCache.key("a", None, 175, 1.0)
+
+    assert not cache.should_admit(keys[0])
+    assert cache.should_admit(keys[0])
+    cache.store(keys[0], source)
+    cache.store(keys[1], source)
+    assert cache.get(keys[0]) == cache.path(keys[0])
+    # "b" is now the least recently played
+    cache.store(keys[2], source)
+    assert keys[1] not in cache and not os.path.exists(cache.path(keys[1]))
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 2, "bytes": 2 * size}
+    assert cache.get(keys[1]) is None and cache.misses == 1
+
+    # A file removed behind the cache's back is forgotten
+    os.remove(cache.path(keys[2]))
+    assert cache.get(keys[2]) is None and keys[2] not in cache
+
+
+def test_audio_cache_reloads_in_least_recently_played_order(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    for age, key in enumerate(["newest", "middle", "oldest"]):
+        path = str(directory / f"{key}.wav")
+        write_wav(path)
+        os.utime(path, (time.time() - 100 * age, time.time() - 100 * age))
+    size = os.path.getsize(str(directory / "newest.wav"))
+    cache = AudioCache(str(directory), max_bytes=2 * size)
+    assert list(cache.entries) == ["middle", "newest"]
+    assert not (directory / "oldest.wav").exists()
+
+    cache = AudioCache(str(directory), admit_after=3, max_tracked=1)
+    assert not cache.should_admit("x") and not cache.should_admit("y")
+    # "x" was forgotten when "y" was tracked
+    assert not cache.should_admit("x")
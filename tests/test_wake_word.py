@@ -0,0 +1,97 @@
+import math
+import wave
+from array import array
+
+from chatbot.capture import SAMPLE_RATE, SAMPLE_WIDTH, EnergyVAD, segment_wav
+from chatbot.wake_word import KeywordSpotter, WakeWordGate
+
+
+def write_wav(path, *parts):
+    """Silence and tone parts, (seconds, amplitude), as a 16-bit mono WAV."""
+    samples = array("h")
+    for seconds, amplitude in parts:
+        samples.extend(int(amplitude * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE))
+                       for i in range(int(seconds * SAMPLE_RATE)))
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+    return str(path)
+
+
+class FinalOnlyStream:
+    """Hears the calling name only in its final result, like Vosk on a short name."""
+
+    def __init__(self, text, words):
+        self.text = text
+        self.words_at_end = words
+        self.frames = 0
+
+    def feed(self, frame):
+        self.frames += 1
+        return None
+
+    def finish(self):
+        if self.words_at_end is not None:
+            self.words = self.words_at_end
+        return self.text
+
+
+class FakeBackend:
+    streaming = True
+
+    def __init__(self, text, words=None):
+        self.text = text
+        self.words = words
+        self.streams = []
+
+    def start_stream(self, sample_rate):
+        self.streams.append(FinalOnlyStream(self.text, self.words))
+        return self.streams[-1]
+
+
+def run_gate(tmp_path, backend):
+    path = write_wav(tmp_path / "speech.wav", (0.5, 0), (1.5, 8000), (1.0, 0))
+    gate = WakeWordGate(KeywordSpotter(backend, "jarvis"))
+    utterances = segment_wav(path, vad=EnergyVAD(), listeners=[gate])
+    assert len(utterances) == 1
+    return gate, utterances[0]
+
+
+def test_command_in_the_same_breath_is_cut_after_the_name(tmp_path):
+    words = [("jarvis", 0.3, 0.66), ("open", 0.8, 1.0), ("a", 1.0, 1.05), ("ticket", 1.1, 1.5)]
+    gate, utterance = run_gate(tmp_path, FakeBackend("jarvis open a ticket", words))
+    assert utterance.keyword_end == 0.66
+    command = gate.admit(utterance)
+    assert command is not None and not gate.is_armed
+    assert abs(command.started_at - (utterance.started_at + 0.66)) < 1e-6
+    assert abs(command.duration - (utterance.duration - 0.66)) < 1e-6
+    assert gate.accepted == 1
+
+
+def test_name_alone_arms_the_gate_for_the_next_utterance(tmp_path):
+    gate, utterance = run_gate(tmp_path, FakeBackend("jarvis", [("jarvis", 0.3, 1.7)]))
+    assert gate.admit(utterance) is None
+    assert gate.is_armed
+
+
+def test_without_word_timings_the_whole_utterance_is_passed_without_the_name(tmp_path):
+    gate, utterance = run_gate(tmp_path, FakeBackend("jarvis open a ticket"))
+    assert utterance.keyword_end == 0.0
+    utterance.transcript = "Jarvis, open a ticket"
+    command = gate.admit(utterance)
+    assert command.duration == utterance.duration
+    assert command.transcript == "open a ticket"
+
+    # The name and nothing else: wait for the command instead
+    gate, utterance = run_gate(tmp_path, FakeBackend("jarvis"))
+    utterance.transcript = "Jarvis."
+    assert gate.admit(utterance) is None and gate.is_armed
+
+
+def test_speech_without_the_name_is_rejected(tmp_path):
+    gate, utterance = run_gate(tmp_path, FakeBackend("open a ticket", [("open", 0.3, 0.6)]))
+    assert utterance.keyword_end is None
+    assert gate.admit(utterance) is None
+    assert gate.rejected == 1
@@ -1,93 +1,216 @@
-import re
-import speech_recognition
 import os
-import datetime
-
-from chatbot.openai_handler import OpenAIHandler
-from chatbot.tts import TTS
-
-# Initialize OpenAI API and TTS
-api_key = os.environ.get("openai_token")
-if not api_key:
-    raise Exception("OpenAI API key not found in environment variable 'openai_token'.")
-
-chatbot = OpenAIHandler(api_key=api_key, model="gpt-4o-mini")
-tts = TTS()
-
-speaking = False
-
-# Function to check offline responses (date/time)
-def offline_response(text):
-    # Get the current date
-    if text == "what date is it" or text == "what is the date":
-        date = datetime.datetime.now()
-        formatted_date = date.strftime("%A, %B %d, %Y")
-        return f"Today is {formatted_date}"
-    
-    # Get the current time
-    if text == "what time is it" or text == "what is the time":
-        time = datetime.datetime.now()
-        formatted_time = time.strftime("%I:%M %p")
-        return f"The current time is {formatted_time}"
-    
-    # Catch-all for unhandled offline responses
-    return ""
-
-# Function to speak and listen for stop command
-def speak_text(text):
-    global speaking
-    speaking = True
 
-    non_code_text, code_blocks = extract_code_and_text(text)
+from chatbot.intents import AssistantContext, default_router
+from chatbot.speech_text import CODE, SpeechStream, speech_segments
+from chatbot.startup import Startup
+from chatbot.tracing import TRACER, configure_from_environment
+
+# Phrases spoken verbatim; rendered into the audio cache in the background at startup
+GREETING = "Hello, how may I help you?"
+FIXED_PHRASES = [
+    GREETING,
+    "Conversation completed. Goodbye.",
+    "Yes?",
+    "Okay.",
+    "Conversation cleared.",
+    "Goodbye."
+]
+
+# Built by start_up
+chatbot = None
+tts = None
+asr = None
+router = None
+context = None
+wake_word_gate = None
+microphone = None
+
+# Each component is built by one of these factories, on its own thread at startup, so the heavy
+# imports (requests, pyttsx3, speech_recognition, vosk) and initializations run side by side
+def create_tts(cache_dir=None, audio_sink=None):
+    from chatbot.tts import DEFAULT_AUDIO_CACHE_DIR, TTS
+    return TTS(cache_dir=cache_dir or DEFAULT_AUDIO_CACHE_DIR, audio_sink=audio_sink)
+
+def create_chatbot(api_key, api_url=None):
+    from chatbot.openai_handler import OPENAI_CHAT_URL, OpenAIHandler
+    from chatbot.routing import default_routing_policy
+    from chatbot.session import session_store_from_environment
+
+    # Spoken turns get an output budget that fits them: short for "yes" or "thanks", longer for troubleshooting.
+    # With `session_db` set, the conversation (and a ticket in progress) is saved there and resumed after a restart.
+    return OpenAIHandler(api_key=api_key, model="gpt-4o-mini", api_url=api_url or OPENAI_CHAT_URL,
+                         routing_policy=default_routing_policy(model="gpt-4o-mini"),
+                         session_store=session_store_from_environment())
+
+# Speech recognition: "google" (default) or "vosk" for local recognition with streaming partials
+def create_asr(backend):
+    from chatbot.speech_recognizer import create_asr_backend
+    if backend == "vosk":
+        return create_asr_backend("vosk", model_path=os.environ.get("vosk_model", "model"))
+    return create_asr_backend(backend)
+
+# Optional calling name: when set, only speech that follows it is sent to speech recognition.
+# It is spotted locally with a Vosk model restricted to the calling name.
+def create_wake_word_gate(calling_name, backend, asr):
+    from chatbot.speech_recognizer import create_asr_backend
+    from chatbot.wake_word import KeywordSpotter, WakeWordGate
+
+    grammar = [calling_name.lower(), "[unk]"]
+    if backend == "vosk":
+        spotter_backend = asr.with_grammar(grammar)
+    else:
+        spotter_backend = create_asr_backend("vosk", model_path=os.environ.get("vosk_model", "model"), grammar=grammar)
+    return WakeWordGate(KeywordSpotter(spotter_backend, calling_name))
+
+def create_microphone():
+    from chatbot.capture import MicrophoneSource
+    return MicrophoneSource()
+
+# Build everything and greet the user as soon as speech output works. Components are built in
+# background threads unless `startup` was created with background=False (one after another, as
+# before). Returns once the bot is ready to listen; the milestones are in `startup.timings()`.
+def start_up(startup, api_key, asr_backend="google", calling_name=None, tts_factory=create_tts,
+             api_url=None, open_microphone=True):
+    global chatbot, tts, asr, router, context, wake_word_gate, microphone
 
-    # Print the code blocks to the console
-    if code_blocks:
-        print("\nCode output detected. I will not read it out loud, but here it is:\n")
-        for code_block in code_blocks:
-            print(f"{code_block.strip()}\n")
+    if tts_factory is not None:
+        startup.start("tts", tts_factory)
+    startup.start("chatbot", lambda: create_chatbot(api_key, api_url))
+    # Connect to the API host while the rest starts, so the first turn does not pay for the TLS handshake
+    startup.start("preconnect", lambda: startup.get("chatbot").preconnect())
+    if asr_backend != "none":
+        startup.start("asr", lambda: create_asr(asr_backend))
+        if calling_name:
+            startup.start("wake_word", lambda: create_wake_word_gate(calling_name, asr_backend, startup.get("asr")))
+    if open_microphone:
+        startup.start("microphone", create_microphone)
 
-    tts.speak(non_code_text)  # Using TTS from chatbot module
+    if tts_factory is not None:
+        tts = startup.get("tts")
+        tts.enqueue(GREETING)
+    startup.mark("greeting")
 
-    speaking = False
+    chatbot = startup.get("chatbot")
+    if tts is not None:
+        tts.prewarm(FIXED_PHRASES + chatbot.fixed_prompts())
 
-def extract_code_and_text(text):
-    code_blocks = re.findall(r'```(.*?)```', text, re.DOTALL)
-    non_code_text = re.sub(r'```(.*?)```', '', text, flags=re.DOTALL).strip()
-    return non_code_text, code_blocks
+    # Common requests (time, date, reset, stop, repeat, volume, rate) are answered locally
+    router = default_router()
+    context = AssistantContext(chatbot, tts)
+
+    if asr_backend != "none":
+        asr = startup.get("asr")
+        if calling_name:
+            wake_word_gate = startup.get("wake_word")
+    if open_microphone:
+        microphone = startup.get("microphone")
+    startup.mark("ready")
+
+# Queue one segment of a reply; returns while the audio plays. Code is printed, not read out loud.
+def speak_segment(kind, text):
+    if kind == CODE:
+        print(f"\nCode output detected. I will not read it out loud, but here it is:\n\n{text}\n")
+    else:
+        tts.enqueue(text)
+
+# Function to queue text for speaking, with markdown, links and code made fit to be heard
+def speak_text(text):
+    for kind, segment in speech_segments(text):
+        speak_segment(kind, segment)
 
 # Handle requests, either offline or via GPT
 def process_request(request_text):
-    # Offline input checks
-    response = offline_response(request_text)
-    if response:
-        speak_text(response)
+    # Local intents are answered without a model round trip
+    reply = router.handle(request_text, context)
+    if reply is not None:
+        if reply:
+            speak_text(reply)
+        if context.should_exit:
+            tts.flush().wait()
+            tts.speak("Goodbye.")
+            exit()
         return
-    
-    # GPT response using OpenAIHandler from chatbot module
-    response, finished = chatbot.generate_response(request_text)
-    if response:
-        print(f"GPT: {response}")
-        speak_text(response)
+
+    # GPT response using OpenAIHandler from chatbot module, spoken sentence by sentence
+    # while the rest of the reply is still streaming in
+    segments = SpeechStream(chatbot.generate_response_stream(request_text))
+    spoken = []
+    for kind, segment in segments:
+        if kind != CODE:
+            print(f"GPT: {segment}")
+            spoken.append(segment)
+        speak_segment(kind, segment)
+    context.last_answer = " ".join(spoken)
+    # The finish check ran in the background while the reply was spoken
+    finished = segments.result or chatbot.wait_finished()
     if finished:
+        tts.flush().wait()
         tts.speak("Conversation completed. Goodbye.")
         exit()
 
-# Main function to continuously listen for voice input
+# Show what a streaming recognizer has heard so far, while the user is still speaking
+def show_partial(text):
+    print(f"Hearing: {text}", end="\r", flush=True)
+
+# Main function to continuously listen for voice input. The microphone stays open, so
+# speech that starts while a reply is being generated or spoken is not lost.
 def record_question():
-    tts.speak("Hello, how may I help you?")
-    while True:
-        with speech_recognition.Microphone() as source:
-            recognizer = speech_recognition.Recognizer()
+    from chatbot.capture import AudioCapture
+    from chatbot.echo import EchoGuard
+    from chatbot.speech_recognizer import StreamingTranscriber, transcribe_utterance
+
+    # The greeting was queued at startup; let it finish before capturing
+    tts.flush().wait()
+    # The microphone also hears the bot: speech captured while it talks is checked before it can interrupt
+    echo_guard = EchoGuard(tts)
+    listeners = [echo_guard]
+    if asr.streaming:
+        listeners.append(StreamingTranscriber(asr, show_partial))
+    if wake_word_gate is not None:
+        listeners.append(wake_word_gate)
+    with AudioCapture(microphone, listeners=listeners) as capture:
+        print("Listening...")
+        for utterance in capture:
+            # Said the calling name: meant for the bot even while it is talking
+            addressed = utterance.keyword_end is not None
+            if wake_word_gate is not None:
+                was_armed = wake_word_gate.is_armed
+                utterance = wake_word_gate.admit(utterance)
+                if utterance is None:
+                    if wake_word_gate.is_armed and not was_armed:
+                        # Just the calling name: prompt for the question
+                        tts.enqueue("Yes?")
+                    continue
             try:
-                print("Listening...")
-                audio = recognizer.listen(source)
-                transcription = recognizer.recognize_google(audio)
-                print(f'You said: {transcription}')
-                process_request(transcription)
+                # Everything timed from here on carries this turn's trace id
+                with TRACER.turn():
+                    transcription = transcribe_utterance(asr, utterance)
+                    if not transcription:
+                        continue
+                    if not addressed and echo_guard.is_echo(utterance, transcription):
+                        continue
+                    print(f'You said: {transcription}')
+                    # The user spoke over the bot: stop the current answer
+                    if tts.is_speaking:
+                        tts.cancel()
+                    process_request(transcription)
             except Exception as e:
                 print(f'An error occurred: {e}')
                 continue
 
 if __name__ == "__main__":
+    # Per-stage timings, exported when `trace_file` (JSONL) or `metrics_port` (Prometheus) is set
+    configure_from_environment()
+
+    api_key = os.environ.get("openai_token")
+    if not api_key:
+        raise Exception("OpenAI API key not found in environment variable 'openai_token'.")
+
+    # `startup_mode=eager` builds the components one after another instead of in the background
+    startup = Startup(background=os.environ.get("startup_mode", "background") != "eager")
+    start_up(startup, api_key, asr_backend=os.environ.get("asr_backend", "google"),
+             calling_name=os.environ.get("calling_name"))
+    print(f"Ready in {startup.milestones['ready']:.2f}s")
+
     # Start listening loop on startup
     record_question()